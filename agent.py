@@ -1,20 +1,49 @@
 import os
+import uuid
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
 from typing import TypedDict, Annotated, List
-from langchain_core.messages import BaseMessage, SystemMessage, ToolMessage
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage, ToolMessage
 from langchain_ollama.chat_models import ChatOllama
 from langgraph.graph import StateGraph, END
 from langgraph.checkpoint.memory import MemorySaver
+from core.checkpoint import BoundedSqliteSaver, add_messages_windowed
+from core.scheduler import generation_slot
+from generators.lifecycle import OLLAMA_LIFECYCLE, ollama_lifecycle
 
 # We import all the tools for the "brain" to use
-from tools import all_tools
+from tools import all_tools, find_user_names, get_system_stats
+from question_router import (
+    classify_question, requested_field, extract_field,
+    format_extracted_answer, format_stats_answer, answer_analytics,
+)
 from langchain_core.utils.function_calling import convert_to_openai_tool
+from langchain_core.runnables import RunnableConfig
 import json
 
+# Max LLM round trips per question; after that the agent must answer with what it has
+MAX_AGENT_STEPS = int(os.getenv("AGENT_MAX_STEPS", "4"))
+# How many tool calls from one LLM turn may run at the same time
+AGENT_TOOL_WORKERS = int(os.getenv("AGENT_TOOL_WORKERS", "4"))
+# Conversation memory backend: sqlite (persistent, bounded) | memory (in-process)
+AGENT_CHECKPOINTER = os.getenv("AGENT_CHECKPOINTER", "sqlite").strip().lower()
+# Route new questions with question_router.py before the first LLM call
+AGENT_ROUTING = os.getenv("AGENT_ROUTING", "true").strip().lower() == "true"
+# Memoized tool results kept per thread
+AGENT_TOOL_CACHE_SIZE = int(os.getenv("AGENT_TOOL_CACHE_SIZE", "32"))
+
+def merge_tool_cache(left: dict, right: dict) -> dict:
+    """State reducer: add new tool results, keeping only the most recent entries."""
+    merged = {**left, **right}
+    return dict(list(merged.items())[-AGENT_TOOL_CACHE_SIZE:])
+
 # --- 1. Define the Agent's "Memory" (State) ---
 # We go back to the simple, standard, powerful state
 class AgentState(TypedDict):
-    # This holds the full chat history
-    messages: Annotated[List[BaseMessage], lambda x, y: x + y]
+    # This holds the chat history (windowed to AGENT_HISTORY_MAX_MESSAGES)
+    messages: Annotated[List[BaseMessage], add_messages_windowed]
+    # Per-thread memo of tool results, keyed on (tool name, args)
+    tool_cache: Annotated[dict, merge_tool_cache]
 
 # --- 2. Define the Agent's "Brain" (The LLM) ---
 
@@ -26,13 +55,23 @@ You are an expert assistant. Primary rule: attempt to answer from existing messa
 
 If you cannot find the information in the available messages, call the appropriate retrieval tool using a single provider-style function call (populate the tool_calls field with name + parameters) and nothing else.
 
+For "how many", "how often" or "when did ... first/last" questions, call `query_message_stats`: it counts all messages, while the retrieval tool only returns the top matches.
+
+Retrieval already ranks newer messages first for "latest" / "current" questions. For questions about a period, call `search_messages` with the full user names, a query and `start_date` / `end_date`.
 When returning phone numbers, prefer the latest timestamped match and format as digits-only. Be deterministic (temperature=0).
 """
 
+FINAL_ANSWER_PROMPT = """
+Do not call any more tools. Answer the user's last question now using only the tool results above. If they do not contain the answer, say you do not have that information.
+"""
+
 # The LLM "Brain"
 # Create the ChatOllama model with deterministic temperature; pass tools
 # at invoke-time as provider-ready specs to avoid validation errors.
 llm = ChatOllama(model="llama3.1:8b", temperature=0)
+# Keep the agent's model warm too (loaded in the background; see generators/lifecycle.py)
+if OLLAMA_LIFECYCLE:
+    ollama_lifecycle.register(llm.model)
 llm_with_tools = llm.bind_tools(all_tools)
 # Prepare provider-ready tool specs for Ollama (convert LangChain tools)
 tools_for_request = []
@@ -47,64 +86,170 @@ for t in all_tools:
 
 # --- 3. Define the "Nodes" (The Agent's Actions) ---
 
+def tool_cache_key(tool_call: dict) -> str:
+    return json.dumps([tool_call['name'], tool_call['args']], sort_keys=True, default=str)
+
+def steps_taken(messages: List[BaseMessage]) -> int:
+    """Number of LLM turns since the user's latest question (the router's prefetch is not one)."""
+    steps = 0
+    for message in reversed(messages):
+        if isinstance(message, HumanMessage):
+            break
+        if isinstance(message, AIMessage) and not message.additional_kwargs.get("router"):
+            steps += 1
+    return steps
+
 # This node is the "brain"
 def call_model_node(state: AgentState):
     """The primary node that calls the LLM (Mistral) to decide what to do."""
     print("--- Node: call_model (Agent Brain) ---")
     
     messages = [SystemMessage(content=AGENT_SYSTEM_PROMPT)] + state['messages']
+    steps = steps_taken(state['messages'])
+    if steps >= MAX_AGENT_STEPS - 1:
+        # Last allowed step: answer without tools so the loop always terminates
+        print(f"  -> Step budget reached ({steps + 1}/{MAX_AGENT_STEPS}); forcing final answer.")
+        with generation_slot():
+            return {"messages": [llm.invoke(messages + [SystemMessage(content=FINAL_ANSWER_PROMPT)])]}
+
     # Primary invoke: provider-native function-calling when available
-    response = llm_with_tools.invoke(messages, format="json")
+    # Same priority queue as the RAG generator: the agent shares the model
+    with generation_slot():
+        response = llm_with_tools.invoke(messages, format="json")
     print(f"  -> LLM Response: {repr(response)}")
     print("tool_calls attr:", getattr(response, "tool_calls", None))
     print("content/text:", getattr(response, "content", getattr(response, "text", None)))
     print("invalid_tool_calls:", getattr(response, "invalid_tool_calls", None))
     print("dir(response):", [n for n in dir(response) if not n.startswith('_')])
+
+    # Early exit: repeating only tool calls already made for this question means the agent is looping
+    called = set()
+    for message in reversed(state['messages']):
+        if isinstance(message, HumanMessage):
+            break
+        if isinstance(message, AIMessage):
+            called.update(tool_cache_key(tc) for tc in message.tool_calls)
+    if response.tool_calls and all(tool_cache_key(tc) in called for tc in response.tool_calls):
+        print("  -> Repeated tool calls; forcing final answer.")
+        with generation_slot():
+            return {"messages": [llm.invoke(messages + [SystemMessage(content=FINAL_ANSWER_PROMPT)])]}
+
     # Return response directly. If it contains structured tool_calls the run_tools node will execute them.
     return {"messages": [response]}
 
+def is_error_output(output) -> bool:
+    first = output[0] if isinstance(output, list) and output else output
+    return isinstance(first, str) and first.startswith("Error")
+
+def run_single_tool(tool_call: dict, config: RunnableConfig = None):
+    """Runs one tool call and returns its raw Python output."""
+    tool_map = {t.name: t for t in all_tools}
+    tool_name = tool_call['name']
+    if tool_name not in tool_map:
+        print(f"  -> Unknown tool requested: {tool_name}; skipping.")
+        return f"Error: unknown tool '{tool_name}'"
+
+    print(f"  -> Calling Tool: {tool_name}({tool_call['args']})")
+    try:
+        # Pass the run config through so tools can see the conversation's thread_id
+        return tool_map[tool_name].invoke(tool_call['args'], config=config)
+    except Exception as e:
+        return [f"Error invoking tool: {e}"]
+
 # This node runs the tools
-def call_tool_node(state: AgentState):
-    """This node checks for tool calls and executes them."""
+def call_tool_node(state: AgentState, config: RunnableConfig):
+    """
+    Executes the last message's tool calls. Independent calls run
+    concurrently, and results already memoized for this thread are reused.
+    """
     print("--- Node: call_tool ---")
     
     last_message = state['messages'][-1]
     
     # If the last message is a tool call, run it
     if last_message.tool_calls:
+        tool_cache = state.get('tool_cache') or {}
+        keys = [tool_cache_key(tc) for tc in last_message.tool_calls]
+        to_run = {key: tc for key, tc in zip(keys, last_message.tool_calls) if key not in tool_cache}
+
+        new_results = {}
+        if to_run:
+            with ThreadPoolExecutor(max_workers=AGENT_TOOL_WORKERS) as pool:
+                # Each call runs in a copy of this thread's context, so its
+                # retrieval keeps the request's priority and client
+                futures = [
+                    pool.submit(contextvars.copy_context().run, run_single_tool, tc, config)
+                    for tc in to_run.values()
+                ]
+                new_results = dict(zip(to_run.keys(), (f.result() for f in futures)))
+        print(f"  -> {len(to_run)} tool call(s) executed, {len(keys) - len(to_run)} served from memo.")
+
+        # Default: string-serialize the output for downstream LLM consumption
         tool_outputs = []
-        tool_map = {t.name: t for t in all_tools}
-        for tool_call in last_message.tool_calls:
-            tool_name = tool_call['name']
-            if tool_name not in tool_map:
-                print(f"  -> Unknown tool requested: {tool_name}; skipping.")
-                tool_outputs.append(
-                    ToolMessage(content=f"Error: unknown tool '{tool_name}'", 
-                                tool_call_id=tool_call.get('id'))
-                )
-                continue
-
-            tool_to_call = tool_map[tool_name]
-
-            print(f"  -> Calling Tool: {tool_name}({tool_call['args']})")
-            # Run the tool and keep the raw Python output if possible
-            try:
-                output = tool_to_call.invoke(tool_call['args'])
-            except Exception as e:
-                output = [f"Error invoking tool: {e}"]
-
-            # Default: string-serialize the output for downstream LLM consumption
+        for key, tool_call in zip(keys, last_message.tool_calls):
+            output = new_results[key] if key in new_results else tool_cache[key]
             tool_outputs.append(
-                ToolMessage(content=json.dumps(output, default=str), tool_call_id=tool_call['id'])
+                ToolMessage(content=json.dumps(output, default=str), tool_call_id=tool_call.get('id'))
             )
 
-        # Return the tool outputs
-        return {"messages": tool_outputs}
+        # Return the tool outputs (and memoize results, except errors)
+        memo = {key: output for key, output in new_results.items() if not is_error_output(output)}
+        return {"messages": tool_outputs, "tool_cache": memo}
     else:
         # This should not happen in our loop, but as a fallback
         return {}
 
+# This node runs before the brain for each new question
+def route_question_node(state: AgentState, config: RunnableConfig):
+    """
+    Classifies the question without the LLM. Meta, count/timeline and
+    single-field questions are answered directly; for the rest the user's messages are fetched up
+    front, so the brain's first call already has them. Multi-part questions
+    go straight to the brain.
+    """
+    print("--- Node: route_question ---")
+    question = state['messages'][-1].content
+    found = find_user_names.invoke({"question": question})
+    route, reason = classify_question(question, found if isinstance(found, list) else [])
+    print(f"  -> Route: {route} ({reason})")
+
+    if route == "stats":
+        return {"messages": [AIMessage(content=format_stats_answer(get_system_stats.invoke({})))]}
+    if route == "analytics":
+        answer = answer_analytics(question, found if isinstance(found, list) else [])
+        if answer is not None:
+            return {"messages": [AIMessage(content=answer)]}
+    if route == "agent":
+        return {}
+
+    tool_call = {"name": "get_user_messages", "args": {"question": question}, "id": f"route-{uuid.uuid4()}"}
+    key = tool_cache_key(tool_call)
+    tool_cache = state.get('tool_cache') or {}
+    output = tool_cache[key] if key in tool_cache else run_single_tool(tool_call, config)
+
+    if route == "extract" and isinstance(output, list):
+        field = requested_field(question)
+        extracted = extract_field(field, output)
+        if extracted is not None:
+            return {"messages": [AIMessage(content=format_extracted_answer(field, extracted))]}
+
+    return {
+        "messages": [
+            # Tagged so steps_taken does not charge the prefetch to the brain's MAX_AGENT_STEPS
+            AIMessage(content="", tool_calls=[tool_call], additional_kwargs={"router": True}),
+            ToolMessage(content=json.dumps(output, default=str), tool_call_id=tool_call['id']),
+        ],
+        "tool_cache": {} if is_error_output(output) else {key: output},
+    }
+
 # --- 4. Define the "Edges" (The Agent's Flowchart) ---
+def after_routing(state: AgentState):
+    """End if the router already answered, otherwise let the brain think."""
+    last_message = state['messages'][-1]
+    if isinstance(last_message, AIMessage) and not last_message.tool_calls:
+        return "end"
+    return "think"
+
 def should_continue(state: AgentState):
     """This edge decides if the agent is done or needs to loop (to think more)."""
     last_message = state['messages'][-1]
@@ -123,9 +268,21 @@ workflow = StateGraph(AgentState)
 # Add the nodes
 workflow.add_node("agent_brain", call_model_node)
 workflow.add_node("run_tools", call_tool_node)
+workflow.add_node("route_question", route_question_node)
 
 # Define the flowchart
-workflow.set_entry_point("agent_brain")
+if AGENT_ROUTING:
+    workflow.set_entry_point("route_question")
+    workflow.add_conditional_edges(
+        "route_question",
+        after_routing,
+        {
+            "think": "agent_brain",  # Brain answers (with any prefetched messages)
+            "end": END               # Router answered deterministically
+        }
+    )
+else:
+    workflow.set_entry_point("agent_brain")
 
 workflow.add_conditional_edges(
     "agent_brain",
@@ -138,7 +295,10 @@ workflow.add_conditional_edges(
 # This is the "loop" you wanted
 workflow.add_edge("run_tools", "agent_brain") # After running tool, go back to brain to "think"
 
-# Add conversational memory
-memory = MemorySaver()
+# Add conversational memory (bounded SQLite survives restarts and is shared by workers)
+if AGENT_CHECKPOINTER == "sqlite":
+    memory = BoundedSqliteSaver.from_path()
+else:
+    memory = MemorySaver()
 app = workflow.compile(checkpointer=memory)
 print("LangGraph Agent compiled successfully.")
\ No newline at end of file
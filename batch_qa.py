@@ -0,0 +1,137 @@
+import os
+import re
+import uuid
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from core.db import embedding_func
+from core.session import sessions
+from core.scheduler import request_context
+from core.nlp import find_names_batch
+from qa_system import answer_question, answer_routed, QA_ROUTING
+
+# --- Constants ---
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+BATCH_MAX_QUESTIONS = int(os.getenv("BATCH_MAX_QUESTIONS", "10000"))
+EMBED_BATCH_SIZE = 256
+
+_SPACES = re.compile(r"\s+")
+
+
+def normalize_question(question: str) -> str:
+    """Dedupe key: case, surrounding and repeated whitespace ignored."""
+    return _SPACES.sub(" ", question).strip().lower()
+
+
+def plan_batch(questions: list[str]) -> tuple[list[str], list[int], dict]:
+    """
+    Returns (unique questions, index into them for every input question,
+    groups of unique-question ids keyed by the sorted tuple of resolved users).
+    """
+    unique, position, slot_of = [], {}, []
+    for question in questions:
+        key = normalize_question(question)
+        if key not in position:
+            position[key] = len(unique)
+            unique.append(question.strip())
+        slot_of.append(position[key])
+
+    groups = defaultdict(list)
+    # One nlp.pipe pass over all questions instead of a pipeline call each
+    for i, found in enumerate(find_names_batch(unique)):
+        groups[tuple(sorted(found))].append(i)
+    return unique, slot_of, dict(groups)
+
+
+def embed_questions(questions: list[str]) -> list:
+    """All questions in a few large embedding calls instead of one call each."""
+    vectors = []
+    for i in range(0, len(questions), EMBED_BATCH_SIZE):
+        vectors.extend(embedding_func.embed_documents(questions[i:i + EMBED_BATCH_SIZE]))
+    return vectors
+
+
+def answer_batch(
+    questions: list[str],
+    concurrency: int = BATCH_CONCURRENCY,
+    routed: bool = QA_ROUTING,
+    priority: str = "batch",
+    client: str | None = None,
+):
+    """
+    Answers many questions at once and yields one result dict per input
+    question, in completion order: {"index", "question", "answer", "users",
+    "duplicate", "seconds"} (or "error" instead of "answer").
+
+    - Identical questions (ignoring case/whitespace) are answered once.
+    - Questions about the same users share one conversation session, so
+      their retrieval reuses one cached candidate set per user.
+    - Questions are embedded together up front.
+    - At most `concurrency` questions are generated at a time, as
+      `priority` work of `client` in the scheduler (core/scheduler.py), so
+      a large batch only uses capacity interactive users leave free.
+    """
+    if len(questions) > BATCH_MAX_QUESTIONS:
+        raise ValueError(f"Batch has {len(questions)} questions; the limit is {BATCH_MAX_QUESTIONS}.")
+    unique, slot_of, groups = plan_batch(questions)
+    print(f"--- Batch: {len(questions)} questions, {len(unique)} unique, {len(groups)} user group(s) ---")
+    waiting = defaultdict(list)
+    for index, slot in enumerate(slot_of):
+        waiting[slot].append(index)
+
+    users_of = {i: list(users) for users, ids in groups.items() for i in ids}
+    batch_id = uuid.uuid4().hex
+    session_ids = {}
+    if embedding_func is not None:
+        vectors = embed_questions(unique)
+    else:
+        vectors = [None] * len(unique)
+    for group, (users, ids) in enumerate(groups.items()):
+        if not users:
+            continue
+        session_id = f"batch:{batch_id}:{group}"
+        session = sessions.get(session_id)
+        session.resolve_users(list(users))
+        session.query_embeddings.update({unique[i]: vectors[i] for i in ids if vectors[i] is not None})
+        for i in ids:
+            session_ids[i] = session_id
+
+    client = client or f"batch:{batch_id}"
+
+    def run(i: int) -> dict:
+        started = time.perf_counter()
+        users = users_of[i]
+        try:
+            # Pool threads do not inherit the caller's context, so tag each question here
+            with request_context(priority, client):
+                if routed:
+                    answer = answer_routed(unique[i], session_id=session_ids.get(i), user_names=users)
+                else:
+                    answer = answer_question(unique[i], session_id=session_ids.get(i), user_names=users)
+            result = {"answer": answer}
+        except Exception as e:
+            result = {"error": str(e)}
+        result.update({"users": users, "seconds": round(time.perf_counter() - started, 3)})
+        return result
+
+    pool = ThreadPoolExecutor(max_workers=max(1, concurrency))
+    abandoned = False
+    try:
+        futures = {pool.submit(run, i): i for i in range(len(unique))}
+        for future in as_completed(futures):
+            slot = futures[future]
+            result = future.result()
+            for n, index in enumerate(waiting[slot]):
+                yield {"index": index, "question": questions[index], "duplicate": n > 0, **result}
+    except GeneratorExit:
+        # Closed before the end (e.g. the /ask/batch client disconnected):
+        # questions not started yet are dropped instead of run for nobody
+        abandoned = True
+        cancelled = sum(future.cancel() for future in futures)
+        print(f"--- Batch {batch_id} abandoned: {cancelled} queued question(s) cancelled ---")
+        raise
+    finally:
+        pool.shutdown(wait=not abandoned, cancel_futures=abandoned)
+        for session_id in set(session_ids.values()):
+            sessions.discard(session_id)
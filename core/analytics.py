@@ -0,0 +1,200 @@
+import os
+import re
+import threading
+import pandas as pd
+from core.timeutils import parse_date_bound
+from core.versions import DB_PATH, read_active
+
+# --- Constants ---
+# Columnar copy of every message, written by ingest_data.py next to the vector DB.
+# Unless ANALYTICS_PATH pins a file, the table of the active index version is used.
+ANALYTICS_PATH = os.getenv("ANALYTICS_PATH")
+DEFAULT_ANALYTICS_PATH = os.path.join(DB_PATH, "messages.parquet")
+# Messages returned with an aggregate as evidence (newest first)
+ANALYTICS_EXAMPLES = int(os.getenv("ANALYTICS_EXAMPLES", "5"))
+# spaCy labels kept as message entities
+ENTITY_LABELS = ("PERSON", "ORG", "GPE", "LOC", "FAC", "EVENT", "PRODUCT", "WORK_OF_ART", "DATE")
+
+# Keyword buckets for the `categories` column (a message can be in several)
+CATEGORY_KEYWORDS = {
+    "travel": ["flight", "fly", "trip", "travel", "airport", "jet", "hotel", "suite", "villa", "resort", "cruise", "yacht", "chauffeur", "transfer", "visa", "passport"],
+    "dining": ["restaurant", "dinner", "lunch", "breakfast", "table", "chef", "wine", "menu", "reservation at"],
+    "events": ["ticket", "concert", "opera", "show", "gala", "match", "premiere", "festival", "exhibition", "event"],
+    "payments": ["payment", "invoice", "charge", "card", "refund", "billing", "paid", "transaction"],
+    "contact": ["phone", "number", "email", "address", "contact"],
+    "preferences": ["prefer", "preferred", "preference", "always", "favorite", "favourite", "allergic", "allergy", "vegan", "vegetarian"],
+    "feedback": ["thank", "thanks", "great", "excellent", "disappointed", "complaint", "issue", "problem"],
+}
+CATEGORIES = tuple(CATEGORY_KEYWORDS)
+
+
+def keyword_pattern(word: str) -> str:
+    """Whole-word regex for `word` and its plural: "car" matches "cars", not "card" or "Caribbean"."""
+    word = word.strip().lower()
+    if len(word) > 2 and word.endswith("y") and word[-2] not in "aeiou":
+        return r"\b" + re.escape(word[:-1]) + r"(?:y|ies)\b"
+    return r"\b" + re.escape(word) + r"(?:s|es)?\b"
+
+
+_CATEGORY_RES = {
+    category: re.compile("|".join(keyword_pattern(w) for w in words), re.IGNORECASE)
+    for category, words in CATEGORY_KEYWORDS.items()
+}
+
+
+def categorize(message: str) -> list[str]:
+    return [category for category, pattern in _CATEGORY_RES.items() if pattern.search(message)]
+
+
+def build_analytics_table(items: list[dict], nlp=None) -> pd.DataFrame:
+    """
+    One row per non-empty message: id, user_name, user_id, timestamp (UTC),
+    message, document (the same text stored in Chroma), categories and
+    entities. Entities are only filled when a spaCy pipeline is given.
+    """
+    rows = [item for item in items if item.get("message") and item["message"].strip()]
+    messages = [item["message"] for item in rows]
+    if nlp is not None:
+        entities = [
+            sorted({ent.text for ent in doc.ents if ent.label_ in ENTITY_LABELS})
+            for doc in nlp.pipe(messages, batch_size=256)
+        ]
+    else:
+        entities = [[] for _ in rows]
+
+    df = pd.DataFrame({
+        "id": [item["id"] for item in rows],
+        "user_name": [item.get("user_name", "Unknown") for item in rows],
+        "user_id": [item.get("user_id", "Unknown") for item in rows],
+        "timestamp": pd.to_datetime([item.get("timestamp") for item in rows], utc=True, errors="coerce", format="ISO8601"),
+        "message": messages,
+        "document": [
+            f"On {item.get('timestamp', 'Unknown date')}, user {item.get('user_name', 'Unknown user')} sent a message: '{item.get('message', '')}'"
+            for item in rows
+        ],
+        "categories": [categorize(m) for m in messages],
+        "entities": entities,
+    })
+    df["user_name"] = df["user_name"].astype("category")
+    return df.sort_values("timestamp", kind="stable").reset_index(drop=True)
+
+
+def analytics_path() -> str:
+    """ANALYTICS_PATH if set, else the table of the active index version."""
+    if ANALYTICS_PATH:
+        return ANALYTICS_PATH
+    return (read_active() or {}).get("analytics") or DEFAULT_ANALYTICS_PATH
+
+
+def _file_identity(path: str) -> tuple | None:
+    """(path, inode, mtime); changes when a pinned table is replaced in place by rename."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (path, stat.st_ino, stat.st_mtime_ns)
+
+
+def write_analytics_table(df: pd.DataFrame, path: str) -> str:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    df.to_parquet(path, index=False)
+    return path
+
+
+class MessageAnalytics:
+    """
+    Vectorized counts and timelines over the full message table, for the
+    aggregate questions top-k retrieval cannot answer ("how many trips did X
+    book", "when did X last mention Y"). The Parquet file is read once.
+    """
+    def __init__(self, df: pd.DataFrame):
+        self.df = df
+        self.path = None
+        # (path, inode, mtime) of the file it was read from
+        self.identity = None
+
+    @classmethod
+    def from_path(cls, path: str) -> "MessageAnalytics":
+        # Memory-mapped: read through the OS page cache (warm right after an artifact is unpacked)
+        identity = _file_identity(path)
+        analytics = cls(pd.read_parquet(path, memory_map=True))
+        analytics.path = path
+        analytics.identity = identity
+        return analytics
+
+    def select(
+        self,
+        user_names: list[str] | None = None,
+        keyword: str | None = None,
+        category: str | None = None,
+        start: str | None = None,
+        end: str | None = None,
+    ) -> pd.DataFrame:
+        """Rows matching every given filter. `keyword` is a whole word and also matches plurals ("trip" -> "trips")."""
+        df = self.df
+        mask = pd.Series(True, index=df.index)
+        if user_names:
+            mask &= df["user_name"].isin(user_names)
+        if keyword:
+            mask &= df["message"].str.contains(keyword_pattern(keyword), case=False, regex=True)
+        if category:
+            mask &= df["categories"].map(lambda cats: category in cats)
+        # Same reading of dates as search_user_messages: "2025-03" as an end
+        # bound means the end of March, not midnight on the 1st
+        if start:
+            mask &= df["timestamp"] >= pd.Timestamp(parse_date_bound(start), unit="s", tz="UTC")
+        if end:
+            mask &= df["timestamp"] <= pd.Timestamp(parse_date_bound(end, end=True), unit="s", tz="UTC")
+        return df[mask]
+
+    def summarize(self, rows: pd.DataFrame, group_by: str | None = None, examples: int = ANALYTICS_EXAMPLES) -> dict:
+        """
+        {"count", "first", "last", "groups", "examples"} for the selected rows.
+        `group_by` is "user", "month" or "category"; examples are the newest
+        matching documents, usable as evidence lines.
+        """
+        summary = {
+            "count": int(len(rows)),
+            "first": rows["timestamp"].min().isoformat() if len(rows) else None,
+            "last": rows["timestamp"].max().isoformat() if len(rows) else None,
+            "groups": {},
+            "examples": rows.sort_values("timestamp", ascending=False)["document"].head(examples).tolist(),
+        }
+        if len(rows) and group_by == "user":
+            counts = rows["user_name"].value_counts()
+            summary["groups"] = {str(k): int(v) for k, v in counts[counts > 0].items()}
+        elif len(rows) and group_by == "month":
+            counts = rows["timestamp"].dt.strftime("%Y-%m").value_counts().sort_index()
+            summary["groups"] = {str(k): int(v) for k, v in counts.items()}
+        elif len(rows) and group_by == "category":
+            counts = rows["categories"].explode().dropna().value_counts()
+            summary["groups"] = {str(k): int(v) for k, v in counts.items()}
+        return summary
+
+    def query(self, group_by: str | None = None, **filters) -> dict:
+        return self.summarize(self.select(**filters), group_by=group_by)
+
+
+_analytics = None
+_analytics_lock = threading.Lock()
+
+def get_analytics() -> MessageAnalytics | None:
+    """
+    The shared MessageAnalytics, or None if ingest_data.py has not written the
+    table yet. Reloaded when a new index version is activated, or when a
+    pinned ANALYTICS_PATH is replaced by a re-ingest.
+    """
+    global _analytics
+    path = analytics_path()
+    identity = _file_identity(path)
+    if _analytics is None or _analytics.identity != identity:
+        with _analytics_lock:
+            if _analytics is None or _analytics.identity != identity:
+                if identity is None:
+                    # Keep serving the table already loaded, if any
+                    if _analytics is None:
+                        print(f"Analytics table not found at {path}. Run 'python ingest_data.py' to build it.")
+                    return _analytics
+                _analytics = MessageAnalytics.from_path(path)
+                print(f"Analytics table loaded from {path}: {len(_analytics.df)} messages.")
+    return _analytics
@@ -0,0 +1,292 @@
+import os
+import io
+import json
+import time
+import shutil
+import hashlib
+import tarfile
+import tempfile
+import urllib.request
+from contextlib import contextmanager
+from core.embeddings import EMBED_MODEL, EMBED_BACKEND, HF_MODEL_ID, MAX_SEQ_LENGTH, backends_compatible
+from core.versions import DB_PATH, read_active, activate
+
+# --- Constants ---
+# Bump when the archive layout changes; loaders refuse formats they do not know
+ARTIFACT_FORMAT = 1
+# Where `build` writes archives
+ARTIFACT_DIR = os.getenv("ARTIFACT_DIR", "artifacts")
+MANIFEST_FILE = "manifest.json"
+USER_DIRECTORY_FILE = "users.json"
+# Rows read from (and written to) Chroma per call while exporting
+EXPORT_PAGE_SIZE = 1000
+COPY_CHUNK = 1 << 20
+
+
+class ArtifactError(RuntimeError):
+    """The archive is damaged, from another layout, or does not fit this deployment."""
+
+
+def embedding_identity(dimension: int | None = None) -> dict:
+    """What query embeddings must match for the index to be searchable."""
+    return {
+        "model": EMBED_MODEL,
+        "hf_model_id": HF_MODEL_ID,
+        "backend": EMBED_BACKEND,
+        "max_seq_length": MAX_SEQ_LENGTH,
+        "dimension": dimension,
+    }
+
+
+def check_embedding_identity(manifest: dict) -> None:
+    """
+    Raises ArtifactError if this process would embed queries differently from
+    the artifact. torch and onnx give the same vectors, so they may be mixed.
+    """
+    built = manifest.get("embedding") or {}
+    current = embedding_identity()
+    mismatched = []
+    if built.get("model") != current["model"]:
+        mismatched.append("model")
+    if not backends_compatible(built.get("backend"), current["backend"]):
+        mismatched.append("backend")
+    if mismatched:
+        raise ArtifactError(
+            "Artifact embeddings do not match this deployment: "
+            + ", ".join(f"{key} {built.get(key)!r} != {current[key]!r}" for key in mismatched)
+            + ". Set EMBED_BACKEND to match or rebuild the artifact."
+        )
+
+
+def _sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(COPY_CHUNK), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# --- Build ---
+def _export_collection(source, target_client, directory: dict | None = None) -> tuple[int, int | None]:
+    """
+    Copies a collection (ids, documents, metadata, stored vectors) into
+    `target_client` under the same name, without re-embedding. With
+    `directory`, also tallies messages per user. Returns (rows, dimension).
+    """
+    target = target_client.create_collection(
+        name=source.name, metadata=source.metadata, embedding_function=None
+    )
+    rows, dimension, offset = 0, None, 0
+    while True:
+        page = source.get(limit=EXPORT_PAGE_SIZE, offset=offset, include=["documents", "metadatas", "embeddings"])
+        if not len(page["ids"]):
+            break
+        embeddings = [list(map(float, e)) for e in page["embeddings"]]
+        dimension = dimension or len(embeddings[0])
+        target.add(ids=page["ids"], documents=page["documents"], metadatas=page["metadatas"], embeddings=embeddings)
+        if directory is not None:
+            for meta in page["metadatas"]:
+                _tally_user(directory, meta or {})
+        rows += len(page["ids"])
+        offset += EXPORT_PAGE_SIZE
+    return rows, dimension
+
+
+def _tally_user(directory: dict, meta: dict):
+    user_id = meta.get("user_id", "Unknown")
+    entry = directory.setdefault(user_id, {
+        "user_id": user_id, "user_name": meta.get("user_name", "Unknown"),
+        "messages": 0, "first_message": None, "last_message": None,
+    })
+    entry["messages"] += 1
+    timestamp = meta.get("timestamp")
+    if timestamp and timestamp != "Unknown":
+        entry["first_message"] = min(filter(None, (entry["first_message"], timestamp)))
+        entry["last_message"] = max(filter(None, (entry["last_message"], timestamp)))
+
+
+def build_artifact(output_dir: str = ARTIFACT_DIR, db_path: str = DB_PATH, compress: bool = False) -> str:
+    """
+    Packages the active index version into one archive and returns its path:
+    a fresh Chroma directory holding only that version's collections (vectors
+    copied, not recomputed), its analytics table, the user directory and a
+    manifest with the embedding identity and a sha256 per file. Uncompressed
+    by default: the vectors barely compress and extraction stays a plain copy.
+    """
+    import chromadb
+
+    pointer = read_active(db_path)
+    if not pointer or not pointer.get("version"):
+        raise ArtifactError(f"No active index version in {db_path}. Run 'python ingest_data.py' first.")
+    version = pointer["version"]
+    source_client = chromadb.PersistentClient(path=db_path)
+
+    staging = tempfile.mkdtemp(prefix=f"index-{version}-", dir=output_dir if os.path.isdir(output_dir) else None)
+    try:
+        index_dir = os.path.join(staging, "chroma_db")
+        target_client = chromadb.PersistentClient(path=index_dir)
+        directory = {}
+        counts = {}
+        print(f"Exporting index version {version}...")
+        messages, dimension = _export_collection(source_client.get_collection(pointer["messages"]), target_client, directory)
+        counts["messages"] = messages
+        if pointer.get("chunks"):
+            counts["chunks"], _ = _export_collection(source_client.get_collection(pointer["chunks"]), target_client)
+        # Release the SQLite handle before the files are hashed and archived
+        target_client.clear_system_cache()
+
+        analytics = pointer.get("analytics")
+        if analytics and os.path.exists(analytics):
+            shutil.copyfile(analytics, os.path.join(index_dir, os.path.basename(analytics)))
+        else:
+            print(f"Warning: analytics table {analytics} not found; the artifact will not include it.")
+            analytics = None
+
+        users = sorted(directory.values(), key=lambda u: u["user_name"])
+        counts["users"] = len(users)
+        with open(os.path.join(index_dir, USER_DIRECTORY_FILE), "w", encoding="utf-8") as f:
+            json.dump(users, f, indent=2, ensure_ascii=False)
+
+        files = {}
+        for root, _, names in os.walk(index_dir):
+            for name in sorted(names):
+                path = os.path.join(root, name)
+                relative = os.path.relpath(path, index_dir).replace(os.sep, "/")
+                files[relative] = {"sha256": _sha256(path), "size": os.path.getsize(path)}
+        manifest = {
+            "format": ARTIFACT_FORMAT,
+            "version": version,
+            "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "source_created": pointer.get("created"),
+            "pointer": {**pointer, "analytics": os.path.basename(analytics) if analytics else None},
+            "embedding": embedding_identity(dimension),
+            "counts": counts,
+            "files": files,
+        }
+
+        os.makedirs(output_dir, exist_ok=True)
+        archive = os.path.join(output_dir, f"index-{version}.tar" + (".gz" if compress else ""))
+        partial = archive + ".partial"
+        with tarfile.open(partial, "w:gz" if compress else "w") as tar:
+            # The manifest goes first, so a streaming loader knows what to expect before any data
+            data = json.dumps(manifest, indent=2).encode("utf-8")
+            info = tarfile.TarInfo(MANIFEST_FILE)
+            info.size, info.mtime = len(data), int(time.time())
+            tar.addfile(info, io.BytesIO(data))
+            for relative in files:
+                tar.add(os.path.join(index_dir, relative), arcname=relative, recursive=False)
+        os.replace(partial, archive)
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+    size_mb = os.path.getsize(archive) / 1e6
+    print(f"Artifact written: {archive} ({size_mb:.1f} MB, {counts}).")
+    return archive
+
+
+# --- Load ---
+@contextmanager
+def _open_archive(source: str):
+    """The archive at a local path or http(s) URL, read as a stream (a download is never saved to disk)."""
+    if source.startswith(("http://", "https://")):
+        stream = urllib.request.urlopen(source, timeout=60)
+    else:
+        stream = open(source, "rb")
+    try:
+        with stream, tarfile.open(fileobj=stream, mode="r|*") as tar:
+            yield tar
+    except tarfile.TarError as e:
+        raise ArtifactError(f"{source} is damaged or truncated: {e}") from e
+
+
+def read_manifest(source: str) -> dict:
+    """The manifest of an archive (its first member), without reading the rest."""
+    with _open_archive(source) as tar:
+        return _manifest_of(tar)
+
+
+def _manifest_of(tar) -> dict:
+    member = tar.next()
+    if member is None or member.name != MANIFEST_FILE:
+        raise ArtifactError(f"Not an index artifact: first member is not {MANIFEST_FILE}.")
+    manifest = json.load(tar.extractfile(member))
+    if manifest.get("format") != ARTIFACT_FORMAT:
+        raise ArtifactError(f"Artifact format {manifest.get('format')} is not supported (expected {ARTIFACT_FORMAT}).")
+    return manifest
+
+
+def _extract(tar, member, manifest: dict, db_path: str, verify: bool) -> str:
+    expected = manifest["files"].get(member.name)
+    if expected is None or not member.isfile():
+        raise ArtifactError(f"Unexpected archive member {member.name!r}.")
+    target = os.path.normpath(os.path.join(db_path, member.name))
+    if not target.startswith(os.path.normpath(db_path) + os.sep):
+        raise ArtifactError(f"Archive member {member.name!r} escapes the index directory.")
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    digest = hashlib.sha256()
+    source = tar.extractfile(member)
+    with open(target, "wb") as out:
+        for block in iter(lambda: source.read(COPY_CHUNK), b""):
+            if verify:
+                digest.update(block)
+            out.write(block)
+    if verify and digest.hexdigest() != expected["sha256"]:
+        raise ArtifactError(f"Checksum mismatch for {member.name}; the archive is damaged.")
+    return member.name
+
+
+def load_artifact(source: str, db_path: str = DB_PATH, verify: bool = True, force: bool = False) -> dict:
+    """
+    Unpacks an artifact (path or URL) into `db_path` in one streaming pass,
+    checking each file's sha256 as it is written, and activates its index
+    version. The ACTIVE pointer is written last, so readers never see a
+    partly unpacked index. `db_path` must be empty unless `force`, which
+    clears it first. Returns the manifest.
+    """
+    started = time.perf_counter()
+    if os.path.isdir(db_path) and os.listdir(db_path):
+        if not force:
+            raise ArtifactError(f"{db_path} is not empty; pass force=True (--force) to replace it.")
+        for name in os.listdir(db_path):
+            path = os.path.join(db_path, name)
+            shutil.rmtree(path) if os.path.isdir(path) and not os.path.islink(path) else os.remove(path)
+    os.makedirs(db_path, exist_ok=True)
+
+    with _open_archive(source) as tar:
+        manifest = _manifest_of(tar)
+        check_embedding_identity(manifest)
+        written = set()
+        try:
+            # Iterating a stream yields the already-read manifest again
+            for member in tar:
+                if member.name == MANIFEST_FILE:
+                    continue
+                written.add(_extract(tar, member, manifest, db_path, verify))
+            missing = set(manifest["files"]) - written
+            if missing:
+                raise ArtifactError(f"Archive is truncated: {len(missing)} file(s) missing, e.g. {sorted(missing)[0]}.")
+        except BaseException:
+            # Leave an empty directory rather than an index nobody can trust
+            for name in os.listdir(db_path):
+                path = os.path.join(db_path, name)
+                shutil.rmtree(path, ignore_errors=True) if os.path.isdir(path) else os.remove(path)
+            raise
+
+    # Paths in the pointer are made relative to where the index now lives
+    pointer = dict(manifest["pointer"])
+    if pointer.get("analytics"):
+        pointer["analytics"] = os.path.join(db_path, pointer["analytics"])
+    pointer["artifact"] = {"source": source, "loaded": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())}
+    activate(pointer, db_path)
+    elapsed = time.perf_counter() - started
+    print(f"Loaded index version {manifest['version']} into {db_path} in {elapsed:.1f}s ({manifest['counts']}).")
+    return manifest
+
+
+def load_user_directory(db_path: str = DB_PATH) -> list[dict]:
+    """The user directory shipped with the active artifact (user id, name, message count, first/last message)."""
+    try:
+        with open(os.path.join(db_path, USER_DIRECTORY_FILE), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return []
+
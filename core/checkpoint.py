@@ -0,0 +1,141 @@
+import os
+import time
+import zlib
+import sqlite3
+import threading
+from typing import Any
+from langchain_core.messages import BaseMessage, HumanMessage
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+from langgraph.checkpoint.sqlite import SqliteSaver
+
+# --- Constants ---
+CHECKPOINT_PATH = os.getenv("AGENT_CHECKPOINT_PATH", "cache/agent_memory.sqlite")
+# Messages kept per thread (older turns are dropped at a question boundary)
+HISTORY_MAX_MESSAGES = int(os.getenv("AGENT_HISTORY_MAX_MESSAGES", "40"))
+# Threads idle for longer than this are deleted
+THREAD_TTL_S = float(os.getenv("AGENT_THREAD_TTL_S", str(24 * 3600)))
+# Checkpoints kept per thread; only the latest is needed to resume a conversation
+KEEP_CHECKPOINTS = int(os.getenv("AGENT_KEEP_CHECKPOINTS", "2"))
+SWEEP_INTERVAL_S = 60.0
+COMPRESS_MIN_BYTES = 256
+
+
+def window_messages(messages: list[BaseMessage], max_messages: int = HISTORY_MAX_MESSAGES) -> list[BaseMessage]:
+    """
+    Keeps at most `max_messages`, cutting only right before a HumanMessage so
+    tool calls and their ToolMessages are never separated. The current turn is
+    always kept whole, even if it alone is longer than the window.
+    """
+    if max_messages <= 0 or len(messages) <= max_messages:
+        return messages
+    start = len(messages) - max_messages
+    for i in range(start, len(messages)):
+        if isinstance(messages[i], HumanMessage):
+            return messages[i:]
+    for i in range(len(messages) - 1, -1, -1):
+        if isinstance(messages[i], HumanMessage):
+            return messages[i:]
+    return messages[start:]
+
+
+def add_messages_windowed(left: list[BaseMessage], right: list[BaseMessage]) -> list[BaseMessage]:
+    """State reducer: append new messages, then apply the history window."""
+    return window_messages(left + right)
+
+
+class CompressedSerializer(JsonPlusSerializer):
+    """msgpack (the LangGraph default) plus zlib for anything non-trivial."""
+    def dumps_typed(self, obj: Any) -> tuple[str, bytes]:
+        type_, data = super().dumps_typed(obj)
+        if len(data) < COMPRESS_MIN_BYTES:
+            return type_, data
+        return f"zlib+{type_}", zlib.compress(data, 6)
+
+    def loads_typed(self, data: tuple[str, bytes]) -> Any:
+        type_, payload = data
+        if type_.startswith("zlib+"):
+            return super().loads_typed((type_[len("zlib+"):], zlib.decompress(payload)))
+        return super().loads_typed(data)
+
+
+class BoundedSqliteSaver(SqliteSaver):
+    """
+    SQLite checkpointer for the agent with bounded storage.
+
+    - Only the newest `keep_checkpoints` checkpoints per thread are kept.
+    - Threads idle for more than `ttl_s` are deleted (checked at most once a minute).
+    - Checkpoints are stored compressed.
+
+    SQLite runs in WAL mode, so several uvicorn workers can share one file.
+    A saver opened with `from_path` reconnects in forked children (serve.py
+    workers), since an SQLite connection must not be used across fork().
+    """
+    def __init__(self, conn: sqlite3.Connection, ttl_s: float = THREAD_TTL_S, keep_checkpoints: int = KEEP_CHECKPOINTS):
+        super().__init__(conn, serde=CompressedSerializer())
+        self.ttl_s = ttl_s
+        self.keep_checkpoints = max(1, keep_checkpoints)
+        self.last_sweep = 0.0
+
+    @classmethod
+    def from_path(cls, path: str = CHECKPOINT_PATH, **kwargs) -> "BoundedSqliteSaver":
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        saver = cls(sqlite3.connect(path, check_same_thread=False, timeout=30), **kwargs)
+        saver.path = path
+        os.register_at_fork(after_in_child=saver._reconnect)
+        return saver
+
+    def _reconnect(self):
+        # The parent's connection (and a lock another thread may have held
+        # at fork time) are abandoned, not closed: they belong to the parent
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+
+    def setup(self) -> None:
+        if self.is_setup:
+            return
+        super().setup()
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS thread_activity (thread_id TEXT PRIMARY KEY, last_seen REAL NOT NULL)"
+        )
+        self.conn.commit()
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        saved = super().put(config, checkpoint, metadata, new_versions)
+        thread_id = str(config["configurable"]["thread_id"])
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        with self.cursor() as cur:
+            cur.execute(
+                "INSERT OR REPLACE INTO thread_activity (thread_id, last_seen) VALUES (?, ?)",
+                (thread_id, time.time()),
+            )
+            # Drop older checkpoints (ids are time-ordered) and their pending writes
+            keep = "SELECT checkpoint_id FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? ORDER BY checkpoint_id DESC LIMIT ?"
+            for table in ("checkpoints", "writes"):
+                cur.execute(
+                    f"DELETE FROM {table} WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id NOT IN ({keep})",
+                    (thread_id, checkpoint_ns, thread_id, checkpoint_ns, self.keep_checkpoints),
+                )
+        if time.monotonic() - self.last_sweep > SWEEP_INTERVAL_S:
+            self.evict_idle_threads()
+        return saved
+
+    def evict_idle_threads(self) -> int:
+        """Deletes threads idle for longer than the TTL; returns how many."""
+        self.last_sweep = time.monotonic()
+        if self.ttl_s <= 0:
+            return 0
+        cutoff = time.time() - self.ttl_s
+        with self.cursor() as cur:
+            idle = [row[0] for row in cur.execute(
+                "SELECT thread_id FROM thread_activity WHERE last_seen < ?", (cutoff,)
+            ).fetchall()]
+        for thread_id in idle:
+            self.delete_thread(thread_id)
+        if idle:
+            print(f"Agent memory: evicted {len(idle)} idle thread(s).")
+        return len(idle)
+
+    def delete_thread(self, thread_id: str) -> None:
+        super().delete_thread(thread_id)
+        with self.cursor() as cur:
+            cur.execute("DELETE FROM thread_activity WHERE thread_id = ?", (str(thread_id),))
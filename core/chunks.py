@@ -0,0 +1,75 @@
+import os
+from collections import defaultdict
+from core.timeutils import to_epoch
+
+# --- Constants ---
+CHUNK_COLLECTION_NAME = "message_chunks"
+# Consecutive messages of one user per chunk, and how far the window moves
+CHUNK_WINDOW = int(os.getenv("CHUNK_WINDOW", "4"))
+CHUNK_STRIDE = int(os.getenv("CHUNK_STRIDE", "2"))
+# A longer silence than this starts a new conversation (no chunk spans it)
+CHUNK_MAX_GAP_H = float(os.getenv("CHUNK_MAX_GAP_H", "72"))
+# Separator for the child message ids stored in chunk metadata (Chroma metadata must be scalar)
+ID_SEPARATOR = ","
+
+
+def conversations(items: list[dict], max_gap_h: float = CHUNK_MAX_GAP_H) -> list[list[dict]]:
+    """Each user's messages in time order, split wherever the user was silent for more than `max_gap_h` hours."""
+    by_user = defaultdict(list)
+    for item in items:
+        if item.get("message") and item["message"].strip() and to_epoch(item.get("timestamp")) is not None:
+            by_user[item.get("user_name", "Unknown")].append(item)
+
+    result = []
+    for user_items in by_user.values():
+        user_items.sort(key=lambda item: to_epoch(item["timestamp"]))
+        current = [user_items[0]]
+        for prev, item in zip(user_items, user_items[1:]):
+            if to_epoch(item["timestamp"]) - to_epoch(prev["timestamp"]) > max_gap_h * 3600:
+                result.append(current)
+                current = []
+            current.append(item)
+        result.append(current)
+    return result
+
+
+def build_chunks(
+    items: list[dict],
+    window: int = CHUNK_WINDOW,
+    stride: int = CHUNK_STRIDE,
+    max_gap_h: float = CHUNK_MAX_GAP_H,
+) -> list[dict]:
+    """
+    Sliding windows of `window` consecutive messages per user conversation,
+    as {"id", "document", "metadata"}. `metadata["message_ids"]` links each
+    chunk back to its messages in the main collection; every message is in
+    at least one chunk.
+    """
+    window, stride = max(1, window), max(1, min(stride, window))
+    chunks = []
+    for conversation in conversations(items, max_gap_h):
+        starts = list(range(0, max(1, len(conversation) - window + 1), stride))
+        # Make sure the tail of the conversation is covered
+        if starts[-1] + window < len(conversation):
+            starts.append(len(conversation) - window)
+        for start in starts:
+            members = conversation[start:start + window]
+            first, last = members[0], members[-1]
+            lines = "\n".join(f"- {m['message'].strip()}" for m in members)
+            chunks.append({
+                "id": f"chunk:{first['id']}:{last['id']}",
+                "document": f"Messages from {first.get('user_name', 'Unknown user')} between {first['timestamp']} and {last['timestamp']}:\n{lines}",
+                "metadata": {
+                    "user_name": first.get("user_name", "Unknown"),
+                    "user_id": first.get("user_id", "Unknown"),
+                    "start_epoch": to_epoch(first["timestamp"]),
+                    "end_epoch": to_epoch(last["timestamp"]),
+                    "message_ids": ID_SEPARATOR.join(m["id"] for m in members),
+                    "size": len(members),
+                },
+            })
+    return chunks
+
+
+def child_ids(metadata: dict) -> list[str]:
+    return [i for i in (metadata.get("message_ids") or "").split(ID_SEPARATOR) if i]
@@ -1,33 +1,396 @@
+import os
+import queue
 from langchain_chroma import Chroma
-from langchain_huggingface import HuggingFaceEmbeddings
+from langchain_core.embeddings import Embeddings
+from core.embeddings import EMBED_MODEL, EMBED_BACKEND, backends_compatible, get_embedding_function
+from core.timeutils import to_epoch, parse_date_bound
+import time
+import threading
+from core.chunks import CHUNK_COLLECTION_NAME, CHUNK_WINDOW, child_ids
+from core.versions import DB_PATH, active_path, read_active
 
 # --- Constants ---
-DB_PATH = "chroma_db"
 COLLECTION_NAME = "messages"
-EMBED_MODEL = "all-MiniLM-L6-v2"
+# How often (seconds) queries check whether ingest_data.py activated a new index version
+INDEX_POLL_S = float(os.getenv("INDEX_POLL_S", "2"))
+# Recency re-ranking: score = similarity + RECENCY_WEIGHT * 0.5 ** (age / half-life),
+# with age measured from the newest candidate (the data set is historical)
+RECENCY_WEIGHT = float(os.getenv("RECENCY_WEIGHT", "0.3"))
+RECENCY_HALF_LIFE_DAYS = float(os.getenv("RECENCY_HALF_LIFE_DAYS", "60"))
+# Candidates pulled per user before the recency re-rank
+RECENCY_FETCH_K = int(os.getenv("RECENCY_FETCH_K", "30"))
+# messages: search individual messages | chunks: search conversation chunks and expand to their messages
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "messages").strip().lower()
+# Chunks searched per user in chunks mode (each expands to up to CHUNK_WINDOW messages)
+CHUNK_RETRIEVE_K = int(os.getenv("CHUNK_RETRIEVE_K", "3"))
+# Messages kept per user for "latest ..." questions; the newest relevant ones rank first, so fewer are needed
+RECENCY_K = int(os.getenv("RECENCY_K", "5"))
+# Query embedding micro-batching: concurrent questions arriving within this
+# window share one forward pass (0 disables it), up to EMBED_MICROBATCH_MAX each
+EMBED_MICROBATCH_WAIT_MS = float(os.getenv("EMBED_MICROBATCH_WAIT_MS", "5"))
+EMBED_MICROBATCH_MAX = int(os.getenv("EMBED_MICROBATCH_MAX", "32"))
+
+
+class _PendingQuery:
+    __slots__ = ("text", "vector", "error", "done")
+
+    def __init__(self, text: str):
+        self.text = text
+        self.vector = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class MicroBatchEmbeddings(Embeddings):
+    """
+    Wraps an embedder so concurrent `embed_query` calls (one per /ask, from
+    the Chroma searches and the session cache) are coalesced: a background
+    thread collects the queries that arrive within `max_wait_ms` of the first
+    one and embeds them in a single `embed_documents` call, then hands each
+    caller its vector. A lone query waits at most `max_wait_ms`; under load
+    the transformer runs one batch instead of many batch-size-1 passes.
+    `embed_documents` is passed straight through.
+    """
+    def __init__(self, inner: Embeddings, max_wait_ms: float = EMBED_MICROBATCH_WAIT_MS, max_batch: int = EMBED_MICROBATCH_MAX):
+        self.inner = inner
+        self.max_wait_s = max_wait_ms / 1000
+        self.max_batch = max(1, max_batch)
+        self.batches = 0
+        self.queries = 0
+        self._reset()
+        # The worker thread does not survive fork(); pre-forked workers (serve.py) start their own
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_worker(self):
+        if self._thread is None:
+            with self._start_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._worker, name="embed-microbatch", daemon=True)
+                    self._thread.start()
+
+    def _next_batch(self) -> list[_PendingQuery]:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait_s
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                # Past the deadline, still take whatever is already queued
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _worker(self):
+        while True:
+            batch = self._next_batch()
+            try:
+                vectors = self.inner.embed_documents([p.text for p in batch])
+                for pending, vector in zip(batch, vectors):
+                    pending.vector = vector
+            except Exception as e:
+                for pending in batch:
+                    pending.error = e
+            self.batches += 1
+            self.queries += len(batch)
+            for pending in batch:
+                pending.done.set()
+
+    def embed_query(self, text: str) -> list[float]:
+        self._ensure_worker()
+        pending = _PendingQuery(text)
+        self._queue.put(pending)
+        pending.done.wait()
+        if pending.error is not None:
+            raise pending.error
+        return pending.vector
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self.inner.embed_documents(texts)
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "queries": self.queries,
+            "mean_batch": round(self.queries / self.batches, 2) if self.batches else 0.0,
+        }
+
 
 # --- Load Models and DB at Startup ---
-try:
-    print("Loading Embedding Model (for RAG)...")
-    embedding_func = HuggingFaceEmbeddings(
-        model_name=EMBED_MODEL,
+embedding_func = None
+
+
+class Index:
+    """
+    One version of the vector index: its Chroma collections and what they
+    support. Queries take the current Index once and use only it, so a query
+    that started before a swap finishes on the version it started with.
+    """
+    def __init__(self, pointer: dict | None):
+        pointer = pointer or {}
+        self.version = pointer.get("version")
+        self.messages_name = pointer.get("messages", COLLECTION_NAME)
+        self.chunks_name = pointer.get("chunks") or (CHUNK_COLLECTION_NAME if not pointer else None)
+
+        print(f"Connecting to Vector DB at {DB_PATH} (collection '{self.messages_name}')...")
+        # Connect to the database we already built with ingest_data.py
+        self.vector_store = Chroma(
+            persist_directory=DB_PATH,
+            embedding_function=embedding_func,
+            collection_name=self.messages_name
+        )
+        collection = self.vector_store._collection
+
+        # Queries must be embedded the same way the collection was built.
+        # fp32 ONNX reproduces the torch vectors; int8 is close but not identical.
+        collection_meta = collection.metadata or {}
+        built_with = collection_meta.get("embed_backend", "torch")
+        if not backends_compatible(built_with, EMBED_BACKEND):
+            print(f"Warning: collection was built with '{built_with}' embeddings but queries use '{EMBED_BACKEND}'.")
+            print("Re-run 'python ingest_data.py' with the same EMBED_BACKEND for best recall.")
+
+        # True when the collection stores `timestamp_epoch`, so Chroma can range-filter on it
+        sample = collection.get(limit=1, include=["metadatas"])
+        self.timestamps_indexed = bool(sample["metadatas"]) and "timestamp_epoch" in sample["metadatas"][0]
+        if sample["metadatas"] and not self.timestamps_indexed:
+            print("Warning: collection has no 'timestamp_epoch' metadata; date filters run after retrieval.")
+            print("Re-run 'python ingest_data.py' to index timestamps.")
+
+        self.chunk_store = None
+        if RETRIEVAL_MODE == "chunks":
+            try:
+                self.vector_store._client.get_collection(self.chunks_name)
+                self.chunk_store = Chroma(
+                    persist_directory=DB_PATH,
+                    embedding_function=embedding_func,
+                    collection_name=self.chunks_name
+                )
+                print(f"Chunk retrieval enabled ({self.chunk_store._collection.count()} chunks).")
+            except Exception:
+                print(f"Warning: RETRIEVAL_MODE=chunks but no '{self.chunks_name or CHUNK_COLLECTION_NAME}' collection; searching messages instead.")
+                print("Run 'INGEST_CHUNKS=true python ingest_data.py' to build it.")
+
+
+_index = None
+_index_lock = threading.Lock()
+_pointer_mtime = None
+_last_poll = 0.0
+
+
+def _pointer_changed() -> bool:
+    global _pointer_mtime
+    try:
+        mtime = os.stat(active_path()).st_mtime_ns
+    except FileNotFoundError:
+        mtime = None
+    changed = mtime != _pointer_mtime
+    _pointer_mtime = mtime
+    return changed
+
+
+def connect():
+    """
+    Loads the embedding model (once) and (re)connects to the active index
+    version. Pre-forked workers (serve.py) call this again after the fork:
+    the model stays shared with the master, while each worker gets its own
+    database connection.
+    """
+    global embedding_func, _index
+    try:
+        if embedding_func is None:
+            print(f"Loading Embedding Model (for RAG) with backend '{EMBED_BACKEND}'...")
+            embedding_func = get_embedding_function(EMBED_BACKEND)
+            if EMBED_MICROBATCH_WAIT_MS > 0:
+                embedding_func = MicroBatchEmbeddings(embedding_func)
+        _pointer_changed()
+        _index = Index(read_active())
+        print(f"ChromaDB Retriever is ready (index version: {_index.version or 'unversioned'}).")
+    except Exception as e:
+        print(f"!!! FATAL ERROR connecting to ChromaDB: {e}")
+        print("!!! --- Have you run 'python ingest_data.py' first? --- !!!")
+        _index = None
+
+
+def refresh_index() -> bool:
+    """
+    Swaps to the version named by the ACTIVE pointer if it changed. The new
+    version is fully opened before it replaces the old one; on failure the
+    old one stays live. Returns True if a swap happened.
+    """
+    global _index
+    pointer = read_active()
+    version = (pointer or {}).get("version")
+    if _index is not None and version == _index.version:
+        return False
+    try:
+        new_index = Index(pointer)
+    except Exception as e:
+        print(f"Warning: could not open index version {version}: {e}; keeping the current one.")
+        return False
+    old_version = _index.version if _index is not None else None
+    _index = new_index
+    print(f"Index swapped: {old_version or 'unversioned'} -> {version or 'unversioned'}.")
+    return True
+
+
+def current_index() -> Index | None:
+    """The live index; checks the ACTIVE pointer at most every INDEX_POLL_S seconds."""
+    global _last_poll
+    if time.monotonic() - _last_poll >= INDEX_POLL_S:
+        with _index_lock:
+            if time.monotonic() - _last_poll >= INDEX_POLL_S:
+                _last_poll = time.monotonic()
+                if _pointer_changed():
+                    refresh_index()
+    return _index
+
+
+def _require_index() -> Index:
+    index = current_index()
+    if index is None:
+        raise RuntimeError("Vector DB not initialized. Run 'python ingest_data.py' first.")
+    return index
+
+connect()
+
+
+def is_ready() -> bool:
+    return current_index() is not None
+
+
+def index_version() -> str | None:
+    index = current_index()
+    return index.version if index is not None else None
+
+
+def chunk_retrieval() -> bool:
+    """True when retrieval goes through conversation chunks (RETRIEVAL_MODE=chunks and the collection exists)."""
+    index = current_index()
+    return index is not None and index.chunk_store is not None
+
+
+def message_count() -> int:
+    """Messages in the collection (0 when the database is unavailable)."""
+    index = current_index()
+    return index.vector_store._collection.count() if index is not None else 0
+
+
+def search_user_chunks(user_name: str, query: str, k_chunks: int = CHUNK_RETRIEVE_K, max_messages: int = 10, index: Index | None = None) -> list[str]:
+    """
+    Searches the user's conversation chunks and expands each hit to its
+    messages: best chunk first, messages in time order within a chunk,
+    duplicates dropped, at most `max_messages`.
+    """
+    index = index or _require_index()
+    chunks = index.chunk_store.similarity_search(query, k=k_chunks, filter={"user_name": user_name})
+    ordered_ids = list(dict.fromkeys(i for chunk in chunks for i in child_ids(chunk.metadata)))[:max_messages]
+    if not ordered_ids:
+        return []
+    found = index.vector_store._collection.get(ids=ordered_ids, include=["documents"])
+    by_id = dict(zip(found["ids"], found["documents"]))
+    return [by_id[i] for i in ordered_ids if i in by_id]
+
+
+def retrieve_user_messages(user_name: str, query: str, k: int = 10) -> list[str]:
+    """A user's messages for `query`: via conversation chunks in chunks mode, else a direct search."""
+    index = _require_index()
+    if index.chunk_store is not None:
+        k_chunks = max(CHUNK_RETRIEVE_K, -(-k // max(1, CHUNK_WINDOW)))
+        return search_user_chunks(user_name, query, k_chunks=k_chunks, max_messages=k, index=index)
+    return [doc.page_content for doc in index.vector_store.similarity_search(query, k=k, filter={"user_name": user_name})]
+
+
+def user_filter(user_name: str, start: float | None = None, end: float | None = None, timestamps_indexed: bool = True) -> dict:
+    """Chroma `where` clause for one user's messages, optionally within [start, end] (epoch seconds)."""
+    clauses = [{"user_name": user_name}]
+    if timestamps_indexed and start is not None:
+        clauses.append({"timestamp_epoch": {"$gte": start}})
+    if timestamps_indexed and end is not None:
+        clauses.append({"timestamp_epoch": {"$lte": end}})
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+
+def metadata_epoch(metadata: dict) -> float | None:
+    """`timestamp_epoch`, or the raw timestamp parsed for collections built before it existed."""
+    epoch = metadata.get("timestamp_epoch")
+    return epoch if epoch is not None else to_epoch(metadata.get("timestamp"))
+
+
+def rerank_by_recency(scored_docs: list, k: int) -> list:
+    """
+    Re-orders (Document, cosine distance) pairs so that among similarly relevant
+    messages the newer ones come first, and keeps the top `k`.
+    """
+    epochs = [metadata_epoch(doc.metadata) for doc, _ in scored_docs]
+    known = [e for e in epochs if e is not None]
+    if not known:
+        return scored_docs[:k]
+    newest = max(known)
+    half_life_s = RECENCY_HALF_LIFE_DAYS * 86400
+    scored = []
+    for (doc, distance), epoch in zip(scored_docs, epochs):
+        boost = 0.5 ** ((newest - epoch) / half_life_s) if epoch is not None else 0.0
+        scored.append((1.0 - distance + RECENCY_WEIGHT * boost, doc, distance))
+    scored.sort(key=lambda item: item[0], reverse=True)
+    return [(doc, distance) for _, doc, distance in scored[:k]]
+
+
+def search_user_messages(
+    user_name: str,
+    query: str,
+    k: int = 10,
+    start_date: str | None = None,
+    end_date: str | None = None,
+    prefer_recent: bool = False,
+) -> list[str]:
+    """
+    The user's `k` messages most related to `query`, optionally limited to a
+    date range (YYYY, YYYY-MM, YYYY-MM-DD or full timestamps) and re-ranked
+    to favor newer messages.
+    """
+    index = _require_index()
+    timestamps_indexed = index.timestamps_indexed
+    start = parse_date_bound(start_date)
+    end = parse_date_bound(end_date, end=True)
+    ranged = start is not None or end is not None
+    fetch_k = k
+    if prefer_recent:
+        fetch_k = max(k, RECENCY_FETCH_K)
+    if ranged and not timestamps_indexed:
+        fetch_k = max(fetch_k, RECENCY_FETCH_K * 4)
+
+    scored_docs = index.vector_store.similarity_search_with_score(
+        query, k=fetch_k, filter=user_filter(user_name, start, end, timestamps_indexed)
     )
-    
-    print(f"Connecting to Vector DB at {DB_PATH}...")
-    # Connect to the database we already built with ingest_data.py
-    vector_store = Chroma(
-        persist_directory=DB_PATH,
-        embedding_function=embedding_func,
-        collection_name=COLLECTION_NAME
+    if ranged and not timestamps_indexed:
+        scored_docs = [
+            (doc, distance) for doc, distance in scored_docs
+            if (epoch := metadata_epoch(doc.metadata)) is not None
+            and (start is None or epoch >= start) and (end is None or epoch <= end)
+        ]
+    if prefer_recent:
+        scored_docs = rerank_by_recency(scored_docs, k)
+    return [doc.page_content for doc, _ in scored_docs[:k]]
+
+
+def query_user_messages(user_name: str, query_embedding: list[float], k: int, include_embeddings: bool = False) -> dict:
+    """
+    The `k` messages of `user_name` nearest to an already-embedded query,
+    read straight from the Chroma collection (optionally with their vectors).
+    """
+    include = ["documents", "distances"] + (["embeddings"] if include_embeddings else [])
+    result = _require_index().vector_store._collection.query(
+        query_embeddings=[query_embedding],
+        n_results=k,
+        where={"user_name": user_name},
+        include=include,
     )
-    
-    # Create a retriever that will be used by our tools
-    # We set k=10 to give the agent *plenty* of clues
-    retriever = vector_store.as_retriever(search_kwargs={"k": 10})
-    
-    print("ChromaDB Retriever is ready.")
-
-except Exception as e:
-    print(f"!!! FATAL ERROR connecting to ChromaDB: {e}")
-    print("!!! --- Have you run 'python ingest_data.py' first? --- !!!")
-    retriever = None
\ No newline at end of file
+    return {
+        "documents": result["documents"][0],
+        "distances": result["distances"][0],
+        "embeddings": result["embeddings"][0] if include_embeddings else None,
+    }
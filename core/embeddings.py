@@ -0,0 +1,179 @@
+import os
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+# --- Constants ---
+EMBED_MODEL = "all-MiniLM-L6-v2"
+HF_MODEL_ID = f"sentence-transformers/{EMBED_MODEL}"
+# all-MiniLM-L6-v2 was trained with a 256 word-piece window (same as sentence-transformers)
+MAX_SEQ_LENGTH = 256
+ONNX_MODEL_DIR = os.getenv("ONNX_MODEL_DIR", f"models/onnx/{EMBED_MODEL}")
+
+# Which backend computes the MiniLM vectors: torch | onnx | onnx-int8
+EMBED_BACKEND = os.getenv("EMBED_BACKEND", "torch").strip().strip('"').strip("'").lower()
+EMBED_BACKENDS = ("torch", "onnx", "onnx-int8")
+# Backends with interchangeable vectors: fp32 ONNX reproduces the torch ones
+_BACKEND_PRECISION = {"torch": "fp32", "onnx": "fp32", "onnx-int8": "int8"}
+
+
+def backends_compatible(built_with: str, query_backend: str) -> bool:
+    """True if queries embedded by `query_backend` can search vectors built by `built_with`."""
+    return _BACKEND_PRECISION.get(built_with, built_with) == _BACKEND_PRECISION.get(query_backend, query_backend)
+
+
+# --- One-time model export ---
+def export_onnx_model(model_dir: str = ONNX_MODEL_DIR) -> str:
+    """
+    Exports the PyTorch MiniLM encoder to `model_dir/model.onnx` (and saves
+    the tokenizer next to it). Only needed once; torch is not used afterwards.
+    """
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    onnx_path = os.path.join(model_dir, "model.onnx")
+    if os.path.exists(onnx_path):
+        return onnx_path
+
+    print(f"Exporting {HF_MODEL_ID} to ONNX at {onnx_path}...")
+    os.makedirs(model_dir, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(HF_MODEL_ID)
+    model = AutoModel.from_pretrained(HF_MODEL_ID)
+    model.eval()
+
+    class _Encoder(torch.nn.Module):
+        # Return only the token embeddings so the graph has a single plain output
+        def __init__(self, inner):
+            super().__init__()
+            self.inner = inner
+
+        def forward(self, input_ids, attention_mask, token_type_ids):
+            return self.inner(
+                input_ids=input_ids,
+                attention_mask=attention_mask,
+                token_type_ids=token_type_ids,
+            )[0]
+
+    dummy = tokenizer(["export"], return_tensors="pt")
+    dynamic_axes = {"batch": 0, "sequence": 1}
+    with torch.no_grad():
+        torch.onnx.export(
+            _Encoder(model),
+            (dummy["input_ids"], dummy["attention_mask"], dummy["token_type_ids"]),
+            onnx_path,
+            input_names=["input_ids", "attention_mask", "token_type_ids"],
+            output_names=["last_hidden_state"],
+            dynamic_axes={
+                "input_ids": {0: "batch", 1: "sequence"},
+                "attention_mask": {0: "batch", 1: "sequence"},
+                "token_type_ids": {0: "batch", 1: "sequence"},
+                "last_hidden_state": dynamic_axes,
+            },
+            opset_version=14,
+        )
+    tokenizer.save_pretrained(model_dir)
+    print("ONNX export complete.")
+    return onnx_path
+
+
+def quantize_onnx_model(model_dir: str = ONNX_MODEL_DIR) -> str:
+    """
+    Produces `model_dir/model.int8.onnx` with dynamic int8 weight quantization.
+    """
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    fp32_path = export_onnx_model(model_dir)
+    int8_path = os.path.join(model_dir, "model.int8.onnx")
+    if os.path.exists(int8_path):
+        return int8_path
+
+    print(f"Quantizing {fp32_path} to int8...")
+    quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+    print("Quantization complete.")
+    return int8_path
+
+
+# --- ONNX Runtime embedding backend ---
+class OnnxEmbeddings(Embeddings):
+    """
+    all-MiniLM-L6-v2 on ONNX Runtime (fp32 or int8).
+
+    Reproduces the sentence-transformers pipeline (mean pooling + L2 norm), so
+    fp32 vectors live in the same space as the ones `ingest_data.py` stores
+    with the torch backend. Also usable as a ChromaDB embedding function.
+    """
+    def __init__(self, quantized: bool = False, batch_size: int = 64, model_dir: str = ONNX_MODEL_DIR):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        self.model_path = quantize_onnx_model(model_dir) if quantized else export_onnx_model(model_dir)
+        self.quantized = quantized
+        self.batch_size = batch_size
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self._open_session()
+        # ONNX Runtime's thread pool does not survive fork(); pre-forked
+        # workers (serve.py) each open their own session
+        os.register_at_fork(after_in_child=self._open_session)
+        print(f"ONNX embedding model loaded from {self.model_path}.")
+
+    def _open_session(self):
+        import onnxruntime as ort
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        threads = os.getenv("ONNX_NUM_THREADS")
+        if threads:
+            options.intra_op_num_threads = int(threads)
+        self.session = ort.InferenceSession(
+            self.model_path, sess_options=options, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+    def _embed_batch(self, texts: list[str]) -> np.ndarray:
+        enc = self.tokenizer(
+            texts,
+            padding=True,
+            truncation=True,
+            max_length=MAX_SEQ_LENGTH,
+            return_tensors="np",
+        )
+        feeds = {k: v.astype(np.int64) for k, v in enc.items() if k in self.input_names}
+        token_embeddings = self.session.run(None, feeds)[0]
+
+        # Mean pooling over real (non-padding) tokens, then L2 normalize
+        mask = enc["attention_mask"][..., None].astype(np.float32)
+        summed = (token_embeddings * mask).sum(axis=1)
+        pooled = summed / np.clip(mask.sum(axis=1), 1e-9, None)
+        norms = np.linalg.norm(pooled, axis=1, keepdims=True)
+        return pooled / np.clip(norms, 1e-12, None)
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        if not texts:
+            return []
+        # Sort by length so each batch pads to a similar size, then restore order
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        vectors = [None] * len(texts)
+        for start in range(0, len(order), self.batch_size):
+            idx = order[start:start + self.batch_size]
+            for i, vec in zip(idx, self._embed_batch([texts[i] for i in idx])):
+                vectors[i] = vec.tolist()
+        return vectors
+
+    def embed_query(self, text: str) -> list[float]:
+        return self._embed_batch([text])[0].tolist()
+
+    # ChromaDB EmbeddingFunction protocol
+    def __call__(self, input: list[str]) -> list[list[float]]:
+        return self.embed_documents(list(input))
+
+
+def get_embedding_function(backend: str = EMBED_BACKEND) -> Embeddings:
+    """
+    Returns the LangChain embedding object for the configured backend.
+    """
+    if backend == "torch":
+        from langchain_huggingface import HuggingFaceEmbeddings
+        return HuggingFaceEmbeddings(model_name=EMBED_MODEL)
+    if backend == "onnx":
+        return OnnxEmbeddings(quantized=False)
+    if backend == "onnx-int8":
+        return OnnxEmbeddings(quantized=True)
+    raise ValueError(f"Unknown EMBED_BACKEND: {backend} (expected one of {EMBED_BACKENDS})")
@@ -0,0 +1,114 @@
+import os
+import re
+from collections import Counter, defaultdict
+
+# --- Constants ---
+# Minimum score for an evidence line to count as supported by the context
+EVIDENCE_MATCH_THRESHOLD = float(os.getenv("EVIDENCE_MATCH_THRESHOLD", "0.9"))
+# Fuzzy matches must be real sentences, not fragments such as a bare name
+EVIDENCE_MIN_CHARS = int(os.getenv("EVIDENCE_MIN_CHARS", "20"))
+EVIDENCE_MIN_TOKENS = int(os.getenv("EVIDENCE_MIN_TOKENS", "4"))
+NGRAM = 3
+# n-grams shared by more than this fraction of lines carry no signal for
+# finding the candidate line (e.g. "sent a message"), so they are not indexed
+MAX_POSTING_FRACTION = 0.5
+MAX_CANDIDATES = 3
+
+_BULLET = re.compile(r"^\s*(?:[-*•]|\d+[.)])\s*")
+_QUOTES = str.maketrans({"‘": "'", "’": "'", "“": '"', "”": '"'})
+_SPACES = re.compile(r"\s+")
+_DIGITS = re.compile(r"\d+")
+
+
+def normalize_line(line: str) -> str:
+    """
+    Canonical form used for matching: no list bullet, straight quotes removed,
+    lowercase, single spaces, no trailing period.
+    """
+    line = _BULLET.sub("", line.translate(_QUOTES))
+    line = line.replace('"', "").replace("'", "")
+    return _SPACES.sub(" ", line).strip().rstrip(".").lower()
+
+
+def digit_runs(text: str) -> list[str]:
+    """Every run of digits (phone parts, dates, counts), in order."""
+    return _DIGITS.findall(text)
+
+
+def _ngrams(text: str, n: int = NGRAM) -> set[str]:
+    if len(text) < n:
+        return {text} if text else set()
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+class EvidenceIndex:
+    """
+    Indexes the context's lines once so each evidence line can be checked in
+    time proportional to its own length instead of scanning the whole context.
+
+    Matching is tried in order:
+    - exact: the line appears verbatim (score 1.0)
+    - normalized: equal after `normalize_line`, e.g. a dropped "- " bullet (score 1.0)
+    - fuzzy: share of the evidence's character n-grams found in the best
+      candidate line (containment, so a verbatim fragment of a line scores 1.0).
+      Only for evidence of at least EVIDENCE_MIN_CHARS / EVIDENCE_MIN_TOKENS,
+      and only against lines containing every digit run of the evidence as a
+      whole run: n-grams barely see "555-123-9999" vs "555-123-4567" or
+      "14 people" vs "4 people", but those are different facts.
+    """
+    def __init__(self, context: str):
+        self.lines = [ln.strip() for ln in context.splitlines() if ln.strip()]
+        self.exact = {}
+        self.normalized = {}
+        self.line_grams = []
+        postings = defaultdict(list)
+        for i, line in enumerate(self.lines):
+            self.exact.setdefault(line, i)
+            norm = normalize_line(line)
+            self.normalized.setdefault(norm, i)
+            grams = _ngrams(norm)
+            self.line_grams.append(grams)
+            for gram in grams:
+                postings[gram].append(i)
+
+        limit = max(1, int(len(self.lines) * MAX_POSTING_FRACTION))
+        self.postings = {g: ids for g, ids in postings.items() if len(ids) <= limit}
+
+    def match(self, evidence: str) -> dict:
+        """Returns {"evidence", "score", "match", "line"} for one evidence line."""
+        evidence = evidence.strip()
+        if evidence in self.exact:
+            return {"evidence": evidence, "score": 1.0, "match": "exact", "line": evidence}
+
+        norm = normalize_line(evidence)
+        if norm in self.normalized:
+            return {"evidence": evidence, "score": 1.0, "match": "normalized", "line": self.lines[self.normalized[norm]]}
+
+        if len(norm) < EVIDENCE_MIN_CHARS or len(norm.split()) < EVIDENCE_MIN_TOKENS:
+            return {"evidence": evidence, "score": 0.0, "match": "too_short", "line": None}
+
+        numbers = digit_runs(norm)
+        grams = _ngrams(norm)
+        votes = Counter()
+        for gram in grams:
+            for i in self.postings.get(gram, ()):
+                votes[i] += 1
+        best_score, best_line = 0.0, None
+        for i, _ in votes.most_common(MAX_CANDIDATES):
+            line_numbers = set(digit_runs(normalize_line(self.lines[i])))
+            if not all(number in line_numbers for number in numbers):
+                continue
+            score = len(grams & self.line_grams[i]) / len(grams)
+            if score > best_score:
+                best_score, best_line = score, self.lines[i]
+        return {
+            "evidence": evidence,
+            "score": round(best_score, 4),
+            "match": "fuzzy" if best_line is not None else "none",
+            "line": best_line,
+        }
+
+    def validate(self, evidence_lines: list[str], threshold: float = EVIDENCE_MATCH_THRESHOLD) -> tuple[bool, list[dict]]:
+        """Scores every evidence line; valid only if all reach `threshold`."""
+        matches = [self.match(ev) for ev in evidence_lines]
+        return all(m["score"] >= threshold for m in matches), matches
@@ -0,0 +1,130 @@
+import os
+import threading
+from collections import OrderedDict
+from fuzzywuzzy import process
+from core.artifact import load_user_directory
+
+# --- Constants ---
+NLP_MODEL = os.getenv("NLP_MODEL", "en_core_web_sm")
+# Name extraction reads entities (ner) and part-of-speech tags (tagger +
+# attribute_ruler); the dependency parser and lemmatizer are never loaded
+NLP_EXCLUDE = ("parser", "lemmatizer")
+# Questions whose extracted names are remembered (the agent's router and its
+# get_user_messages tool look at the same question)
+NLP_CACHE_SIZE = int(os.getenv("NLP_CACHE_SIZE", "1024"))
+NLP_BATCH_SIZE = 64
+
+# This is the "ground truth" list of correct names; an index loaded from an
+# artifact (core/artifact.py) brings its own user directory, which wins
+KNOWN_USER_NAMES = [
+    user["user_name"] for user in load_user_directory() if user.get("user_name") not in (None, "Unknown")
+] or [
+    'Thiago Monteiro', 'Armand Dupont', "Lily O'Sullivan",
+    'Fatima El-Tahir', 'Sophia Al-Farsi', 'Layla Kawaguchi',
+    'Amina Van Den Berg', 'Lorenzo Cavalli', 'Vikram Desai',
+    'Hans Müller'
+]
+
+
+def load_pipeline(model: str = NLP_MODEL):
+    """The slimmed spaCy pipeline, or None if spaCy or the model is missing."""
+    try:
+        import spacy
+        pipeline = spacy.load(model, exclude=list(NLP_EXCLUDE))
+        print(f"spaCy pipeline '{model}' loaded with {pipeline.pipe_names}.")
+        return pipeline
+    except (ImportError, IOError):
+        print(f"FATAL: spaCy model '{model}' not found.")
+        print(f"Please run: python -m spacy download {model}")
+        return None
+
+
+# --- Load the shared pipeline at startup (once per process, shared by qa_system, tools and ingest) ---
+nlp = load_pipeline()
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _names_in_doc(doc, question: str) -> list[str]:
+    # Stage 1: Get all potential names (PERSON, ORG, PROPN)
+    entity_names = [ent.text for ent in doc.ents if ent.label_ in ("PERSON", "ORG")]
+    proper_nouns = [token.text for token in doc if token.pos_ == "PROPN"]
+    potential_names = []
+    if not entity_names and not proper_nouns:
+        potential_names = question.lower().replace("?", "").split()
+    names_list = set(entity_names + proper_nouns + potential_names)
+
+    # Stage 2: Find the best fuzzy match
+    users_in_question = []
+    for name in names_list:
+        possible_names_with_confidence = process.extractBests(
+            name,
+            KNOWN_USER_NAMES,
+            score_cutoff=70,
+            limit=5
+        )
+        users_in_question.extend(
+            [name for name, _ in possible_names_with_confidence]
+        )
+    return sorted(set(users_in_question))
+
+
+def _remember(question: str, names: list[str]):
+    with _cache_lock:
+        _cache[question] = names
+        _cache.move_to_end(question)
+        while len(_cache) > NLP_CACHE_SIZE:
+            _cache.popitem(last=False)
+
+
+def _cached(question: str) -> list[str] | None:
+    with _cache_lock:
+        names = _cache.get(question)
+        if names is not None:
+            _cache.move_to_end(question)
+        return names
+
+
+def find_names(question: str) -> list[str]:
+    """Known user names mentioned in `question` (typos allowed); empty if none or no pipeline."""
+    if nlp is None:
+        return []
+    names = _cached(question)
+    if names is None:
+        names = _names_in_doc(nlp(question), question)
+        _remember(question, names)
+    return list(names)
+
+
+def find_names_batch(questions: list[str], batch_size: int = NLP_BATCH_SIZE) -> list[list[str]]:
+    """`find_names` for many questions, running the pipeline over them with one nlp.pipe call."""
+    if nlp is None:
+        return [[] for _ in questions]
+    found = {}
+    todo = []
+    for question in questions:
+        names = _cached(question)
+        if names is not None:
+            found[question] = names
+        elif question not in found:
+            found[question] = None
+            todo.append(question)
+    for question, doc in zip(todo, nlp.pipe(todo, batch_size=batch_size)):
+        found[question] = _names_in_doc(doc, question)
+        _remember(question, found[question])
+    return [list(found[question]) for question in questions]
+
+
+def extract_user_name(question: str) -> list[str] | str:
+    """
+    Finds the most likely full user name(s) mentioned in a question.
+    Handles typos like 'Amona' or 'Vikrem'. Returns an "Error: ..." string
+    when no name is found.
+    """
+    if nlp is None:
+        return "Error: spaCy NER model not loaded."
+    names = find_names(question)
+    if names:
+        return names
+    return "Error: No user name found in question."
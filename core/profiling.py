@@ -0,0 +1,328 @@
+import os
+import sys
+import html
+import time
+import uuid
+import zlib
+import threading
+from collections import Counter
+
+# --- Constants ---
+# Sampling interval of on-demand profiles
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+# Continuous low-rate sampling for /admin/profile/hot (0 = off)
+PROFILE_CONTINUOUS_HZ = float(os.getenv("PROFILE_CONTINUOUS_HZ", "0"))
+# Longest on-demand profile, so a forgotten one cannot run forever
+PROFILE_MAX_S = float(os.getenv("PROFILE_MAX_S", "600"))
+# Modules summarized by the continuous hot-function table
+HOT_MODULES = ("qa_system", "core.", "tools", "generators.", "batch_qa", "question_router", "agent")
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STDLIB_PREFIX = os.path.dirname(os.__file__)
+
+
+def _is_app_file(filename: str) -> bool:
+    return filename.startswith(PROJECT_ROOT) and "site-packages" not in filename
+
+
+def _frame_label(frame) -> str:
+    """`module:function` for project code, `file:function` for libraries."""
+    code = frame.f_code
+    filename = code.co_filename
+    if _is_app_file(filename):
+        module = os.path.relpath(filename, PROJECT_ROOT)[:-3].replace(os.sep, ".")
+        return f"{module}:{code.co_name}"
+    return f"{os.path.basename(filename)}:{code.co_name}"
+
+
+def sample_stacks(skip: set) -> list[tuple[str, ...]]:
+    """
+    One sample: the stack (root first) of every thread running project code.
+    Threads with no project frame (idle pool workers, the server loop) and
+    workers blocked on an empty queue are left out.
+    """
+    stacks = []
+    for thread_id, frame in sys._current_frames().items():
+        if thread_id in skip:
+            continue
+        innermost = frame.f_code
+        if innermost.co_name == "get" and innermost.co_filename.startswith(STDLIB_PREFIX) and innermost.co_filename.endswith("queue.py"):
+            continue
+        labels, app = [], False
+        while frame is not None:
+            app = app or _is_app_file(frame.f_code.co_filename)
+            labels.append(_frame_label(frame))
+            frame = frame.f_back
+        if app:
+            stacks.append(tuple(reversed(labels)))
+    return stacks
+
+
+class Profile:
+    """An on-demand profile: of the next `requests` requests, or of `seconds` of wall time."""
+    def __init__(self, requests: int | None = None, seconds: float | None = None, interval_ms: float = PROFILE_INTERVAL_MS, lock=None):
+        self.id = uuid.uuid4().hex[:12]
+        # The lock the sampler holds while it updates `stacks` (the Profiler's)
+        self.lock = lock or threading.Lock()
+        self.requests = requests
+        self.seconds = min(seconds, PROFILE_MAX_S) if seconds else None
+        self.interval_s = max(0.001, interval_ms / 1000)
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.requests_started = 0
+        self.requests_done = 0
+        self.in_flight = 0
+        self.samples = 0
+        self.stacks = Counter()
+
+    @property
+    def done(self) -> bool:
+        return self.finished is not None
+
+    def collecting(self) -> bool:
+        """Request profiles only sample while one of their requests is running."""
+        return not self.done and (self.requests is None or self.in_flight > 0)
+
+    def expired(self, now: float) -> bool:
+        """Past PROFILE_MAX_S since it was created, even if its requests never came."""
+        return not self.done and now - self.created >= PROFILE_MAX_S
+
+    def snapshot(self) -> Counter:
+        """A copy of the sampled stacks, safe to render while sampling goes on."""
+        with self.lock:
+            return Counter(self.stacks)
+
+    def status(self) -> dict:
+        return {
+            "id": self.id,
+            "mode": "requests" if self.requests else "seconds",
+            "requests": self.requests,
+            "seconds": self.seconds,
+            "interval_ms": self.interval_s * 1000,
+            "requests_done": self.requests_done,
+            "samples": self.samples,
+            "started": self.started,
+            "finished": self.finished,
+            "done": self.done,
+        }
+
+    def folded(self) -> str:
+        """Collapsed stacks ("a;b;c count"), readable by flamegraph.pl and speedscope."""
+        return "".join(f"{';'.join(stack)} {count}\n" for stack, count in self.snapshot().most_common())
+
+    def top(self, limit: int = 30, sort: str = "self") -> list[dict]:
+        return top_functions(self.snapshot(), limit, sort=sort)
+
+
+def top_functions(stacks: Counter, limit: int = 30, prefixes: tuple[str, ...] | None = None, sort: str = "self") -> list[dict]:
+    """
+    cProfile-style table from sampled stacks: per function, the share of
+    samples where it was running (self) or on the stack (total), ordered by
+    `sort` ("self" or "total").
+    """
+    total_samples = sum(stacks.values()) or 1
+    own, inclusive = Counter(), Counter()
+    for stack, count in stacks.items():
+        own[stack[-1]] += count
+        for label in set(stack):
+            inclusive[label] += count
+    key = (lambda label: (own[label], inclusive[label])) if sort == "self" else (lambda label: (inclusive[label], own[label]))
+    rows = []
+    for label in sorted(inclusive, key=key, reverse=True):
+        count = inclusive[label]
+        if prefixes and not label.startswith(prefixes):
+            continue
+        rows.append({
+            "function": label,
+            "self_samples": own[label],
+            "total_samples": count,
+            "self_pct": round(100 * own[label] / total_samples, 2),
+            "total_pct": round(100 * count / total_samples, 2),
+        })
+        if len(rows) >= limit:
+            break
+    return rows
+
+
+class Profiler:
+    """
+    Sampling profiler for the running server: one background thread reads
+    every thread's stack with sys._current_frames(). It feeds the active
+    on-demand Profile and, with PROFILE_CONTINUOUS_HZ, a low-rate cumulative
+    table of hot functions. No code is instrumented; the sampled threads
+    are not slowed down beyond the GIL the sampler briefly takes.
+    """
+    def __init__(self, continuous_hz: float = PROFILE_CONTINUOUS_HZ):
+        self.continuous_interval_s = 1.0 / continuous_hz if continuous_hz > 0 else None
+        self.lock = threading.Lock()
+        self.profile = None
+        self.continuous = Counter()
+        self.continuous_since = time.time()
+        self._reset()
+        # The sampler thread does not survive fork(); pre-forked workers start their own
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self._thread = None
+        self._wake = threading.Event()
+
+    def ensure_running(self):
+        if self._thread is None and (self.continuous_interval_s or self.profile is not None):
+            with self.lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+                    self._thread.start()
+
+    def _interval(self) -> float | None:
+        profile = self.profile
+        if profile is not None and not profile.done:
+            return profile.interval_s
+        return self.continuous_interval_s
+
+    def _run(self):
+        skip = {threading.get_ident()}
+        next_continuous = time.monotonic()
+        while True:
+            interval = self._interval()
+            if interval is None:
+                self._wake.wait()
+                self._wake.clear()
+                continue
+            time.sleep(interval)
+            profile = self.profile
+            if profile is not None and profile.expired(time.time()):
+                with self.lock:
+                    profile.finished = time.time()
+            now = time.monotonic()
+            take_continuous = self.continuous_interval_s is not None and now >= next_continuous
+            collecting = profile is not None and profile.collecting()
+            if not (collecting or take_continuous):
+                continue
+            stacks = sample_stacks(skip)
+            with self.lock:
+                if collecting:
+                    profile.samples += 1
+                    profile.stacks.update(stacks)
+                    if time.time() - profile.started >= (profile.seconds or PROFILE_MAX_S):
+                        profile.finished = time.time()
+                if take_continuous:
+                    self.continuous.update(stacks)
+                    next_continuous = now + self.continuous_interval_s
+
+    def start(self, requests: int | None = None, seconds: float | None = None, interval_ms: float = PROFILE_INTERVAL_MS) -> Profile:
+        """Replaces any running profile with a new one."""
+        if not requests and not seconds:
+            raise ValueError("Give the number of requests or the number of seconds to profile.")
+        profile = Profile(requests=requests, seconds=None if requests else seconds, interval_ms=interval_ms, lock=self.lock)
+        if not requests:
+            profile.started = time.time()
+        with self.lock:
+            if self.profile is not None and not self.profile.done:
+                self.profile.finished = time.time()
+            self.profile = profile
+        self.ensure_running()
+        self._wake.set()
+        return profile
+
+    def stop(self) -> Profile | None:
+        with self.lock:
+            if self.profile is not None and not self.profile.done:
+                self.profile.finished = time.time()
+            return self.profile
+
+    def request_started(self) -> Profile | None:
+        """Counts a request towards the active request profile; returns it if the request is tracked."""
+        self.ensure_running()
+        with self.lock:
+            profile = self.profile
+            if profile is None or profile.done or not profile.requests or profile.requests_started >= profile.requests:
+                return None
+            profile.requests_started += 1
+            profile.in_flight += 1
+            if profile.started is None:
+                profile.started = time.time()
+            return profile
+
+    def request_finished(self, profile: Profile):
+        with self.lock:
+            profile.in_flight -= 1
+            profile.requests_done += 1
+            if profile.requests_done >= profile.requests:
+                profile.finished = time.time()
+
+    def hot(self, limit: int = 30, reset: bool = False) -> dict:
+        with self.lock:
+            result = {
+                "enabled": self.continuous_interval_s is not None,
+                "since": self.continuous_since,
+                "samples": sum(self.continuous.values()),
+                "functions": top_functions(self.continuous, limit, prefixes=HOT_MODULES, sort="total"),
+            }
+            if reset:
+                self.continuous = Counter()
+                self.continuous_since = time.time()
+        return result
+
+
+# --- Flame graph rendering ---
+FRAME_HEIGHT = 16
+SVG_WIDTH = 1200
+
+
+def _color(label: str) -> str:
+    # Stable warm colors: project frames ("module:function") yellow-orange, libraries ("file.py:function") red
+    h = zlib.crc32(label.encode("utf-8"))
+    if ".py:" not in label:
+        return f"rgb(230,{150 + h % 70},{40 + h % 40})"
+    return f"rgb({200 + h % 55},{70 + h % 70},{50 + h % 40})"
+
+
+def flamegraph_svg(stacks: Counter, title: str = "Flame graph") -> str:
+    """A static SVG flame graph of sampled stacks (root at the bottom, hover for details)."""
+    tree = {"count": 0, "children": {}}
+    for stack, count in stacks.items():
+        node = tree
+        node["count"] += count
+        for label in stack:
+            node = node["children"].setdefault(label, {"count": 0, "children": {}})
+            node["count"] += count
+    total = tree["count"] or 1
+
+    def depth(node) -> int:
+        return 1 + max((depth(child) for child in node["children"].values()), default=0)
+
+    levels = depth(tree) - 1
+    height = (levels + 2) * FRAME_HEIGHT + 30
+    rects = []
+
+    def draw(node, label, x, level):
+        width = SVG_WIDTH * node["count"] / total
+        if width < 0.5:
+            return
+        y = height - (level + 1) * FRAME_HEIGHT - 10
+        pct = 100 * node["count"] / total
+        text = html.escape(label)
+        rects.append(
+            f'<g><title>{text} ({node["count"]} samples, {pct:.1f}%)</title>'
+            f'<rect x="{x:.1f}" y="{y}" width="{width:.1f}" height="{FRAME_HEIGHT - 1}" fill="{_color(label)}"/>'
+            + (f'<text x="{x + 3:.1f}" y="{y + 11}">{html.escape(label[:int(width // 7)])}</text>' if width > 35 else "")
+            + "</g>"
+        )
+        child_x = x
+        for child_label, child in sorted(node["children"].items()):
+            draw(child, child_label, child_x, level + 1)
+            child_x += SVG_WIDTH * child["count"] / total
+
+    draw(tree, "all", 0.0, 0)
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{SVG_WIDTH}" height="{height}" '
+        f'font-family="monospace" font-size="11">'
+        f'<rect width="100%" height="100%" fill="#fafafa"/>'
+        f'<text x="{SVG_WIDTH / 2}" y="18" text-anchor="middle" font-size="14">{html.escape(title)}</text>'
+        + "".join(rects)
+        + "</svg>\n"
+    )
+
+
+profiler = Profiler()
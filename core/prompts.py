@@ -0,0 +1,82 @@
+# Prompt templates of answer_question. Kept free of imports with side
+# effects (models, databases, generators), so tools such as
+# scripts/benchmark_generators.py can build the exact production prompts.
+
+NO_INFO_ANSWER = "I do not have that information."
+CONTEXT_HEADER = "Here is the relevant information I found:\n"
+
+ANSWER_PROMPT = """
+    You are a professional assistant. Your task is to answer the user's question using ONLY the provided CONTEXT. Treat the CONTEXT as authoritative and complete for the purposes of this answer.
+
+    OUTPUT FORMAT (must follow exactly):
+    <Answer text>
+    Evidences:
+    <evidence line 1>
+    <evidence line 2>
+    ...
+
+    IMPORTANT RULES (must follow exactly):
+    1) Do NOT use or invent any information that is NOT present in the CONTEXT.
+    2) The Evidences section must list one or more exact context lines (verbatim) that support the Answer. Each evidence must appear on its own line after the `Evidences:` header.
+    3) If the answer is not present in the CONTEXT, respond exactly with the sentence: "I do not have that information." and nothing else.
+    4) Be concise. Keep the final answer to 1 sentence plus the Evidences section when applicable.
+
+    """
+
+INFERENCE_INSTRUCTIONS = """
+    You MAY include an optional `Inferences:` section placed BEFORE `Evidences:`. Each inference line MUST be prefixed with `INFERRED:` to mark it as speculative (for example: `INFERRED: Likely owns a car because they mention taking it to car service.`). Inferences are allowed but must be concise and clearly labeled. Evidence lines are still required and must come after `Evidences:`.
+
+    """
+
+# --- Structured (JSON) Output Mode ---
+ANSWER_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "answer": {"type": "string"},
+        "inferences": {"type": "array", "items": {"type": "string"}},
+        "evidence_ids": {"type": "array", "items": {"type": "integer"}},
+    },
+    "required": ["answer", "evidence_ids"],
+}
+
+STRUCTURED_PROMPT = """
+    You are a professional assistant. Answer the user's question using ONLY the numbered CONTEXT lines. Treat the CONTEXT as authoritative and complete for the purposes of this answer.
+
+    Respond with a single JSON object:
+    {"answer": "<one sentence>", "inferences": ["<optional speculative inference>"], "evidence_ids": [<ids of the CONTEXT lines that support the answer>]}
+
+    RULES:
+    1) Do NOT use or invent any information that is NOT present in the CONTEXT.
+    2) `evidence_ids` must list the [id] numbers of one or more CONTEXT lines that support the answer. Do not copy the lines.
+    3) If the answer is not present in the CONTEXT, set "answer" to "I do not have that information." and "evidence_ids" to [].
+    """
+
+
+def format_context(documents: list[str]) -> str:
+    """Retrieved messages as the prompt's CONTEXT block."""
+    context = CONTEXT_HEADER
+    for doc in documents:
+        context += f"- {doc}\n"
+    return context
+
+
+def build_answer_prompt(question: str, context: str, allow_inference: bool = True) -> str:
+    """The text-mode prompt; `allow_inference` adds the optional, labeled Inferences section."""
+    prompt_body = ANSWER_PROMPT + (INFERENCE_INSTRUCTIONS if allow_inference else "")
+    return f"""{prompt_body}\n**CONTEXT:**\n{context}\n\n**QUESTION:**\n{question}\n\n**ANSWER (follow rules above):**\n"""
+
+
+def number_context_lines(context: str) -> list[str]:
+    """The context's content lines (header and blanks dropped); [id] is position + 1."""
+    lines = [ln.strip() for ln in context.splitlines() if ln.strip()]
+    return [ln for ln in lines if not ln.startswith("Here is the relevant")]
+
+
+def build_structured_prompt(question: str, context_lines: list[str], allow_inference: bool = True) -> str:
+    """The JSON-mode prompt over numbered context lines (see `number_context_lines`)."""
+    numbered_context = "\n".join(f"[{i + 1}] {ln[2:] if ln.startswith('- ') else ln}" for i, ln in enumerate(context_lines))
+    instructions = STRUCTURED_PROMPT + (
+        "4) You MAY add short, clearly speculative `inferences`; otherwise use an empty list.\n"
+        if allow_inference else "4) `inferences` must be an empty list.\n"
+    )
+    return f"""{instructions}\n**CONTEXT:**\n{numbered_context}\n\n**QUESTION:**\n{question}\n\n**JSON ANSWER:**\n"""
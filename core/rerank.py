@@ -0,0 +1,145 @@
+import os
+import re
+import hashlib
+import threading
+from collections import Counter, OrderedDict
+
+# --- Constants ---
+RERANK_ENABLED = os.getenv("RERANK", "false").strip().lower() == "true"
+RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+# Candidates fetched per user for the re-ranker (cheap bi-encoder search)
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "30"))
+# Messages kept per user after re-ranking (what reaches the prompt)
+RERANK_TOP_K = int(os.getenv("RERANK_TOP_K", "4"))
+RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", "32"))
+RERANK_MAX_LENGTH = int(os.getenv("RERANK_MAX_LENGTH", "256"))
+# (query, message) scores kept in memory
+RERANK_CACHE_SIZE = int(os.getenv("RERANK_CACHE_SIZE", "20000"))
+# Sender of a stored message document ("On <ts>, user <name> sent a message: '...'")
+_DOCUMENT_USER = re.compile(r"^-?\s*On \S+, user (.+?) sent a message: ")
+
+
+class CrossEncoderReranker:
+    """
+    Second retrieval stage: scores (query, message) pairs jointly with a small
+    cross-encoder on CPU and keeps the best few. Scores are cached (LRU), so
+    follow-ups and repeated questions only score the pairs not seen before.
+    """
+    def __init__(self, model_name: str = RERANK_MODEL, batch_size: int = RERANK_BATCH_SIZE, cache_size: int = RERANK_CACHE_SIZE):
+        from sentence_transformers import CrossEncoder
+        print(f"Loading re-ranker: {model_name}...")
+        self.model = CrossEncoder(model_name, device="cpu", max_length=RERANK_MAX_LENGTH)
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(query: str, document: str) -> bytes:
+        h = hashlib.blake2b(digest_size=16)
+        h.update(query.encode("utf-8"))
+        h.update(b"\x00")
+        h.update(document.encode("utf-8"))
+        return h.digest()
+
+    def score(self, query: str, documents: list[str]) -> list[float]:
+        keys = [self._key(query, doc) for doc in documents]
+        scores = [None] * len(documents)
+        missing = []
+        with self.lock:
+            for i, key in enumerate(keys):
+                if key in self.cache:
+                    self.cache.move_to_end(key)
+                    scores[i] = self.cache[key]
+                else:
+                    missing.append(i)
+            self.hits += len(documents) - len(missing)
+            self.misses += len(missing)
+
+        if missing:
+            # Similar lengths in a batch means less padding
+            missing.sort(key=lambda i: len(documents[i]))
+            predicted = self.model.predict(
+                [(query, documents[i]) for i in missing],
+                batch_size=self.batch_size,
+                show_progress_bar=False,
+            )
+            with self.lock:
+                for i, value in zip(missing, predicted):
+                    scores[i] = float(value)
+                    self.cache[keys[i]] = scores[i]
+                while len(self.cache) > self.cache_size:
+                    self.cache.popitem(last=False)
+        return scores
+
+    def rerank(self, query: str, documents: list[str], top_k: int, group=None) -> list[str]:
+        """
+        The `top_k` documents by cross-encoder score (duplicates dropped), best
+        first. With `group` (document -> key), `top_k` applies to each group.
+        """
+        documents = list(dict.fromkeys(documents))
+        if len(documents) <= 1:
+            return documents[:top_k]
+        scores = self.score(query, documents)
+        order = sorted(range(len(documents)), key=lambda i: scores[i], reverse=True)
+        if group is None:
+            return [documents[i] for i in order[:top_k]]
+        kept = Counter()
+        result = []
+        for i in order:
+            key = group(documents[i])
+            if kept[key] < top_k:
+                kept[key] += 1
+                result.append(documents[i])
+        return result
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "model": self.model_name,
+            "cached_pairs": len(self.cache),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+_reranker = None
+_reranker_lock = threading.Lock()
+
+def get_reranker() -> CrossEncoderReranker | None:
+    """The shared re-ranker when RERANK=true (loaded on first use), else None."""
+    global _reranker
+    if not RERANK_ENABLED:
+        return None
+    if _reranker is None:
+        with _reranker_lock:
+            if _reranker is None:
+                _reranker = CrossEncoderReranker()
+    return _reranker
+
+
+def candidate_k(k: int) -> int:
+    """How many messages per user to fetch: the re-rank budget when enabled, else `k`."""
+    return max(k, RERANK_CANDIDATES) if RERANK_ENABLED else k
+
+
+def document_user(document: str) -> str | None:
+    """The user who sent a stored message document, or None if it has another shape."""
+    match = _DOCUMENT_USER.match(document)
+    return match.group(1) if match else None
+
+
+def rerank(query: str, documents: list[str]) -> list[str]:
+    """
+    Keeps the best RERANK_TOP_K messages of each user, so one user with
+    strong matches cannot crowd the others out of the prompt; a no-op when
+    re-ranking is off.
+    """
+    reranker = get_reranker()
+    if reranker is None or not documents:
+        return documents
+    return reranker.rerank(query, documents, RERANK_TOP_K, group=document_user)
@@ -0,0 +1,237 @@
+import os
+import time
+import threading
+from collections import OrderedDict, deque
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+
+# --- Constants ---
+# Queue generation and retrieval by priority class and client (false = run everything immediately)
+SCHEDULER = os.getenv("SCHEDULER", "true").strip().strip('"').strip("'").lower() == "true"
+# Priority classes, highest first. Interactive users get most of the capacity;
+# batch work (/ask/batch, scripted sweeps) uses what is left.
+PRIORITIES = ("interactive", "batch")
+DEFAULT_PRIORITY = "interactive"
+# Concurrent generations / retrievals across all classes
+SCHED_GENERATION_SLOTS = int(os.getenv("SCHED_GENERATION_SLOTS", "4"))
+SCHED_RETRIEVAL_SLOTS = int(os.getenv("SCHED_RETRIEVAL_SLOTS", "8"))
+# Share of the slots handed out when several classes are waiting, e.g. 4:1
+SCHED_WEIGHTS = os.getenv("SCHED_WEIGHTS", "interactive:4,batch:1")
+# Most slots batch work may hold at once, so a new interactive request never
+# waits behind a full house of bulk jobs (0 = all but one slot)
+SCHED_BATCH_MAX_SLOTS = int(os.getenv("SCHED_BATCH_MAX_SLOTS", "0"))
+# A request waiting longer than this for a slot fails instead of hanging
+SCHED_QUEUE_TIMEOUT_S = float(os.getenv("SCHED_QUEUE_TIMEOUT_S", "300"))
+# Per-endpoint default priority; an X-Priority header overrides it
+SCHED_ENDPOINT_PRIORITIES = os.getenv(
+    "SCHED_ENDPOINT_PRIORITIES", "/ask:interactive,/ask/batch:batch,/agent/ask:interactive,/agent/stream:interactive"
+)
+
+
+def _parse_pairs(value: str) -> dict[str, str]:
+    pairs = {}
+    for item in value.split(","):
+        key, sep, val = item.strip().rpartition(":")
+        if sep and key:
+            pairs[key.strip()] = val.strip().lower()
+    return pairs
+
+
+def normalize_priority(value: str | None) -> str | None:
+    """A known priority class name, or None."""
+    value = (value or "").strip().lower()
+    return value if value in PRIORITIES else None
+
+
+WEIGHTS = {p: max(1, int(w)) for p, w in _parse_pairs(SCHED_WEIGHTS).items() if p in PRIORITIES}
+ENDPOINT_PRIORITIES = {
+    path: priority for path, priority in _parse_pairs(SCHED_ENDPOINT_PRIORITIES).items() if normalize_priority(priority)
+}
+
+
+def endpoint_priority(path: str, header: str | None = None) -> str:
+    """Priority of a request: a valid X-Priority header, else the endpoint's default."""
+    return normalize_priority(header) or ENDPOINT_PRIORITIES.get(path, DEFAULT_PRIORITY)
+
+
+# --- Request context ---
+# (priority, client id) of the request being served; threads started with a
+# copy of the context (LangGraph nodes, batch workers) inherit it
+_request = ContextVar("scheduler_request", default=(DEFAULT_PRIORITY, "anonymous"))
+# Schedulers whose slot the current request already holds (nested calls do not queue again)
+_held = ContextVar("scheduler_held", default=frozenset())
+
+
+@contextmanager
+def request_context(priority: str | None, client: str | None = None):
+    """Tags the work done inside the block with a priority class and client id."""
+    token = _request.set((normalize_priority(priority) or DEFAULT_PRIORITY, client or "anonymous"))
+    try:
+        yield
+    finally:
+        _request.reset(token)
+
+
+def current_request() -> tuple[str, str]:
+    return _request.get()
+
+
+class SchedulerTimeout(RuntimeError):
+    """No slot became free within the queue timeout."""
+
+
+class _Ticket:
+    __slots__ = ("priority", "client", "granted", "event")
+
+    def __init__(self, priority: str, client: str):
+        self.priority = priority
+        self.client = client
+        self.granted = False
+        self.event = threading.Event()
+
+
+class FairScheduler:
+    """
+    Hands out `slots` concurrency slots to waiting requests.
+
+    - Priority classes share the slots by weight when several are waiting
+      (stride scheduling: each grant advances the class's pass by 1/weight,
+      and the waiting class with the lowest pass goes next), so batch work
+      still progresses but interactive requests get most grants.
+    - `limits` caps the slots a class may hold at once; by default batch
+      leaves one slot free for interactive arrivals.
+    - Within a class, clients are served round-robin, so one client's burst
+      queues behind its own requests rather than everyone else's.
+    """
+    def __init__(self, name: str, slots: int, weights: dict | None = None, limits: dict | None = None):
+        self.name = name
+        self.slots = max(1, slots)
+        self.weights = {p: (weights or WEIGHTS).get(p, 1) for p in PRIORITIES}
+        batch_max = SCHED_BATCH_MAX_SLOTS or self.slots - 1
+        default_limits = {p: self.slots for p in PRIORITIES}
+        default_limits["batch"] = max(1, min(self.slots, batch_max))
+        self.limits = {**default_limits, **(limits or {})}
+        self.lock = threading.Lock()
+        self.in_flight = {p: 0 for p in PRIORITIES}
+        self.queues = {p: OrderedDict() for p in PRIORITIES}
+        self.passes = {p: 0.0 for p in PRIORITIES}
+        self.granted = {p: 0 for p in PRIORITIES}
+        self.timeouts = 0
+        self.wait_s = {p: 0.0 for p in PRIORITIES}
+
+    def _waiting(self, priority: str) -> int:
+        return sum(len(q) for q in self.queues[priority].values())
+
+    def _dispatch(self):
+        """Grants free slots to waiting tickets. Caller holds the lock."""
+        while sum(self.in_flight.values()) < self.slots:
+            eligible = [
+                p for p in PRIORITIES
+                if self.queues[p] and self.in_flight[p] < self.limits[p]
+            ]
+            if not eligible:
+                return
+            # Lowest pass wins; ties go to the higher priority (PRIORITIES order)
+            priority = min(eligible, key=lambda p: (self.passes[p], PRIORITIES.index(p)))
+            self.passes[priority] += 1.0 / self.weights[priority]
+            clients = self.queues[priority]
+            client, tickets = next(iter(clients.items()))
+            ticket = tickets.popleft()
+            if tickets:
+                clients.move_to_end(client)
+            else:
+                del clients[client]
+            ticket.granted = True
+            self.in_flight[priority] += 1
+            self.granted[priority] += 1
+            ticket.event.set()
+
+    def _enqueue(self, ticket: _Ticket):
+        queue = self.queues[ticket.priority]
+        if not queue:
+            # A class that was idle joins at the current pass instead of
+            # spending credit saved up while it had nothing to run
+            active = [self.passes[p] for p in PRIORITIES if self.queues[p] or self.in_flight[p]]
+            if active:
+                self.passes[ticket.priority] = max(self.passes[ticket.priority], min(active))
+        queue.setdefault(ticket.client, deque()).append(ticket)
+
+    def _cancel(self, ticket: _Ticket):
+        queue = self.queues[ticket.priority]
+        tickets = queue.get(ticket.client)
+        if tickets is not None:
+            tickets.remove(ticket)
+            if not tickets:
+                del queue[ticket.client]
+
+    def acquire(self, priority: str, client: str, timeout: float | None = SCHED_QUEUE_TIMEOUT_S):
+        ticket = _Ticket(priority, client)
+        started = time.monotonic()
+        with self.lock:
+            self._enqueue(ticket)
+            self._dispatch()
+        if not ticket.event.wait(timeout):
+            with self.lock:
+                if not ticket.granted:
+                    self._cancel(ticket)
+                    self.timeouts += 1
+                    raise SchedulerTimeout(f"No {self.name} slot free after {timeout:g}s ({priority} request).")
+        with self.lock:
+            self.wait_s[priority] += time.monotonic() - started
+
+    def release(self, priority: str):
+        with self.lock:
+            self.in_flight[priority] -= 1
+            self._dispatch()
+
+    @contextmanager
+    def slot(self, timeout: float | None = SCHED_QUEUE_TIMEOUT_S):
+        """Holds one slot for the current request's priority class and client."""
+        held = _held.get()
+        if self.name in held:
+            yield
+            return
+        priority, client = _request.get()
+        self.acquire(priority, client, timeout)
+        token = _held.set(held | {self.name})
+        try:
+            yield
+        finally:
+            _held.reset(token)
+            self.release(priority)
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "slots": self.slots,
+                "limits": dict(self.limits),
+                "in_flight": dict(self.in_flight),
+                "waiting": {p: self._waiting(p) for p in PRIORITIES},
+                "granted": dict(self.granted),
+                "mean_wait_s": {
+                    p: round(self.wait_s[p] / self.granted[p], 4) if self.granted[p] else 0.0 for p in PRIORITIES
+                },
+                "timeouts": self.timeouts,
+            }
+
+
+generation_scheduler = FairScheduler("generation", SCHED_GENERATION_SLOTS)
+retrieval_scheduler = FairScheduler("retrieval", SCHED_RETRIEVAL_SLOTS)
+
+
+def generation_slot():
+    """Context manager holding a generation slot (a no-op with SCHEDULER=false)."""
+    return generation_scheduler.slot() if SCHEDULER else nullcontext()
+
+
+def retrieval_slot():
+    """Context manager holding a retrieval slot (a no-op with SCHEDULER=false)."""
+    return retrieval_scheduler.slot() if SCHEDULER else nullcontext()
+
+
+def scheduler_stats() -> dict:
+    return {
+        "enabled": SCHEDULER,
+        "generation": generation_scheduler.stats(),
+        "retrieval": retrieval_scheduler.stats(),
+    }
@@ -0,0 +1,131 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+import numpy as np
+from core.db import chunk_retrieval, embedding_func, index_version, query_user_messages, retrieve_user_messages
+
+# --- Constants ---
+# Candidates fetched per user when a conversation (re)queries Chroma
+SESSION_CANDIDATES_K = int(os.getenv("SESSION_CANDIDATES_K", "100"))
+# Extra angle (radians) tolerated when deciding a follow-up is still covered
+# by the cached candidates. 0 (default) guarantees the same top-k as a fresh
+# search; a positive slack trades exactness for fewer Chroma queries
+SESSION_REUSE_SLACK = float(os.getenv("SESSION_REUSE_SLACK", "0"))
+SESSION_TTL_S = float(os.getenv("SESSION_TTL_S", "1800"))
+SESSION_MAX = int(os.getenv("SESSION_MAX", "1000"))
+
+
+def _unit(vec) -> np.ndarray:
+    vec = np.asarray(vec, dtype=np.float32)
+    return vec / max(float(np.linalg.norm(vec)), 1e-12)
+
+
+class CandidateSet:
+    """
+    A user's messages nearest to the query that fetched them (the anchor).
+    Every message outside the set is less similar to the anchor than `radius`.
+    """
+    def __init__(self, anchor, documents: list[str], embeddings, complete: bool, version: str | None = None):
+        self.anchor = _unit(anchor)
+        # Index version the candidates came from; a hot-swapped index invalidates them
+        self.version = version
+        self.documents = documents
+        self.embeddings = np.asarray(embeddings, dtype=np.float32).reshape(len(documents), -1)
+        self.embeddings /= np.clip(np.linalg.norm(self.embeddings, axis=1, keepdims=True), 1e-12, None)
+        # A set holding all of the user's messages covers every query
+        self.radius = -1.0 if complete or not documents else float((self.embeddings @ self.anchor).min())
+
+    def top_k(self, query, k: int) -> tuple[list[str], bool]:
+        """
+        Local re-rank of the cached messages for `query`, and whether the set
+        still covers it. By the triangle inequality on angles, no message
+        outside the set can beat the k-th cached one if
+        angle(k-th) <= angle(radius) - angle(query, anchor).
+        """
+        sims = self.embeddings @ query
+        order = np.argsort(-sims)[:k]
+        docs = [self.documents[i] for i in order]
+        if self.radius <= -1.0:
+            return docs, True
+        if len(order) < k:
+            return docs, False
+        kth_angle = np.arccos(np.clip(sims[order[-1]], -1.0, 1.0))
+        drift = np.arccos(np.clip(float(self.anchor @ query), -1.0, 1.0))
+        bound = np.arccos(np.clip(self.radius, -1.0, 1.0)) - drift + SESSION_REUSE_SLACK
+        return docs, bool(kth_angle <= bound)
+
+
+class ConversationSession:
+    """Users resolved so far in a conversation and their cached candidates."""
+    def __init__(self):
+        self.user_names = []
+        self.candidates = {}
+        # Question -> embedding computed ahead of time (batch runs embed all questions at once)
+        self.query_embeddings = {}
+        self.last_used = time.monotonic()
+        self.lock = threading.Lock()
+
+    def resolve_users(self, user_names) -> list[str]:
+        """New names replace the remembered ones; no names means a follow-up about the same users."""
+        if isinstance(user_names, list) and user_names:
+            self.user_names = list(user_names)
+        return list(self.user_names)
+
+    def retrieve(self, user_names: list[str], question: str, k: int = 10) -> list[str]:
+        """Top-k messages per user, from the cache when it covers the question, else from Chroma."""
+        if chunk_retrieval():
+            # Candidate sets hold message vectors and cannot stand in for a
+            # chunk search, so chunk mode retrieves as sessionless requests do
+            return [doc for user_name in user_names for doc in retrieve_user_messages(user_name, question, k=k)]
+        precomputed = self.query_embeddings.get(question)
+        query = _unit(precomputed if precomputed is not None else embedding_func.embed_query(question))
+        results = []
+        version = index_version()
+        with self.lock:
+            for user_name in user_names:
+                cached = self.candidates.get(user_name)
+                if cached is not None and cached.version == version:
+                    docs, covered = cached.top_k(query, k)
+                    if covered:
+                        print(f"--- Session: reusing {len(cached.documents)} cached candidates for {user_name} ---")
+                        results.extend(docs)
+                        continue
+                found = query_user_messages(user_name, query.tolist(), SESSION_CANDIDATES_K, include_embeddings=True)
+                self.candidates[user_name] = CandidateSet(
+                    query,
+                    found["documents"],
+                    found["embeddings"],
+                    complete=len(found["documents"]) < SESSION_CANDIDATES_K,
+                    version=version,
+                )
+                results.extend(found["documents"][:k])
+        return results
+
+
+class SessionStore:
+    """In-process LRU of conversation sessions with idle expiry."""
+    def __init__(self, max_sessions: int = SESSION_MAX, ttl_s: float = SESSION_TTL_S):
+        self.max_sessions = max_sessions
+        self.ttl_s = ttl_s
+        self.sessions = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, session_id: str) -> ConversationSession:
+        now = time.monotonic()
+        with self.lock:
+            session = self.sessions.pop(session_id, None)
+            if session is None or now - session.last_used > self.ttl_s:
+                session = ConversationSession()
+            session.last_used = now
+            self.sessions[session_id] = session
+            while len(self.sessions) > self.max_sessions:
+                self.sessions.popitem(last=False)
+            return session
+
+    def discard(self, session_id: str) -> None:
+        with self.lock:
+            self.sessions.pop(session_id, None)
+
+
+sessions = SessionStore()
@@ -0,0 +1,52 @@
+import re
+import calendar
+from datetime import datetime, timezone
+
+# Questions about the current / latest state, where newer messages should win
+RECENCY_RE = re.compile(
+    r"\b(latest|most recent(ly)?|recent(ly)?|newest|current(ly)?|now|still|these days|nowadays|last (time|mentioned|said|asked))\b",
+    re.IGNORECASE,
+)
+
+
+def to_epoch(value) -> float | None:
+    """ISO-8601 timestamp (as stored in the source data) -> UTC epoch seconds; None if unparseable."""
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        parsed = datetime.fromisoformat(str(value).strip().replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+def parse_date_bound(value: str | None, end: bool = False) -> float | None:
+    """
+    A date filter bound as epoch seconds. Accepts "2025", "2025-03",
+    "2025-03-14" or a full timestamp; with `end=True` a partial date means
+    the end of that year / month / day.
+    """
+    if not value:
+        return None
+    value = str(value).strip()
+    match = re.fullmatch(r"(\d{4})(?:-(\d{1,2}))?(?:-(\d{1,2}))?", value)
+    if not match:
+        epoch = to_epoch(value)
+        if epoch is None:
+            raise ValueError(f"Unrecognized date '{value}'. Use YYYY, YYYY-MM or YYYY-MM-DD.")
+        return epoch
+    year, month, day = int(match.group(1)), match.group(2), match.group(3)
+    if not end:
+        start = datetime(year, int(month or 1), int(day or 1), tzinfo=timezone.utc)
+        return start.timestamp()
+    month = int(month or 12)
+    day = int(day or calendar.monthrange(year, month)[1])
+    return datetime(year, month, day, 23, 59, 59, 999999, tzinfo=timezone.utc).timestamp()
+
+
+def wants_recent(question: str) -> bool:
+    return bool(RECENCY_RE.search(question))
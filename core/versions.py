@@ -0,0 +1,95 @@
+import os
+import json
+import time
+import uuid
+
+# --- Constants ---
+DB_PATH = "chroma_db"
+# Pointer to the live index version, replaced atomically by ingest_data.py
+ACTIVE_FILE = "ACTIVE"
+# Versions kept after a new build is activated (the active one included), so
+# queries still running on the previous version can finish
+INDEX_KEEP_VERSIONS = int(os.getenv("INDEX_KEEP_VERSIONS", "2"))
+SEPARATOR = "__"
+
+
+def new_version() -> str:
+    """Sortable, unique build id, e.g. 20251019T120000-3f2a1c."""
+    return time.strftime("%Y%m%dT%H%M%S", time.gmtime()) + "-" + uuid.uuid4().hex[:6]
+
+
+def versioned_name(base: str, version: str | None) -> str:
+    """Collection name of `base` in `version`; no version is the pre-versioning layout."""
+    return f"{base}{SEPARATOR}{version}" if version else base
+
+
+def active_path(db_path: str = DB_PATH) -> str:
+    return os.path.join(db_path, ACTIVE_FILE)
+
+
+def read_active(db_path: str = DB_PATH) -> dict | None:
+    """
+    The active pointer: {"version", "messages", "chunks", "analytics", ...},
+    or None for a database built before versioning (plain "messages").
+    """
+    try:
+        with open(active_path(db_path), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        print(f"Warning: could not read {active_path(db_path)}: {e}")
+        return None
+
+
+def activate(pointer: dict, db_path: str = DB_PATH) -> None:
+    """Switches readers to a fully built version (write a temp file, then rename over ACTIVE)."""
+    path = active_path(db_path)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(pointer, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def _version_of(name: str, bases: tuple[str, ...]) -> str | None:
+    """The version of a collection name ("" for an unversioned base), None if unrelated."""
+    for base in bases:
+        if name == base:
+            return ""
+        if name.startswith(base + SEPARATOR):
+            return name[len(base) + len(SEPARATOR):]
+    return None
+
+
+def collect_garbage(client, bases: tuple[str, ...], keep: int = INDEX_KEEP_VERSIONS, db_path: str = DB_PATH) -> list[str]:
+    """
+    Deletes versions older than the active one beyond the newest `keep`
+    (counting the active one), with their analytics files. Versions newer
+    than the active one may still be building and are left alone. Returns
+    the deleted versions.
+    """
+    active = (read_active(db_path) or {}).get("version")
+    if not active:
+        return []
+    names = [getattr(c, "name", c) for c in client.list_collections()]
+    by_version = {}
+    for name in names:
+        version = _version_of(name, bases)
+        if version is not None:
+            by_version.setdefault(version, []).append(name)
+
+    # Ids sort by build time; the unversioned layout ("") is the oldest
+    older = sorted((v for v in by_version if v < active), reverse=True)
+    deleted = []
+    for version in older[max(0, keep - 1):]:
+        for name in by_version[version]:
+            client.delete_collection(name=name)
+        analytics = os.path.join(db_path, f"{versioned_name('messages', version)}.parquet")
+        if version and os.path.exists(analytics):
+            os.remove(analytics)
+        deleted.append(version or "(unversioned)")
+    if deleted:
+        print(f"Deleted old index version(s): {', '.join(deleted)}")
+    return deleted
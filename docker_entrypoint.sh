@@ -4,8 +4,20 @@ set -e
 # Working dir is /app in the Dockerfile
 cd /app
 
-# If chroma_db is not mounted or empty, run ingest_data.py to populate it
-if [ ! -d "./chroma_db" ] || [ -z "$(ls -A ./chroma_db 2>/dev/null || true)" ]; then
+# If chroma_db is not mounted or empty, populate it: from a prebuilt index
+# artifact when INDEX_ARTIFACT (path or URL) is set, else by running ingest_data.py
+_loaded_artifact=false
+if [ -n "${INDEX_ARTIFACT:-}" ] && { [ ! -d "./chroma_db" ] || [ -z "$(ls -A ./chroma_db 2>/dev/null || true)" ]; }; then
+  echo "Chroma DB missing or empty — loading index artifact ${INDEX_ARTIFACT}"
+  if python -m scripts.index_artifact load "${INDEX_ARTIFACT}"; then
+    _loaded_artifact=true
+  else
+    echo "Loading the index artifact failed; falling back to ingest_data.py." >&2
+  fi
+fi
+if [ "$_loaded_artifact" = "true" ]; then
+  echo "Index artifact loaded — skipping ingest"
+elif [ ! -d "./chroma_db" ] || [ -z "$(ls -A ./chroma_db 2>/dev/null || true)" ]; then
   echo "Chroma DB missing or empty — running ingest_data.py"
   # Run ingestion; if it fails, print but continue to attempt to start the app
   if python ingest_data.py; then
@@ -68,5 +80,10 @@ if [ "${OLLAMA_AUTO_SERVE:-""}" = "true" ]; then
   fi
 fi
 
-# Finally exec uvicorn so signals propagate correctly
+# Finally exec the server so signals propagate correctly.
+# SERVE_MODE=prefork loads the models once and forks SERVE_WORKERS workers that
+# share them copy-on-write (serve.py); the default is a single uvicorn process.
+if [ "${SERVE_MODE:-}" = "prefork" ]; then
+  exec python serve.py --host 0.0.0.0 --port 8000 --workers "${SERVE_WORKERS:-$(nproc)}"
+fi
 exec uvicorn main:app --host 0.0.0.0 --port 8000
@@ -9,21 +9,49 @@ raw_model = os.getenv("GENERATOR_MODEL", "litellm")
 # Strip surrounding whitespace and any surrounding single/double quotes
 MODEL_TYPE = raw_model.strip().strip('"').strip("'").lower()
 
-if MODEL_TYPE == "gemini":
-    print("Using Gemini Generator.")
-    from .gemini import GeminiGenerator
-    generator = GeminiGenerator()
-elif MODEL_TYPE == "huggingface":
-    print("Using Hugging Face Generator.")
-    from .huggingface import HuggingFaceGenerator
-    generator = HuggingFaceGenerator()
-elif MODEL_TYPE == "litellm":
-    print("Using LiteLLM Generator.")
-    from .litellm import LiteLLMGenerator
-    MODEL_NAME = os.getenv(
-        "LITELLM_MODEL_NAME", 
-        "ollama/llama3.1:8b"
-    )
-    generator = LiteLLMGenerator(model_name=MODEL_NAME)
-else:
-    raise ValueError(f"Unknown GENERATOR_MODEL type in .env: {MODEL_TYPE}")
\ No newline at end of file
+
+def build_generator(model_type: str):
+    """Instantiate the generator backend named by `model_type`."""
+    if model_type == "gemini":
+        print("Using Gemini Generator.")
+        from .gemini import GeminiGenerator
+        return GeminiGenerator()
+    elif model_type == "huggingface":
+        print("Using Hugging Face Generator.")
+        from .huggingface import HuggingFaceGenerator
+        return HuggingFaceGenerator()
+    elif model_type == "litellm":
+        print("Using LiteLLM Generator.")
+        from .litellm import LiteLLMGenerator
+        MODEL_NAME = os.getenv(
+            "LITELLM_MODEL_NAME",
+            "ollama/llama3.1:8b"
+        )
+        return LiteLLMGenerator(model_name=MODEL_NAME)
+    elif model_type == "mock":
+        print("Using Mock Generator.")
+        from .mock import MockGenerator
+        return MockGenerator()
+    elif model_type == "router":
+        print("Using Router Generator.")
+        from .router import RouterGenerator
+        names = [n.strip().lower() for n in os.getenv("ROUTER_BACKENDS", "litellm").split(",") if n.strip()]
+        if "router" in names:
+            raise ValueError("ROUTER_BACKENDS cannot contain 'router'.")
+        hedge_after = float(os.getenv("ROUTER_HEDGE_AFTER_S", "0")) or None
+        return RouterGenerator(
+            {name: build_generator(name) for name in names},
+            hedge_after_s=hedge_after,
+            failure_threshold=int(os.getenv("ROUTER_FAILURE_THRESHOLD", "3")),
+            cooldown_s=float(os.getenv("ROUTER_COOLDOWN_S", "30")),
+        )
+    else:
+        raise ValueError(f"Unknown GENERATOR_MODEL type in .env: {model_type}")
+
+
+# Queue generations by priority (SCHEDULER, on by default), then optionally wrap
+# in the persistent prompt -> completion cache (GENERATOR_CACHE=true), so
+# cache hits never wait for a slot
+from .cache import maybe_cached
+from .scheduled import maybe_scheduled
+generator = maybe_cached(maybe_scheduled(build_generator(MODEL_TYPE)))
@@ -1,9 +1,34 @@
+def is_error_response(text) -> bool:
+    """Our generators report failures as strings starting with 'Error:'."""
+    return not isinstance(text, str) or text.startswith("Error:")
+
+
 class BaseGenerator:
     """
     Abstract base class for a generator model.
     """
+    def __init__(self, model_name: str = "unknown", decoding_config: dict | None = None):
+        # Identify the model and its decoding settings (used e.g. as cache keys).
+        self.model_name = model_name
+        self.decoding_config = dict(decoding_config or {})
+
     def generate(self, prompt: str) -> str:
         """
         Takes a full prompt and returns a string answer.
         """
-        raise NotImplementedError
\ No newline at end of file
+        raise NotImplementedError
+
+    def stream(self, prompt: str):
+        """
+        Yields the answer in pieces as the model produces them. Backends that
+        cannot stream yield the whole answer once.
+        """
+        yield self.generate(prompt)
+
+    def generate_structured(self, prompt: str, schema: dict) -> str:
+        """
+        Like `generate`, but asks for a JSON object matching `schema`.
+        Backends with constrained decoding override this; the default relies
+        on the prompt alone.
+        """
+        return self.generate(prompt)
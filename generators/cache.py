@@ -0,0 +1,164 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from .base import BaseGenerator, is_error_response
+
+# --- Constants ---
+CACHE_PATH = os.getenv("GENERATOR_CACHE_PATH", "cache/generations.sqlite")
+CACHE_MAX_ENTRIES = int(os.getenv("GENERATOR_CACHE_MAX_ENTRIES", "5000"))
+CACHE_MAX_MB = float(os.getenv("GENERATOR_CACHE_MAX_MB", "256"))
+
+
+def is_deterministic(config: dict) -> bool:
+    """
+    True when the decoding config always gives the same answer for a prompt
+    (temperature 0 or greedy decoding). Router configs are nested per backend.
+    """
+    if config and all(isinstance(v, dict) for v in config.values()):
+        return all(is_deterministic(v) for v in config.values())
+    return config.get("temperature") == 0 or config.get("do_sample") is False
+
+
+class CachedGenerator(BaseGenerator):
+    """
+    Persistent prompt -> completion cache around any BaseGenerator.
+
+    Entries are keyed on (model name, decoding config, sha256 of the prompt)
+    and stored in SQLite, so they survive restarts and are shared between
+    processes. The least recently used entries are evicted once the cache
+    exceeds `max_entries` or `max_mb`. Only deterministic configs are cached
+    unless `cache_sampled` is set; error answers are never cached.
+    """
+    def __init__(
+        self,
+        inner: BaseGenerator,
+        path: str = CACHE_PATH,
+        max_entries: int = CACHE_MAX_ENTRIES,
+        max_mb: float = CACHE_MAX_MB,
+        cache_sampled: bool = False,
+    ):
+        super().__init__(inner.model_name, inner.decoding_config)
+        self.inner = inner
+        self.max_entries = max_entries
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.enabled = cache_sampled or is_deterministic(inner.decoding_config)
+        self.hits = 0
+        self.misses = 0
+        self.path = path
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._connect()
+        # An SQLite connection must not be shared across fork(); pre-forked
+        # workers (serve.py) each reconnect
+        os.register_at_fork(after_in_child=self._connect)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS generations (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                completion TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                last_used REAL NOT NULL,
+                hits INTEGER NOT NULL DEFAULT 0
+            )"""
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_generations_last_used ON generations(last_used)")
+        self.conn.commit()
+        if self.enabled:
+            print(f"Generation cache enabled at {path} for model {self.model_name}.")
+        else:
+            print(f"Generation cache disabled for {self.model_name}: decoding is not deterministic.")
+
+    def _connect(self):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+
+    def cache_key(self, prompt: str, **extra) -> str:
+        prompt_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        identity = json.dumps(
+            {"model": self.model_name, "config": self.decoding_config, "prompt": prompt_hash, **extra},
+            sort_keys=True,
+            default=str,
+        )
+        return hashlib.sha256(identity.encode("utf-8")).hexdigest()
+
+    def _lookup(self, key: str) -> str | None:
+        with self.lock:
+            row = self.conn.execute("SELECT completion FROM generations WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.conn.execute(
+                "UPDATE generations SET last_used = ?, hits = hits + 1 WHERE key = ?",
+                (time.time(), key),
+            )
+            self.conn.commit()
+            return row[0]
+
+    def _store(self, key: str, completion: str):
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO generations (key, model, completion, size, created, last_used) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, self.model_name, completion, len(completion.encode("utf-8")), now, now),
+            )
+            self._evict()
+            self.conn.commit()
+
+    def _evict(self):
+        """Drop least recently used rows until both bounds hold."""
+        count, total = self.conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM generations").fetchone()
+        while count > self.max_entries or (self.max_bytes and total > self.max_bytes):
+            # Evict in chunks of ~10% to keep eviction rare
+            n = max(1, count // 10)
+            self.conn.execute(
+                "DELETE FROM generations WHERE key IN (SELECT key FROM generations ORDER BY last_used ASC LIMIT ?)",
+                (n,),
+            )
+            count, total = self.conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM generations").fetchone()
+
+    def _cached(self, key: str, produce) -> str:
+        if not self.enabled:
+            return produce()
+        completion = self._lookup(key)
+        if completion is not None:
+            return completion
+        completion = produce()
+        if not is_error_response(completion):
+            self._store(key, completion)
+        return completion
+
+    def generate(self, prompt: str) -> str:
+        return self._cached(self.cache_key(prompt), lambda: self.inner.generate(prompt))
+
+    def generate_structured(self, prompt: str, schema: dict) -> str:
+        return self._cached(
+            self.cache_key(prompt, schema=schema),
+            lambda: self.inner.generate_structured(prompt, schema),
+        )
+
+    def stats(self) -> dict:
+        with self.lock:
+            entries, total = self.conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM generations").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "entries": entries,
+            "size_mb": round(total / (1024 * 1024), 3),
+        }
+
+
+def maybe_cached(generator: BaseGenerator) -> BaseGenerator:
+    """Wrap `generator` in a CachedGenerator when GENERATOR_CACHE=true."""
+    if os.getenv("GENERATOR_CACHE", "false").strip().strip('"').strip("'").lower() != "true":
+        return generator
+    cache_sampled = os.getenv("GENERATOR_CACHE_SAMPLED", "false").strip().lower() == "true"
+    return CachedGenerator(generator, cache_sampled=cache_sampled)
@@ -17,13 +17,14 @@ safety_settings = [
 
 class GeminiGenerator(BaseGenerator):
     def __init__(self):
+        super().__init__(os.getenv("GOOGLE_MODEL", "gemini-2.5-flash"), generation_config)
         try:
             API_KEY = os.getenv("GOOGLE_API_KEY")
             if not API_KEY:
                 raise ValueError("GOOGLE_API_KEY not found in .env file")
             genai.configure(api_key=API_KEY)
             self.model = genai.GenerativeModel(
-                model_name=os.getenv("GOOGLE_MODEL", "gemini-2.5-flash"),
+                model_name=self.model_name,
                 generation_config=generation_config,
                 safety_settings=safety_settings
             )
@@ -40,4 +41,33 @@ class GeminiGenerator(BaseGenerator):
             return response.text
         except Exception as e:
             print(f"Error calling Gemini API: {e}")
-            return f"Error: Could not generate answer from Gemini. (Reason: {e})"
\ No newline at end of file
+            return f"Error: Could not generate answer from Gemini. (Reason: {e})"
+
+    def stream(self, prompt: str):
+        if self.model is None:
+            yield "Error: Gemini model is not initialized."
+            return
+        try:
+            for chunk in self.model.generate_content(prompt, stream=True):
+                if chunk.text:
+                    yield chunk.text
+        except Exception as e:
+            print(f"Error calling Gemini API: {e}")
+            yield f"Error: Could not generate answer from Gemini. (Reason: {e})"
+
+    def generate_structured(self, prompt: str, schema: dict) -> str:
+        if self.model is None:
+            return "Error: Gemini model is not initialized."
+        try:
+            response = self.model.generate_content(
+                prompt,
+                generation_config={
+                    **generation_config,
+                    "response_mime_type": "application/json",
+                    "response_schema": schema,
+                },
+            )
+            return response.text
+        except Exception as e:
+            print(f"Error calling Gemini API: {e}")
+            return f"Error: Could not generate answer from Gemini. (Reason: {e})"
@@ -1,4 +1,5 @@
-from transformers import AutoTokenizer, AutoModelForSeq2SeqLM
+from threading import Thread
+from transformers import AutoTokenizer, AutoModelForSeq2SeqLM, TextIteratorStreamer
 import torch
 from .base import BaseGenerator
 
@@ -6,6 +7,8 @@ device = "cuda" if torch.cuda.is_available() else "cpu"
 
 class HuggingFaceGenerator(BaseGenerator):
     def __init__(self, model_name="google/flan-t5-base"):
+        # Greedy decoding, so identical prompts give identical answers
+        super().__init__(model_name, {"max_length": 1024, "max_new_tokens": 100, "do_sample": False})
         try:
             print(f"Initializing local T5 model: {model_name}...")
             self.tokenizer = AutoTokenizer.from_pretrained(model_name)
@@ -73,4 +76,32 @@ class HuggingFaceGenerator(BaseGenerator):
                 return "Error: Could not generate answer from local model."
         else:
             return self.generate_with_cpu(prompt)
-        
+
+    def stream(self, prompt: str, device: str = device):
+        """Yields decoded text as `generate` runs in a background thread (TextIteratorStreamer)."""
+        if self.model is None or self.tokenizer is None:
+            yield "Error: Hugging Face model is not initialized."
+            return
+        enc = self.tokenizer(prompt, return_tensors="pt", max_length=1024, truncation=True)
+        self.model.to(device)
+        streamer = TextIteratorStreamer(self.tokenizer, skip_special_tokens=True)
+        errors = []
+
+        def run():
+            try:
+                with torch.no_grad():
+                    self.model.generate(**enc.to(device), max_new_tokens=100, streamer=streamer)
+            except Exception as e:
+                errors.append(e)
+                # Unblock the consumer, which would otherwise wait for text forever
+                streamer.end()
+
+        worker = Thread(target=run, daemon=True)
+        worker.start()
+        for text in streamer:
+            if text:
+                yield text
+        worker.join()
+        if errors:
+            print(f"Error streaming from local T5 model: {errors[0]}")
+            yield "Error: Could not generate answer from local model."
@@ -0,0 +1,246 @@
+import os
+import json
+import time
+import threading
+import urllib.error
+import urllib.request
+
+# --- Constants ---
+OLLAMA_HOST = os.getenv("OLLAMA_HOST", "http://localhost:11434")
+# Manage the Ollama models the app uses: pull, warm and keep them resident (false = leave it to Ollama)
+OLLAMA_LIFECYCLE = os.getenv("OLLAMA_LIFECYCLE", "true").strip().strip('"').strip("'").lower() == "true"
+# How long Ollama keeps a model loaded after a request ("30m", "1h", "-1" = forever).
+# Every warmup and probe renews it, so with probes more frequent than this the
+# model never unloads while the app is up.
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+OLLAMA_AUTO_PULL = os.getenv("OLLAMA_AUTO_PULL", "true").strip().lower() == "true"
+OLLAMA_PROBE_INTERVAL_S = float(os.getenv("OLLAMA_PROBE_INTERVAL_S", "60"))
+OLLAMA_PROBE_TIMEOUT_S = float(os.getenv("OLLAMA_PROBE_TIMEOUT_S", "30"))
+# Pulling or loading a large model can take minutes
+OLLAMA_LOAD_TIMEOUT_S = float(os.getenv("OLLAMA_LOAD_TIMEOUT_S", "600"))
+PROBE_PROMPT = "ping"
+
+
+def ollama_model(model_name: str) -> str | None:
+    """The Ollama model of a litellm-style name ("ollama/mistral" -> "mistral"), else None."""
+    provider, sep, model = model_name.partition("/")
+    return model if sep and provider in ("ollama", "ollama_chat") else None
+
+
+def keep_alive_seconds(value: str) -> float | None:
+    """Seconds in an Ollama keep_alive ("30m", "1h", "90s", "300"); None for "forever" or unparseable."""
+    value = str(value).strip().lower()
+    units = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+    unit = next((u for u in ("ms", "s", "m", "h") if value.endswith(u)), "")
+    try:
+        seconds = float(value[:len(value) - len(unit)]) * units.get(unit, 1)
+    except ValueError:
+        return None
+    return seconds if seconds > 0 else None
+
+
+def _base_url(host: str) -> str:
+    host = host.strip().rstrip("/")
+    return host if "://" in host else f"http://{host}"
+
+
+class ModelHealth:
+    """Lifecycle state of one model: pending -> pulling -> loading -> ready (or unavailable)."""
+    def __init__(self, name: str):
+        self.name = name
+        self.status = "pending"
+        self.error = None
+        self.load_ms = None
+        self.probe_ms = None
+        self.last_probe = None
+        self.next_probe = 0.0
+        self.loads = 0
+        self.failures = 0
+
+    @property
+    def ready(self) -> bool:
+        return self.status == "ready"
+
+    def to_dict(self) -> dict:
+        return {
+            "status": self.status,
+            "ready": self.ready,
+            "error": self.error,
+            "load_ms": self.load_ms,
+            "probe_ms": self.probe_ms,
+            "last_probe": self.last_probe,
+            "loads": self.loads,
+            "failures": self.failures,
+        }
+
+
+class OllamaLifecycle:
+    """
+    Keeps the app's Ollama models pulled, loaded and warm, off the request path.
+
+    A background thread pulls missing models (OLLAMA_AUTO_PULL) and loads each
+    one with an empty generate request carrying `keep_alive`. Every
+    `probe_interval_s` it checks /api/ps. A model that is still resident gets
+    a one-token generation, which measures latency and renews its keep-alive.
+    A model Ollama has unloaded anyway (restart, memory pressure) is loaded
+    again before a user request has to wait for it. `status()` reports
+    per-model readiness for the /ready endpoint.
+    """
+    def __init__(
+        self,
+        host: str = OLLAMA_HOST,
+        keep_alive: str = OLLAMA_KEEP_ALIVE,
+        probe_interval_s: float = OLLAMA_PROBE_INTERVAL_S,
+        auto_pull: bool = OLLAMA_AUTO_PULL,
+    ):
+        self.base_url = _base_url(host)
+        self.keep_alive = keep_alive
+        # Probe at least twice per keep-alive period, so a probe always renews it in time
+        keep_alive_s = keep_alive_seconds(keep_alive)
+        self.probe_interval_s = min(probe_interval_s, keep_alive_s / 2) if keep_alive_s else probe_interval_s
+        self.auto_pull = auto_pull
+        self.models = {}
+        self.lock = threading.Lock()
+        self._reset()
+        # The thread does not survive fork(); each pre-forked worker starts its own
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self._thread = None
+        self._wake = threading.Event()
+
+    def _request(self, path: str, body: dict | None = None, timeout: float = OLLAMA_PROBE_TIMEOUT_S) -> dict:
+        data = json.dumps(body).encode("utf-8") if body is not None else None
+        request = urllib.request.Request(
+            self.base_url + path, data=data, headers={"Content-Type": "application/json"},
+            method="POST" if body is not None else "GET",
+        )
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return json.loads(response.read() or b"{}")
+
+    def register(self, name: str) -> ModelHealth:
+        """Adds a model to manage; the background thread (if started) warms it right away."""
+        with self.lock:
+            health = self.models.get(name)
+            if health is None:
+                health = self.models[name] = ModelHealth(name)
+        self._wake.set()
+        return health
+
+    def _is_present(self, name: str) -> bool:
+        try:
+            self._request("/api/show", {"model": name})
+            return True
+        except urllib.error.HTTPError as e:
+            if e.code == 404:
+                return False
+            raise
+
+    def _load(self, name: str, health: ModelHealth):
+        health.status = "loading"
+        started = time.perf_counter()
+        # An empty prompt only loads the model into memory
+        self._request("/api/generate", {"model": name, "prompt": "", "stream": False, "keep_alive": self.keep_alive}, timeout=OLLAMA_LOAD_TIMEOUT_S)
+        health.load_ms = round((time.perf_counter() - started) * 1000, 1)
+        health.loads += 1
+
+    def prepare(self, name: str) -> ModelHealth:
+        """
+        Makes `name` ready now (pull if missing, then load). Blocking; scripts
+        call it before their first request, the background thread for the app.
+        """
+        health = self.register(name)
+        try:
+            if not self._is_present(name):
+                if not self.auto_pull:
+                    raise RuntimeError(f"model '{name}' is not pulled and OLLAMA_AUTO_PULL=false")
+                health.status = "pulling"
+                print(f"Ollama: pulling {name}...")
+                self._request("/api/pull", {"model": name, "stream": False}, timeout=OLLAMA_LOAD_TIMEOUT_S)
+            self._load(name, health)
+            health.status, health.error = "ready", None
+            health.next_probe = time.monotonic() + self.probe_interval_s
+            print(f"Ollama: {name} loaded and warm ({health.load_ms} ms, keep_alive={self.keep_alive}).")
+        except Exception as e:
+            self._failed(health, e)
+        return health
+
+    def prepare_registered(self) -> bool:
+        """
+        Prepares every registered model that is not ready yet. For entry points
+        that never start the background thread (scripts/batch_ask.py,
+        test_agent.py); returns True when all of them are ready.
+        """
+        with self.lock:
+            names = [name for name, health in self.models.items() if not health.ready]
+        return all([self.prepare(name).ready for name in names])
+
+    def _failed(self, health: ModelHealth, error: Exception):
+        health.status, health.error = "unavailable", str(error)
+        health.failures += 1
+        # Retry soon after the first failures, then every probe interval while the model stays down
+        health.next_probe = time.monotonic() + min(self.probe_interval_s, 5.0 * health.failures)
+        print(f"Ollama: {health.name} unavailable at {self.base_url}: {error}")
+
+    def probe(self, name: str) -> ModelHealth:
+        """Reloads the model if Ollama unloaded it, else times a one-token generation."""
+        health = self.register(name)
+        try:
+            resident = self._resident()
+            if name not in resident and f"{name}:latest" not in resident:
+                print(f"Ollama: {name} is no longer loaded; reloading.")
+                return self.prepare(name)
+            started = time.perf_counter()
+            self._request("/api/generate", {
+                "model": name, "prompt": PROBE_PROMPT, "stream": False,
+                "keep_alive": self.keep_alive, "options": {"num_predict": 1},
+            })
+            health.probe_ms = round((time.perf_counter() - started) * 1000, 1)
+            health.last_probe = time.time()
+            health.status, health.error = "ready", None
+            health.next_probe = time.monotonic() + self.probe_interval_s
+        except Exception as e:
+            self._failed(health, e)
+        return health
+
+    def _resident(self) -> set:
+        names = set()
+        for model in self._request("/api/ps").get("models", []):
+            names.update(n for n in (model.get("name"), model.get("model")) if n)
+        return names
+
+    def _run(self):
+        while True:
+            with self.lock:
+                models = list(self.models.values())
+            now = time.monotonic()
+            for health in models:
+                if health.status == "pending":
+                    self.prepare(health.name)
+                elif now >= health.next_probe:
+                    self.probe(health.name)
+            with self.lock:
+                waits = [h.next_probe - time.monotonic() for h in self.models.values() if h.status != "pending"]
+            self._wake.wait(max(0.5, min(waits, default=self.probe_interval_s)))
+            self._wake.clear()
+
+    def start(self):
+        """Starts the background thread (idempotent). Warmup happens there, not at import."""
+        with self.lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="ollama-lifecycle", daemon=True)
+                self._thread.start()
+
+    def status(self) -> dict:
+        with self.lock:
+            models = {name: health.to_dict() for name, health in self.models.items()}
+        return {
+            "ready": all(m["ready"] for m in models.values()),
+            "enabled": OLLAMA_LIFECYCLE,
+            "host": self.base_url,
+            "keep_alive": self.keep_alive,
+            "models": models,
+        }
+
+
+ollama_lifecycle = OllamaLifecycle()
@@ -2,7 +2,7 @@ import os
 from .base import BaseGenerator
 from litellm import completion
 from dotenv import load_dotenv
-import ollama
+from .lifecycle import OLLAMA_LIFECYCLE, ollama_lifecycle, ollama_model
 # Load the .env file to get API keys
 load_dotenv()
 
@@ -11,21 +11,21 @@ class LiteLLMGenerator(BaseGenerator):
     A universal generator using litellm to call any model.
     Handles Ollama, HuggingFace, Gemini, etc.
     """
-    def __init__(self, model_name: str):
-        self.model_name = model_name
+    def __init__(self, model_name: str, temperature: float | None = None):
+        # Optional fixed temperature; unset leaves it to the provider. LITELLM_TEMPERATURE=0
+        # gives deterministic answers, which GENERATOR_CACHE can then cache
+        if temperature is None and os.getenv("LITELLM_TEMPERATURE"):
+            temperature = float(os.getenv("LITELLM_TEMPERATURE"))
+        self.temperature = temperature
+        super().__init__(model_name, {"temperature": temperature} if temperature is not None else {})
         print(f"LiteLLM Generator initialized. Using model: {self.model_name}")
         self.provider = self.model_name.split("/")[0]
         print(self.model_name, self.provider)
         print(f"Provider detected: {self.provider}")
-        if self.provider == "ollama":
-            try:
-                print("Checking for model presence via Ollama...")
-                ollama.show(self.model_name.split("/")[-1])
-                print(f"Model {self.model_name} is present locally.")
-            except: 
-                print(f"Model {self.model_name} not found locally. Pulling...")
-                ollama.pull(self.model_name.split("/")[-1])
-                print(f"Model {self.model_name} pulled successfully.")
+        # Pulling and warming the model happens in the background (generators/lifecycle.py),
+        # not here: this constructor runs while `generators` is being imported
+        if OLLAMA_LIFECYCLE and ollama_model(self.model_name):
+            ollama_lifecycle.register(ollama_model(self.model_name))
 
         # Set the HUGGINGFACE_API_KEY in the environment for litellm
         # This is the correct way to auth for HF models
@@ -33,9 +33,10 @@ class LiteLLMGenerator(BaseGenerator):
              print("Warning: HUGGINGFACE_API_KEY not set in .env for Hugging Face model.")
 
 
-    def generate(self, prompt: str) -> str:
+    def generate(self, prompt: str, **kwargs) -> str:
         """
         Takes a full prompt and returns a string answer.
+        Extra keyword arguments are passed to `litellm.completion`.
         """
         try:
             # if self.model_name in ["mistral", "llama3"]: # Add any local models here
@@ -47,7 +48,9 @@ class LiteLLMGenerator(BaseGenerator):
                     messages=[
                         {"content": prompt, "role": "user"}
                     ],
-                    api_key=os.getenv("HUGGINGFACE_API_KEY")
+                    api_key=os.getenv("HUGGINGFACE_API_KEY"),
+                    **self.decoding_config,
+                    **kwargs
                 )
             else:
                 response = completion(
@@ -55,6 +58,8 @@ class LiteLLMGenerator(BaseGenerator):
                     messages=[
                         {"content": prompt, "role": "user"}
                     ],
+                    **self.decoding_config,
+                    **kwargs
                 )
             
             content = (
@@ -70,4 +75,40 @@ class LiteLLMGenerator(BaseGenerator):
             print("If using HuggingFace, is the model public or is your key valid?")
             print(e)
             print("-----------------------------------")
-            return "Error: Could not generate answer."
\ No newline at end of file
+            return "Error: Could not generate answer."
+
+    def stream(self, prompt: str, **kwargs):
+        """Yields the answer's content deltas (litellm `stream=True`)."""
+        if self.provider == "huggingface":
+            kwargs.setdefault("api_key", os.getenv("HUGGINGFACE_API_KEY"))
+        try:
+            response = completion(
+                model=self.model_name,
+                messages=[
+                    {"content": prompt, "role": "user"}
+                ],
+                stream=True,
+                **self.decoding_config,
+                **kwargs
+            )
+            for chunk in response:
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    yield delta
+        except Exception as e:
+            print(f"--- !!! LITELLM ERROR !!! ---")
+            print(f"Error streaming from model {self.model_name}: {e} with provider {self.provider}")
+            yield "Error: Could not generate answer."
+
+    def generate_structured(self, prompt: str, schema: dict) -> str:
+        """
+        Constrained JSON decoding via `response_format`; litellm maps it to
+        Ollama's `format` parameter for local models.
+        """
+        return self.generate(
+            prompt,
+            response_format={
+                "type": "json_schema",
+                "json_schema": {"name": "answer", "schema": schema},
+            },
+        )
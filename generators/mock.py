@@ -0,0 +1,49 @@
+import os
+import re
+import time
+import threading
+from .base import BaseGenerator
+
+# --- Constants ---
+# Simulated prefill (time to first token) and decode speed
+MOCK_TTFT_MS = float(os.getenv("MOCK_TTFT_MS", "150"))
+MOCK_TOKENS_PER_S = float(os.getenv("MOCK_TOKENS_PER_S", "40"))
+# Requests decoded at the same time, like Ollama's OLLAMA_NUM_PARALLEL; the rest queue
+MOCK_PARALLEL = int(os.getenv("MOCK_PARALLEL", "4"))
+_TOKEN = re.compile(r"\S+\s*|\s+")
+
+
+class MockGenerator(BaseGenerator):
+    """
+    Local stand-in for a model server, for benchmarks and offline runs.
+
+    Answers in the production format (first context line as the evidence)
+    after `ttft_ms`, then emits word-sized tokens at `tokens_per_s`. At most
+    `parallel` requests run at once, so concurrency behaves like a real
+    server with a fixed number of decode slots.
+    """
+    def __init__(self, ttft_ms: float = MOCK_TTFT_MS, tokens_per_s: float = MOCK_TOKENS_PER_S, parallel: int = MOCK_PARALLEL):
+        super().__init__("mock", {"temperature": 0})
+        self.ttft_s = ttft_ms / 1000
+        self.token_s = 1.0 / tokens_per_s if tokens_per_s > 0 else 0.0
+        self.slots = threading.Semaphore(max(1, parallel))
+        print(f"Mock Generator initialized ({ttft_ms:g} ms to first token, {tokens_per_s:g} tokens/s, {parallel} parallel).")
+
+    @staticmethod
+    def answer_for(prompt: str) -> str:
+        context = prompt.split("**CONTEXT:**", 1)[-1].split("**QUESTION:**", 1)[0]
+        evidence = next((ln.strip() for ln in context.splitlines() if ln.strip().startswith("- ")), None)
+        if evidence is None:
+            return "I do not have that information."
+        return f"The context answers this question.\nEvidences:\n{evidence}"
+
+    def stream(self, prompt: str):
+        with self.slots:
+            time.sleep(self.ttft_s)
+            for n, token in enumerate(_TOKEN.findall(self.answer_for(prompt))):
+                if n:
+                    time.sleep(self.token_s)
+                yield token
+
+    def generate(self, prompt: str) -> str:
+        return "".join(self.stream(prompt))
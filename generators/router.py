@@ -0,0 +1,182 @@
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from .base import BaseGenerator, is_error_response
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures. While open, the
+    backend is skipped; after `cooldown_s` a single trial request is let
+    through (half-open) and its outcome closes or re-opens the breaker.
+    """
+    def __init__(self, failure_threshold: int = 3, cooldown_s: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.cooldown_s = cooldown_s
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.cooldown_s:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half-open" and not self.trial_in_flight:
+            self.trial_in_flight = True
+            return True
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self.trial_in_flight = False
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+
+class _Backend:
+    def __init__(self, name: str, generator: BaseGenerator, breaker: CircuitBreaker):
+        self.name = name
+        self.generator = generator
+        self.breaker = breaker
+        self.in_flight = 0
+        self.latency_ewma = 0.0
+
+
+class RouterGenerator(BaseGenerator):
+    """
+    Wraps several generator backends behind the BaseGenerator interface.
+
+    - Dispatch: the healthy backend with the fewest in-flight requests wins
+      (ties broken by recent latency).
+    - Hedging: if `hedge_after_s` is set and the first backend has not answered
+      by then, the same prompt is also sent to the next backend; the first
+      good answer is returned.
+    - Fallback: a failed answer moves on to the next backend.
+    - Circuit breakers: backends that keep failing are skipped for a while.
+    """
+    def __init__(
+        self,
+        backends: dict[str, BaseGenerator],
+        hedge_after_s: float | None = None,
+        failure_threshold: int = 3,
+        cooldown_s: float = 30.0,
+        max_workers: int = 16,
+    ):
+        if not backends:
+            raise ValueError("RouterGenerator needs at least one backend.")
+        self.backends = [
+            _Backend(name, gen, CircuitBreaker(failure_threshold, cooldown_s))
+            for name, gen in backends.items()
+        ]
+        super().__init__(
+            "router(" + ",".join(b.name for b in self.backends) + ")",
+            {b.name: b.generator.decoding_config for b in self.backends},
+        )
+        self.hedge_after_s = hedge_after_s
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="router")
+        print(f"Router Generator initialized with backends: {[b.name for b in self.backends]}")
+
+    def _pick(self, exclude: set) -> _Backend | None:
+        """Reserve the least-loaded backend whose breaker lets a request through."""
+        with self.lock:
+            candidates = sorted(
+                (b for b in self.backends if b.name not in exclude and b.breaker.state != "open"),
+                key=lambda b: (b.in_flight, b.latency_ewma),
+            )
+            for backend in candidates:
+                if backend.breaker.allow():
+                    backend.in_flight += 1
+                    return backend
+        return None
+
+    def _call(self, backend: _Backend, prompt: str, schema: dict | None) -> str:
+        start = time.monotonic()
+        try:
+            if schema is None:
+                result = backend.generator.generate(prompt)
+            else:
+                result = backend.generator.generate_structured(prompt, schema)
+        except Exception as e:
+            print(f"Router: backend '{backend.name}' raised: {e}")
+            result = f"Error: {e}"
+        elapsed = time.monotonic() - start
+        with self.lock:
+            backend.in_flight -= 1
+            if is_error_response(result):
+                backend.breaker.record_failure()
+            else:
+                backend.breaker.record_success()
+                backend.latency_ewma = elapsed if backend.latency_ewma == 0 else 0.8 * backend.latency_ewma + 0.2 * elapsed
+        return result
+
+    def generate(self, prompt: str) -> str:
+        return self._route(prompt, None)
+
+    def generate_structured(self, prompt: str, schema: dict) -> str:
+        return self._route(prompt, schema)
+
+    def _route(self, prompt: str, schema: dict | None) -> str:
+        tried = set()
+        pending = {}
+
+        def launch() -> bool:
+            backend = self._pick(tried)
+            if backend is None:
+                return False
+            tried.add(backend.name)
+            pending[self.executor.submit(self._call, backend, prompt, schema)] = backend.name
+            return True
+
+        if not launch():
+            return "Error: No healthy generator backend available."
+
+        last_error = "Error: Could not generate answer."
+        while pending:
+            # Only wait for the hedge delay while a single request is in flight
+            timeout = self.hedge_after_s if (self.hedge_after_s and len(pending) == 1) else None
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                if launch():
+                    print(f"Router: hedging after {self.hedge_after_s}s (backends: {sorted(tried)})")
+                else:
+                    # Nothing left to hedge with; just wait for the request in flight
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = pending.pop(future)
+                result = future.result()
+                if not is_error_response(result):
+                    return result
+                last_error = result
+                if not pending and launch():
+                    print(f"Router: backend '{name}' failed; falling back.")
+                else:
+                    print(f"Router: backend '{name}' failed.")
+        return last_error
+
+    def status(self) -> list[dict]:
+        """Snapshot of each backend's load and breaker state."""
+        with self.lock:
+            return [
+                {
+                    "name": b.name,
+                    "in_flight": b.in_flight,
+                    "latency_ewma_s": round(b.latency_ewma, 3),
+                    "breaker": b.breaker.state,
+                    "consecutive_failures": b.breaker.failures,
+                }
+                for b in self.backends
+            ]
@@ -0,0 +1,38 @@
+from .base import BaseGenerator
+from core.scheduler import SCHEDULER, generation_scheduler
+
+
+class ScheduledGenerator(BaseGenerator):
+    """
+    Runs every generation inside a slot of the shared generation scheduler
+    (core/scheduler.py), so interactive requests are served ahead of batch
+    work and no client can take all the model's capacity. Sits under the
+    cache: cached answers never wait for a slot.
+    """
+    def __init__(self, inner: BaseGenerator, scheduler=generation_scheduler):
+        super().__init__(inner.model_name, inner.decoding_config)
+        self.inner = inner
+        self.scheduler = scheduler
+
+    def generate(self, prompt: str) -> str:
+        with self.scheduler.slot():
+            return self.inner.generate(prompt)
+
+    def stream(self, prompt: str):
+        # The slot is held until the last piece is produced
+        with self.scheduler.slot():
+            yield from self.inner.stream(prompt)
+
+    def generate_structured(self, prompt: str, schema: dict) -> str:
+        with self.scheduler.slot():
+            return self.inner.generate_structured(prompt, schema)
+
+    def stats(self) -> dict:
+        return self.scheduler.stats()
+
+
+def maybe_scheduled(generator: BaseGenerator) -> BaseGenerator:
+    """Wrap `generator` in a ScheduledGenerator unless SCHEDULER=false."""
+    if not SCHEDULER:
+        return generator
+    return ScheduledGenerator(generator)
@@ -1,14 +1,21 @@
 import json
 import os
+import time
+import shutil
 import chromadb
 from chromadb.utils import embedding_functions
+from core.embeddings import EMBED_MODEL, EMBED_BACKEND, get_embedding_function
+from core.timeutils import to_epoch
+from core.analytics import ANALYTICS_PATH, build_analytics_table, write_analytics_table
+from core.chunks import CHUNK_COLLECTION_NAME, CHUNK_WINDOW, CHUNK_STRIDE, build_chunks
+from core.versions import DB_PATH, INDEX_KEEP_VERSIONS, new_version, versioned_name, activate, collect_garbage
 
 # --- Constants ---
 # C:\MY FILES\Peeyush-Personal\Coding\Aurora-Technical-Assessment-NLP-QA-\data\
 DATA_FILE = "data/response_1762800357568.json"
-DB_PATH = "chroma_db"
 COLLECTION_NAME = "messages"
-EMBED_MODEL = "all-MiniLM-L6-v2"
+# Also build the per-user conversation chunk collection (core/chunks.py)
+INGEST_CHUNKS = os.getenv("INGEST_CHUNKS", "false").strip().lower() == "true"
 
 def main():
     print(f"Loading data from {DATA_FILE}...")
@@ -29,62 +36,187 @@ def main():
     print(f"Found {len(items)} messages to ingest.")
 
     # 1. Initialize the embedding model
-    print(f"Initializing embedding model: {EMBED_MODEL}...")
-    embedding_func = embedding_functions.SentenceTransformerEmbeddingFunction(
-        model_name=EMBED_MODEL
-    )
+    # torch: Chroma embeds documents itself with sentence-transformers.
+    # onnx / onnx-int8: we embed each batch ourselves and hand Chroma the vectors.
+    print(f"Initializing embedding model: {EMBED_MODEL} (backend: {EMBED_BACKEND})...")
+    if EMBED_BACKEND == "torch":
+        embedding_func = embedding_functions.SentenceTransformerEmbeddingFunction(
+            model_name=EMBED_MODEL
+        )
+        onnx_embedder = None
+    else:
+        embedding_func = None
+        onnx_embedder = get_embedding_function(EMBED_BACKEND)
 
     # 2. Initialize the ChromaDB client (persists to disk)
     if not os.path.exists(DB_PATH):
         os.makedirs(DB_PATH)
     client = chromadb.PersistentClient(path=DB_PATH)
 
-    # 3. Get or create the collection
-    collection = client.get_or_create_collection(
-        name=COLLECTION_NAME,
-        embedding_function=embedding_func,
-        metadata={"hnsw:space": "cosine"} # Use cosine similarity
-    )
+    # 3. Create a new index version next to the live one
+    # The API keeps serving the active version while this one is built; it
+    # only switches once everything below succeeded (blue/green).
+    version = new_version()
+    collection_name = versioned_name(COLLECTION_NAME, version)
+    # Each version writes its own table; a pinned ANALYTICS_PATH is only
+    # replaced once the version is live
+    analytics_path = os.path.join(DB_PATH, f"{collection_name}.parquet")
+    chunks_name = None
+    print(f"Building index version {version} (collection '{collection_name}')...")
+    try:
+        collection = client.create_collection(
+            name=collection_name,
+            embedding_function=embedding_func,
+            metadata={
+                "hnsw:space": "cosine", # Use cosine similarity
+                "embed_model": EMBED_MODEL,
+                "embed_backend": EMBED_BACKEND,
+            }
+        )
 
-    # 4. Prepare data for ChromaDB in batches
-    batch_size = 100
-    for i in range(0, len(items), batch_size):
-        batch = items[i:i+batch_size]
+        # 4. Prepare data for ChromaDB in batches
+        batch_size = 100
+        failed_batches = 0
+        for i in range(0, len(items), batch_size):
+            batch = items[i:i+batch_size]
         
-        documents = []
-        metadatas = []
-        ids = []
+            documents = []
+            metadatas = []
+            ids = []
 
-        for item in batch:
-            # Skip messages that are empty or just whitespace
-            if not item.get("message") or not item["message"].strip():
-                continue
+            for item in batch:
+                # Skip messages that are empty or just whitespace
+                if not item.get("message") or not item["message"].strip():
+                    continue
                 
-            message = f"On {item.get('timestamp', 'Unknown date')}, user {item.get('user_name', 'Unknown user')} sent a message: '{item.get('message', '')}'"
-            documents.append(message)
-            metadatas.append({
-                "user_name": item.get("user_name", "Unknown"),
-                "user_id": item.get("user_id", "Unknown"),
-                "timestamp": item.get("timestamp", "Unknown"),
-            })
-            ids.append(item["id"])
+                message = f"On {item.get('timestamp', 'Unknown date')}, user {item.get('user_name', 'Unknown user')} sent a message: '{item.get('message', '')}'"
+                documents.append(message)
+                metadatas.append({
+                    "user_name": item.get("user_name", "Unknown"),
+                    "user_id": item.get("user_id", "Unknown"),
+                    "timestamp": item.get("timestamp", "Unknown"),
+                })
+                # Numeric copy so Chroma can range-filter and we can sort by time
+                epoch = to_epoch(item.get("timestamp"))
+                if epoch is not None:
+                    metadatas[-1]["timestamp_epoch"] = epoch
+                ids.append(item["id"])
         
-        if not ids:
-            continue
+            if not ids:
+                continue
+
+            # 5. Add the batch to the collection
+            try:
+                embeddings = onnx_embedder.embed_documents(documents) if onnx_embedder else None
+                collection.add(
+                    documents=documents,
+                    embeddings=embeddings,
+                    metadatas=metadatas,
+                    ids=ids
+                )
+                print(f"Ingested batch {i//batch_size + 1}/{(len(items)//batch_size) + 1}")
+            except Exception as e:
+                print(f"Error ingesting batch: {e}")
+                failed_batches += 1
+
+        print("\n--- Ingestion Complete ---")
+        print(f"Total messages in collection: {collection.count()}")
 
-        # 5. Add the batch to the collection
+        # 6. Conversation chunks: sliding windows of a user's consecutive messages
+        if INGEST_CHUNKS:
+            chunks_name = versioned_name(CHUNK_COLLECTION_NAME, version)
+            failed_batches += ingest_chunks(client, items, embedding_func, onnx_embedder, chunks_name)
+
+        # 7. Columnar side-store for counts and timelines (core/analytics.py)
+        build_analytics(items, analytics_path)
+    except BaseException:
+        # Never leave a half-built version behind: collect_garbage only
+        # removes versions older than the active one
+        print(f"Building index version {version} failed. Deleting it.")
+        discard_version(client, version, analytics_path)
+        raise
+
+    # 8. Atomically point readers at the new version, then drop old versions
+    if failed_batches:
+        print(f"{failed_batches} batch(es) failed; version {version} is NOT activated. Deleting it.")
+        discard_version(client, version, analytics_path)
+        return
+    activate({
+        "version": version,
+        "messages": collection_name,
+        "chunks": chunks_name,
+        "analytics": analytics_path,
+        "count": collection.count(),
+        "embed_backend": EMBED_BACKEND,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+    })
+    print(f"Activated index version {version}.")
+    if ANALYTICS_PATH:
+        publish_analytics(analytics_path, ANALYTICS_PATH)
+    collect_garbage(client, (COLLECTION_NAME, CHUNK_COLLECTION_NAME), keep=INDEX_KEEP_VERSIONS)
+
+def discard_version(client, version, analytics_path):
+    """Deletes every collection of an unactivated version, and its analytics table."""
+    names = {versioned_name(base, version) for base in (COLLECTION_NAME, CHUNK_COLLECTION_NAME)}
+    for collection in client.list_collections():
+        name = getattr(collection, "name", collection)
+        if name in names:
+            client.delete_collection(name=name)
+    if os.path.exists(analytics_path):
+        os.remove(analytics_path)
+
+def publish_analytics(source, target):
+    """Replaces the pinned analytics table in one rename, so readers never see a partial file."""
+    os.makedirs(os.path.dirname(target) or ".", exist_ok=True)
+    tmp = f"{target}.{os.getpid()}.tmp"
+    shutil.copyfile(source, tmp)
+    os.replace(tmp, target)
+    print(f"Analytics table published to {target}.")
+
+def ingest_chunks(client, items, embedding_func, onnx_embedder, chunks_name, batch_size=100):
+    """
+    Builds the chunk collection of this index version; each chunk lists its
+    messages' ids in `message_ids`. Returns the number of failed batches.
+    """
+    chunks = build_chunks(items)
+    print(f"Building {len(chunks)} conversation chunks (window {CHUNK_WINDOW}, stride {CHUNK_STRIDE})...")
+    failed_batches = 0
+    chunk_collection = client.create_collection(
+        name=chunks_name,
+        embedding_function=embedding_func,
+        metadata={
+            "hnsw:space": "cosine",
+            "embed_model": EMBED_MODEL,
+            "embed_backend": EMBED_BACKEND,
+            "chunk_window": CHUNK_WINDOW,
+            "chunk_stride": CHUNK_STRIDE,
+        }
+    )
+    for i in range(0, len(chunks), batch_size):
+        batch = chunks[i:i+batch_size]
+        documents = [c["document"] for c in batch]
         try:
-            collection.add(
+            chunk_collection.add(
                 documents=documents,
-                metadatas=metadatas,
-                ids=ids
+                embeddings=onnx_embedder.embed_documents(documents) if onnx_embedder else None,
+                metadatas=[c["metadata"] for c in batch],
+                ids=[c["id"] for c in batch]
             )
-            print(f"Ingested batch {i//batch_size + 1}/{(len(items)//batch_size) + 1}")
         except Exception as e:
-            print(f"Error ingesting batch: {e}")
+            print(f"Error ingesting chunk batch: {e}")
+            failed_batches += 1
+    print(f"Total chunks in collection: {chunk_collection.count()}")
+    return failed_batches
 
-    print("\n--- Ingestion Complete ---")
-    print(f"Total messages in collection: {collection.count()}")
+def build_analytics(items, path):
+    """Writes every message, with categories and entities, to the Parquet analytics table."""
+    from core.nlp import nlp
+    if nlp is None:
+        print("spaCy model not available; analytics entities will be empty.")
+    print(f"Building analytics table at {path}...")
+    df = build_analytics_table(items, nlp=nlp)
+    write_analytics_table(df, path)
+    print(f"Analytics table written: {len(df)} messages.")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
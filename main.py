@@ -1,30 +1,122 @@
-from fastapi import FastAPI, HTTPException
+import os
+import hmac
+import json
+import uuid
+import asyncio
+import threading
+from contextlib import asynccontextmanager
+from typing import Optional
+from fastapi import FastAPI, HTTPException, Request, Header, Depends
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse, PlainTextResponse, Response, JSONResponse
 from pydantic import BaseModel
 import uvicorn
-from qa_system import answer_question  # Import the "brain"
+from qa_system import answer_question, answer_routed, QA_ROUTING  # Import the "brain"
+from batch_qa import answer_batch, BATCH_CONCURRENCY, BATCH_MAX_QUESTIONS
+from core.scheduler import endpoint_priority, request_context, SchedulerTimeout, scheduler_stats
+from core.profiling import profiler, flamegraph_svg, PROFILE_INTERVAL_MS
+from generators.lifecycle import OLLAMA_LIFECYCLE, ollama_lifecycle
+
+# Agent endpoints: how many agent runs may execute at once, and how long a
+# request waits for a free slot before getting a 429
+AGENT_MAX_CONCURRENCY = int(os.getenv("AGENT_MAX_CONCURRENCY", "4"))
+AGENT_QUEUE_TIMEOUT_S = float(os.getenv("AGENT_QUEUE_TIMEOUT_S", "2"))
+agent_slots = asyncio.Semaphore(AGENT_MAX_CONCURRENCY)
+# Shared secret for the /admin endpoints (sent as X-Admin-Token); unset disables them
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+def request_priority(http_request: Request) -> tuple[str, str]:
+    """
+    (priority class, client id) for the scheduler: the endpoint's default
+    (SCHED_ENDPOINT_PRIORITIES) unless an X-Priority header names a class;
+    the client is X-Client-Id or the caller's address.
+    """
+    priority = endpoint_priority(http_request.url.path, http_request.headers.get("x-priority"))
+    client = http_request.headers.get("x-client-id") or (http_request.client.host if http_request.client else None)
+    return priority, client
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Pull/warm the Ollama models in the background; runs in each worker (after
+    # serve.py's fork), so every worker has its own probe thread
+    if OLLAMA_LIFECYCLE:
+        ollama_lifecycle.start()
+    yield
 
 # 1. Initialize your FastAPI app
 app = FastAPI(
     title="Aurora AI/ML Take-Home API",
     description="A Q&A system for member messages using RAG.",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
 )
 
+@app.middleware("http")
+async def profile_requests(request: Request, call_next):
+    """Counts requests towards an on-demand profile started via /admin/profile/start."""
+    profile = None if request.url.path.startswith("/admin") else profiler.request_started()
+    if profile is None:
+        return await call_next(request)
+    try:
+        response = await call_next(request)
+    except BaseException:
+        profiler.request_finished(profile)
+        raise
+
+    # The request ends when its (possibly streamed) body has been sent
+    body = response.body_iterator
+
+    async def tracked_body():
+        try:
+            async for chunk in body:
+                yield chunk
+        finally:
+            profiler.request_finished(profile)
+
+    response.body_iterator = tracked_body()
+    return response
+
 # 2. Define the Pydantic models for request (input) and response (output)
 class QuestionRequest(BaseModel):
     """The JSON payload for a question."""
     question: str
+    session_id: Optional[str] = None  # reuse to ask follow-ups about the same people
 
 class AnswerResponse(BaseModel):
     """The JSON response with the answer."""
     answer: str
 
+class BatchRequest(BaseModel):
+    """Many questions answered in one call; results stream back as JSON lines."""
+    questions: list[str]
+    concurrency: Optional[int] = None  # defaults to BATCH_CONCURRENCY
+
+class AgentRequest(BaseModel):
+    """The JSON payload for an agent question."""
+    question: str
+    thread_id: Optional[str] = None  # reuse to continue a conversation
+
+class ProfileRequest(BaseModel):
+    """Profile the next `requests` requests, or the next `seconds` seconds."""
+    requests: Optional[int] = None
+    seconds: Optional[float] = None
+    interval_ms: Optional[float] = None  # defaults to PROFILE_INTERVAL_MS
+
+class AgentResponse(BaseModel):
+    """The agent's final answer and the conversation thread it belongs to."""
+    answer: str
+    thread_id: str
+
 # 3. Create the /ask API endpoint
 @app.post("/ask", response_model=AnswerResponse)
-async def ask(request: QuestionRequest):
+def ask(request: QuestionRequest, http_request: Request):
     """
     Accepts a natural-language question and responds with an answer
-    inferred from the member messages.
+    inferred from the member messages. A sync endpoint, so FastAPI runs it
+    in its thread pool: concurrent questions overlap (and their query
+    embeddings are batched together by core.db) instead of queueing on the
+    event loop. Retrieval and generation wait for scheduler slots by the
+    request's priority (see `request_priority`).
     """
     if not request.question:
         raise HTTPException(status_code=400, detail="Question field cannot be empty")
@@ -33,18 +125,266 @@ async def ask(request: QuestionRequest):
     
     # 4. Get the answer from your RAG "brain"
     try:
-        answer = answer_question(request.question)
+        with request_context(*request_priority(http_request)):
+            if QA_ROUTING:
+                answer = answer_routed(request.question, session_id=request.session_id)
+            else:
+                answer = answer_question(request.question, session_id=request.session_id)
         print(f"Generated answer: {answer}")
         return {"answer": answer}
+    except SchedulerTimeout as e:
+        print(f"Scheduler timeout: {e}")
+        raise HTTPException(status_code=503, detail="Server is busy, please retry shortly")
     except Exception as e:
         print(f"An error occurred: {e}")
         raise HTTPException(status_code=500, detail="Internal server error")
 
+@app.post("/ask/batch")
+def ask_batch(request: BatchRequest, http_request: Request):
+    """
+    Answers a list of questions and streams one JSON object per question
+    (NDJSON) as soon as it is ready: {"index", "question", "answer" | "error",
+    "users", "duplicate", "seconds"}. Duplicates are answered once, questions
+    about the same users share retrieval, and at most `concurrency`
+    generations run at a time. Runs as "batch" priority by default, using
+    the capacity interactive requests leave free.
+    """
+    questions = request.questions
+    # "index" in the results refers to this list, so empty entries are rejected rather than dropped
+    if not questions or any(not q.strip() for q in questions):
+        raise HTTPException(status_code=400, detail="questions must be a non-empty list of non-empty questions")
+    if len(questions) > BATCH_MAX_QUESTIONS:
+        raise HTTPException(status_code=413, detail=f"At most {BATCH_MAX_QUESTIONS} questions per batch")
+    concurrency = min(max(1, request.concurrency or BATCH_CONCURRENCY), BATCH_CONCURRENCY * 4)
+    priority, client = request_priority(http_request)
+
+    def lines():
+        # Sync generator: Starlette iterates it in a worker thread
+        results = answer_batch(questions, concurrency=concurrency, priority=priority, client=client)
+        try:
+            for result in results:
+                yield json.dumps(result, ensure_ascii=False) + "\n"
+        finally:
+            # A disconnected client closes this generator; stop the batch too
+            results.close()
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+# --- Agent endpoints (LangGraph agent from agent.py) ---
+_agent_app = None
+
+def get_agent_app():
+    """Compile the agent graph on first use so /ask does not pay for it."""
+    global _agent_app
+    if _agent_app is None:
+        from agent import app as compiled_agent
+        _agent_app = compiled_agent
+    return _agent_app
+
+async def acquire_agent_slot():
+    try:
+        await asyncio.wait_for(agent_slots.acquire(), timeout=AGENT_QUEUE_TIMEOUT_S)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=429, detail="Agent is busy, please retry shortly")
+
+def agent_inputs(request: AgentRequest):
+    from langchain_core.messages import HumanMessage
+    if not request.question:
+        raise HTTPException(status_code=400, detail="Question field cannot be empty")
+    thread_id = request.thread_id or str(uuid.uuid4())
+    state = {"messages": [HumanMessage(content=request.question)]}
+    config = {"configurable": {"thread_id": thread_id}}
+    return state, config, thread_id
+
+@app.post("/agent/ask", response_model=AgentResponse)
+async def agent_ask(request: AgentRequest, http_request: Request):
+    """
+    Runs the agent to completion. Pass the returned `thread_id` back to ask
+    follow-up questions in the same conversation.
+    """
+    state, config, thread_id = agent_inputs(request)
+    priority, client = request_priority(http_request)
+    agent_app = get_agent_app()
+    await acquire_agent_slot()
+
+    # The SQLite checkpointer (AGENT_CHECKPOINTER=sqlite) only implements the
+    # sync API, so the graph runs with `invoke` in a worker thread
+    def run_agent():
+        with request_context(priority, client):
+            return agent_app.invoke(state, config=config)
+
+    try:
+        final_state = await run_in_threadpool(run_agent)
+        answer = final_state["messages"][-1].content
+        return {"answer": answer, "thread_id": thread_id}
+    except Exception as e:
+        print(f"An error occurred in the agent: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+    finally:
+        agent_slots.release()
+
+def agent_stream_events(mode: str, chunk) -> list[dict]:
+    """Translate one LangGraph stream item into client events."""
+    events = []
+    if mode == "messages":
+        message, metadata = chunk
+        if message.content and metadata.get("langgraph_node") == "agent_brain":
+            events.append({"event": "token", "text": message.content})
+    elif mode == "updates":
+        for node, update in chunk.items():
+            events.append({"event": "node", "node": node})
+            for message in (update or {}).get("messages", []):
+                for tool_call in getattr(message, "tool_calls", None) or []:
+                    events.append({"event": "tool_call", "name": tool_call["name"], "args": tool_call["args"]})
+                if message.type == "tool":
+                    events.append({"event": "tool_result", "tool_call_id": message.tool_call_id, "content": message.content[:2000]})
+                elif message.type == "ai" and message.content:
+                    events.append({"event": "message", "content": message.content})
+    return events
+
+@app.post("/agent/stream")
+async def agent_stream(request: AgentRequest, http_request: Request):
+    """
+    Streams the agent's progress as JSON lines: node transitions, tool calls
+    and results, LLM tokens, then a final event with the answer.
+    """
+    state, config, thread_id = agent_inputs(request)
+    priority, client = request_priority(http_request)
+    agent_app = get_agent_app()
+    await acquire_agent_slot()
+    loop = asyncio.get_running_loop()
+    events = asyncio.Queue()
+    stopped = threading.Event()
+
+    # The SQLite checkpointer only implements the sync API, so one worker
+    # thread runs `stream` and hands each item to the response via the queue.
+    # The thread owns the agent slot: it is freed when the graph stops, not
+    # when the client goes away, so AGENT_MAX_CONCURRENCY bounds running graphs
+    def run_agent():
+        try:
+            with request_context(priority, client):
+                for item in agent_app.stream(state, config=config, stream_mode=["updates", "messages"]):
+                    if stopped.is_set():
+                        break
+                    loop.call_soon_threadsafe(events.put_nowait, ("item", item))
+        except Exception as e:
+            loop.call_soon_threadsafe(events.put_nowait, ("error", e))
+        finally:
+            try:
+                loop.call_soon_threadsafe(events.put_nowait, ("done", None))
+                loop.call_soon_threadsafe(agent_slots.release)
+            except RuntimeError:
+                # The event loop is gone (server shutdown); nobody waits for the slot
+                pass
+
+    # Started before the response is returned, so a client that disconnects
+    # before the body starts cannot leak the slot
+    worker = threading.Thread(target=run_agent, name="agent-stream", daemon=True)
+    try:
+        worker.start()
+    except BaseException:
+        agent_slots.release()
+        raise
+
+    async def event_lines():
+        answer = ""
+        try:
+            yield json.dumps({"event": "start", "thread_id": thread_id}) + "\n"
+            while True:
+                kind, payload = await events.get()
+                if kind == "done":
+                    break
+                if kind == "error":
+                    raise payload
+                mode, chunk = payload
+                for event in agent_stream_events(mode, chunk):
+                    if event["event"] == "message":
+                        answer = event["content"]
+                    yield json.dumps(event, default=str) + "\n"
+            yield json.dumps({"event": "final", "answer": answer, "thread_id": thread_id}) + "\n"
+        except Exception as e:
+            print(f"An error occurred in the agent stream: {e}")
+            yield json.dumps({"event": "error", "detail": "Internal server error"}) + "\n"
+        finally:
+            # A client that disconnects stops the graph at its next step
+            stopped.set()
+
+    return StreamingResponse(event_lines(), media_type="application/x-ndjson")
+
+# --- Admin: profiling (requires ADMIN_TOKEN) ---
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+@app.post("/admin/profile/start", dependencies=[Depends(require_admin)], include_in_schema=False)
+def admin_profile_start(request: ProfileRequest):
+    """
+    Starts a sampling profile of the next N requests (all app threads are
+    sampled while they run) or of a time window. Replaces a running profile.
+    """
+    try:
+        profile = profiler.start(
+            requests=request.requests,
+            seconds=request.seconds,
+            interval_ms=request.interval_ms or PROFILE_INTERVAL_MS,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return profile.status()
+
+@app.post("/admin/profile/stop", dependencies=[Depends(require_admin)], include_in_schema=False)
+def admin_profile_stop():
+    profile = profiler.stop()
+    if profile is None:
+        raise HTTPException(status_code=404, detail="No profile has been started")
+    return profile.status()
+
+@app.get("/admin/profile", dependencies=[Depends(require_admin)], include_in_schema=False)
+def admin_profile(format: str = "json", limit: int = 30, sort: str = "self"):
+    """
+    The latest profile: `json` (status plus top functions, sorted by `self`
+    or `total` samples), `svg` (flame graph), or `folded` (collapsed stacks for
+    flamegraph.pl / speedscope).
+    """
+    profile = profiler.profile
+    if profile is None:
+        raise HTTPException(status_code=404, detail="No profile has been started")
+    if format == "svg":
+        title = f"Profile {profile.id}: {profile.samples} samples, {profile.requests_done} request(s)"
+        return Response(
+            flamegraph_svg(profile.snapshot(), title), media_type="image/svg+xml",
+            headers={"Content-Disposition": f'attachment; filename="profile-{profile.id}.svg"'},
+        )
+    if format == "folded":
+        return PlainTextResponse(
+            profile.folded(), headers={"Content-Disposition": f'attachment; filename="profile-{profile.id}.folded"'}
+        )
+    if format != "json":
+        raise HTTPException(status_code=400, detail="format must be json, svg or folded")
+    return {**profile.status(), "top": profile.top(limit, sort=sort)}
+
+@app.get("/admin/profile/hot", dependencies=[Depends(require_admin)], include_in_schema=False)
+def admin_profile_hot(limit: int = 30, reset: bool = False):
+    """Hottest functions in qa_system, core, tools and generators from continuous sampling (PROFILE_CONTINUOUS_HZ)."""
+    return {**profiler.hot(limit, reset=reset), "scheduler": scheduler_stats()}
+
 # 5. (Optional) A root endpoint to check if the server is running
 @app.get("/", include_in_schema=False)
 def read_root():
     return {"status": "Aurora QA API is running!", "docs_url": "/docs"}
 
+@app.get("/ready", include_in_schema=False)
+def ready():
+    """
+    Readiness probe: 200 once every managed Ollama model is loaded and
+    answering (per-model status, load and probe latency included), else 503.
+    The root endpoint stays the liveness probe.
+    """
+    status = ollama_lifecycle.status()
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
+
 # 6. This part allows you to run the app with `python main.py`
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -1,5 +1,20 @@
+"""Builds a structured JSON profile per user from their messages with a local LLM.
+
+Usage (from the project root):
+  python profile_builder.py [--mode sequential|tree] [--users "Vikram Desai"] [--concurrency 4]
+
+sequential folds the message batches into a running profile, one call after
+another. tree extracts a partial profile from every batch in parallel and
+merges them pairwise, older with newer, in O(log batches) sequential steps.
+"""
+import os
+import time
+import argparse
 import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
 from generators.litellm import LiteLLMGenerator
+from generators.cache import maybe_cached
+from generators.lifecycle import ollama_lifecycle, ollama_model
 import json 
 from tqdm.auto import tqdm
 
@@ -57,52 +72,221 @@ Your task is to read the `current_profile`, then process *every* message in the
       - *Action:* Do **NOT** add these to the `preferences` object. Instead, find the matching event in `trips_and_events` and add this to its `"details": [...]` list.
 """
 
+MERGE_SYSTEM_PROMPT = """
+You are an expert AI agent that merges two partial JSON profiles of the same user.
+The `older_profile` was built from earlier messages and the `newer_profile` from later ones.
+Combine them into one profile that follows the same PROFILE SCHEMA and rules as before.
+
+**YOUR OUTPUT MUST BE A SINGLE, VALID JSON OBJECT AND NOTHING ELSE.**
+
+**MERGE RULES:**
+1.  **LATEST WINS:** When the two profiles disagree (a different seat, phone, event status or date), keep the `newer_profile` value.
+2.  **KEEP EVERYTHING ELSE:** Keep every fact that appears in only one of the profiles. Lists (allergies, amenities, aliases) are combined without duplicates.
+3.  **SAME EVENT:** Events in both profiles that are the same real event (same item, or connected by an alias or feedback as in rule 6) become one event, with the newer status, feedback and dates and all aliases and details.
+4.  **PREFERENCES vs REQUESTS:** Do not turn one-time requests into preferences.
+"""
+
+MODEL_NAME = "ollama/mistral"
 BATCH_SIZE = 50
-mistral = LiteLLMGenerator(model_name="ollama/mistral")
+DATA_FILE = "data/response_1762800357568.json"
+PROFILES_DIR = "profiles"
+# sequential: fold the batches one after another into a running profile.
+# tree: extract a partial profile per batch in parallel, then merge neighbours
+# pairwise (older, newer) level by level: O(log batches) sequential LLM steps
+PROFILE_MODE = os.getenv("PROFILE_MODE", "sequential").strip().lower()
+# LLM calls in flight at once in tree mode (match the server's parallelism, e.g. OLLAMA_NUM_PARALLEL)
+PROFILE_CONCURRENCY = int(os.getenv("PROFILE_CONCURRENCY", "4"))
+# Extra attempts for a tree-mode batch whose partial profile is not valid JSON
+PROFILE_LEAF_RETRIES = int(os.getenv("PROFILE_LEAF_RETRIES", "2"))
+JSON_RETRY_NOTE = """
+        Your previous answer for this batch was not valid JSON. Answer again with ONLY the JSON profile object.
+        """
 
-# Load data and sort according to timestamp 
-json_data = json.load(open(f"data/response_1762800357568.json"))
-data = pd.DataFrame(json_data["items"])
-data["timestamp"] = pd.to_datetime(data["timestamp"])
-data = data.sort_values(by="timestamp", ascending=True)
 
-test_profile = "Vikram Desai"
-vikram_data = data[data["user_name"] == test_profile]
-data = vikram_data.copy()
-vikram_data = vikram_data["timestamp"].astype(str) + ": " + vikram_data["message"]
-vikram_data = list(vikram_data)
+def load_messages(path: str = DATA_FILE) -> pd.DataFrame:
+    """All messages, oldest first."""
+    with open(path, "r", encoding="utf-8") as f:
+        json_data = json.load(f)
+    data = pd.DataFrame(json_data["items"])
+    data["timestamp"] = pd.to_datetime(data["timestamp"])
+    return data.sort_values(by="timestamp", ascending=True, kind="stable")
 
-for user in tqdm(data["user_name"].unique()):
-    user_data = data[data["user_name"] == user][["timestamp", "message"]]
-    user_data = user_data["timestamp"].astype(str) + ": " + user_data["message"]
-    user_data = list(user_data)
 
-    current_profile_str = "{}"  # Start with empty profile for simplicity
-    for i in range(0, len(user_data), BATCH_SIZE):
-        batch = user_data[i:min(i+BATCH_SIZE, len(user_data))]
-        batch = "\n".join(batch)
-        prompt = f"""
-        Name of the User: {test_profile}
+def user_batches(data: pd.DataFrame, user: str, batch_size: int = BATCH_SIZE) -> list[str]:
+    """The user's messages as "timestamp: message" lines, in chronological batches."""
+    user_data = data[data["user_name"] == user]
+    lines = list(user_data["timestamp"].astype(str) + ": " + user_data["message"])
+    return ["\n".join(lines[i:i + batch_size]) for i in range(0, len(lines), batch_size)]
+
+
+def fold_prompt(user: str, current_profile: str, batch: str) -> str:
+    return PROFILE_SYSTEM_PROMPT + f"""
+        Name of the User: {user}
 
         Current Profile:
-        {current_profile_str}
+        {current_profile}
         
         Batch of New Messages:
         {batch}
         
         Based on the above, update the profile according to the schema and rules provided.
         """
-        
-        response = mistral.generate(
-            PROFILE_SYSTEM_PROMPT + prompt,
-        )
-        
+
+
+def merge_prompt(user: str, older: str, newer: str) -> str:
+    return PROFILE_SYSTEM_PROMPT + MERGE_SYSTEM_PROMPT + f"""
+        Name of the User: {user}
+
+        Older Profile (earlier messages):
+        {older}
+
+        Newer Profile (later messages):
+        {newer}
+
+        Merge them into one profile according to the schema and the merge rules.
+        """
+
+
+def parse_profile(text: str) -> dict | None:
+    """The JSON object in a model answer (which may add prose or fences), or None."""
+    try:
+        profile = json.loads(text[text.find("{"): text.rfind("}") + 1])
+    except ValueError:
+        return None
+    return profile if isinstance(profile, dict) else None
+
+
+def _event_key(event) -> str:
+    """Events merge by `item`; any other entry (a dict without one, a string) only with an identical entry."""
+    if isinstance(event, dict) and str(event.get("item", "")).strip():
+        return "item:" + str(event["item"]).strip().lower()
+    return json.dumps(event, sort_keys=True)
+
+
+def merge_profiles(older, newer):
+    """
+    Rule-based merge used when the model's merge is not valid JSON: newer
+    non-empty values win, lists are combined without duplicates, and events
+    with the same `item` are merged field by field.
+    """
+    if isinstance(older, dict) and isinstance(newer, dict):
+        merged = dict(older)
+        for key, value in newer.items():
+            merged[key] = merge_profiles(older[key], value) if key in older else value
+        return merged
+    if isinstance(older, list) and isinstance(newer, list):
+        merged = {}
+        for item in older + newer:
+            key = _event_key(item)
+            merged[key] = merge_profiles(merged[key], item) if key in merged else item
+        return list(merged.values())
+    return older if newer in (None, "", [], {}) else newer
+
+
+def build_profile_sequential(llm, user: str, batches: list[str], on_version=None) -> str:
+    """Folds the batches in order; each call sees the whole profile so far."""
+    current_profile_str = "{}"  # Start with empty profile for simplicity
+    for n, batch in enumerate(batches, start=1):
+        response = llm.generate(fold_prompt(user, current_profile_str, batch))
         # Update current profile for next batch
         current_profile_str = response.strip()
-        # Save intermediate profiles
-        with open(f"profiles/{user}_mistral_b{BATCH_SIZE}_v{i//BATCH_SIZE + 1}.txt", "w") as f:
-            f.write(current_profile_str)
+        if on_version is not None:
+            on_version(n, current_profile_str)
+    return current_profile_str
+
+
+def build_profile_tree(llm, user: str, batches: list[str], pool: ThreadPoolExecutor) -> tuple[str, int]:
+    """
+    Map: a partial profile per batch, all batches in parallel. Reduce:
+    neighbouring profiles are merged pairwise as (older, newer), every pair
+    of a level in parallel, until one is left. Neighbours only, so the newer
+    side of every merge covers later messages and the latest value wins as
+    in the sequential fold. Returns the profile and the number of sequential
+    LLM steps (1 + ceil(log2(batches))).
+    """
+    level = list(pool.map(lambda item: extract_leaf(llm, user, *item), enumerate(batches, start=1)))
+    steps = 1
+    while len(level) > 1:
+        pairs = [(level[i], level[i + 1]) for i in range(0, len(level) - 1, 2)]
+        merged = list(pool.map(lambda pair: merge_pair(llm, user, *pair), pairs))
+        # An odd profile out is the newest of its level and moves up unchanged
+        level = merged + level[len(pairs) * 2:]
+        steps += 1
+    return (level[0] if level else "{}"), steps
+
+
+def extract_leaf(llm, user: str, n: int, batch: str) -> str:
+    """
+    The partial profile of one batch. An answer that is not valid JSON is
+    asked for again (the changed prompt also bypasses the generation cache),
+    up to PROFILE_LEAF_RETRIES times.
+    """
+    prompt = fold_prompt(user, "{}", batch)
+    response = llm.generate(prompt).strip()
+    for attempt in range(1, PROFILE_LEAF_RETRIES + 1):
+        if parse_profile(response) is not None:
+            break
+        print(f"Batch {n} of {user} was not valid JSON; retrying ({attempt}/{PROFILE_LEAF_RETRIES}).")
+        response = llm.generate(prompt + JSON_RETRY_NOTE).strip()
+    else:
+        if parse_profile(response) is None:
+            print(f"Warning: batch {n} of {user} is still not valid JSON; the rule-based merge cannot use it.")
+    return response
+
+
+def merge_pair(llm, user: str, older: str, newer: str) -> str:
+    response = llm.generate(merge_prompt(user, older, newer)).strip()
+    if parse_profile(response) is not None:
+        return response
+    print(f"Merge for {user} was not valid JSON; merging by rules instead.")
+    sides = {"older": parse_profile(older), "newer": parse_profile(newer)}
+    for side, profile in sides.items():
+        if profile is None:
+            print(f"Warning: the {side} profile of {user} is not valid JSON; its facts are lost in this merge.")
+    return json.dumps(merge_profiles(sides["older"] or {}, sides["newer"] or {}), indent=2, ensure_ascii=False)
+
+
+def write_profile(name: str, text: str):
+    with open(os.path.join(PROFILES_DIR, name), "w") as f:
+        f.write(text)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=("sequential", "tree"), default=PROFILE_MODE)
+    parser.add_argument("--users", help="Comma-separated user names (default: every user).")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--concurrency", type=int, default=PROFILE_CONCURRENCY, help="LLM calls in flight in tree mode.")
+    args = parser.parse_args()
+
+    # Reruns over unchanged batches are served from the cache when GENERATOR_CACHE=true
+    mistral = maybe_cached(LiteLLMGenerator(model_name=MODEL_NAME, temperature=0))
+    # Pull (if needed) and load the model before the first batch instead of inside it
+    ollama_lifecycle.prepare(ollama_model(MODEL_NAME))
+
+    # Load data and sort according to timestamp 
+    data = load_messages()
+    users = [u.strip() for u in args.users.split(",")] if args.users else list(data["user_name"].unique())
+    os.makedirs(PROFILES_DIR, exist_ok=True)
+
+    with ThreadPoolExecutor(max_workers=max(1, args.concurrency)) as pool:
+        for user in tqdm(users):
+            batches = user_batches(data, user, args.batch_size)
+            started = time.perf_counter()
+            if args.mode == "tree":
+                profile, steps = build_profile_tree(mistral, user, batches, pool)
+                write_profile(f"{user}_mistral_b{args.batch_size}_tree_latest.txt", profile)
+            else:
+                # Save intermediate profiles
+                profile = build_profile_sequential(
+                    mistral, user, batches,
+                    on_version=lambda n, text: write_profile(f"{user}_mistral_b{args.batch_size}_v{n}.txt", text),
+                )
+                steps = len(batches)
+                # You can also save the final profile after all batches
+                write_profile(f"{user}_mistral_b{args.batch_size}_latest.txt", profile)
+            print(f"{user}: {len(batches)} batches, {steps} sequential LLM steps, {time.perf_counter() - started:.1f}s ({args.mode}).")
+
 
-    # You can also save the final profile after all batches
-    with open(f"profiles/{user}_mistral_b{BATCH_SIZE}_latest.txt", "w") as f:
-        f.write(current_profile_str)
\ No newline at end of file
+if __name__ == "__main__":
+    main()
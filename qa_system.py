@@ -1,54 +1,34 @@
+import os
 import re
-import spacy
-from fuzzywuzzy import process
+import json
+import uuid
 # Import the shared database collection
-from core.db import retriever
+from core.db import is_ready, message_count, retrieve_user_messages, search_user_messages, RECENCY_K
+from core.timeutils import wants_recent
+from core.rerank import candidate_k, rerank
+from core.evidence import EvidenceIndex
+from core.session import sessions
+from core.scheduler import retrieval_slot
+# Shared slim spaCy pipeline and name extraction (also used by tools.py)
+from core.nlp import KNOWN_USER_NAMES, extract_user_name
+# Prompt templates (side-effect free, shared with scripts/benchmark_generators.py)
+from core.prompts import (
+    ANSWER_SCHEMA, NO_INFO_ANSWER, build_answer_prompt, build_structured_prompt,
+    format_context, number_context_lines,
+)
+from question_router import (
+    classify_question, requested_field, extract_field,
+    format_extracted_answer, format_stats_answer, answer_analytics,
+)
 # Import the "switched" generator model
 from generators import generator
 
-nlp = spacy.load("en_core_web_sm")
-KNOWN_USER_NAMES = [
-    'Thiago Monteiro', 'Armand Dupont', "Lily O'Sullivan",
-    'Fatima El-Tahir', 'Sophia Al-Farsi', 'Layla Kawaguchi',
-    'Amina Van Den Berg', 'Lorenzo Cavalli', 'Vikram Desai',
-    'Hans Müller'
-]
-
-# --- Helper Function for Name Extraction ---
-def extract_user_name(question: str) -> str | None:
-    """
-    Finds the most likely full user name mentioned in a question.
-    Use this first to identify *who* the user is asking about.
-    Handles typos like 'Amona' or 'Vikrem'.
-    """
-    if nlp is None:
-        return "Error: spaCy NER model not loaded."
-
-    doc = nlp(question)
-    
-    # Stage 1: Get all potential names (PERSON, ORG, PROPN)
-    entity_names = [ent.text for ent in doc.ents if ent.label_ in ("PERSON", "ORG")]
-    proper_nouns = [token.text for token in doc if token.pos_ == "PROPN"]
-    potential_names = []
-    if not entity_names and not proper_nouns:
-        potential_names = question.lower().replace("?", "").split()
-    names_list = set(entity_names + proper_nouns + potential_names)
-    
-    # Stage 2: Find the best fuzzy match
-    users_in_question = []
-    for name in names_list:
-        possible_names_with_confidence = process.extractBests(
-            name,
-            KNOWN_USER_NAMES,
-            score_cutoff=70,
-            limit=5
-        )
-        users_in_question.extend(
-            [name for name, _ in possible_names_with_confidence]
-        )
-    if users_in_question:
-        return list(set(users_in_question))
-    return "Error: No user name found in question."
+# Output mode for answer_question: "text" (Answer/Evidences text) or "json" (schema-constrained)
+QA_OUTPUT_MODE = os.getenv("QA_OUTPUT_MODE", "text").strip().strip('"').strip("'").lower()
+# Send each question to the cheapest pipeline that can answer it (see question_router.py)
+QA_ROUTING = os.getenv("QA_ROUTING", "true").strip().strip('"').strip("'").lower() == "true"
+# Let the router hand multi-part questions to the LangGraph agent (otherwise they use RAG)
+QA_ROUTE_AGENT = os.getenv("QA_ROUTE_AGENT", "false").strip().strip('"').strip("'").lower() == "true"
 
 # --- User Profile Information ---
 def get_user_profiles(user_names: list[str]) -> dict[str, dict]:
@@ -60,42 +40,91 @@ def get_user_profiles(user_names: list[str]) -> dict[str, dict]:
     return profiles
 
 # --- The Core RAG Function ---
-def get_rag_information(user_names, question: str) -> str:
+def retrieve_documents(user_names, question: str, session=None) -> list[str]:
     """
     Searches the message database for messages from a specific user
-    that are semantically related to a query.
+    that are semantically related to a query. With a conversation `session`,
+    follow-ups are answered from the session's cached candidates when possible.
+    With RERANK=true a larger candidate set is re-ranked by a cross-encoder
+    and only the best few messages per user are kept. Runs in a retrieval
+    slot of the priority scheduler (core/scheduler.py).
     """
-    if retriever is None:
+    if not is_ready():
         return ["Error: Retriever not initialized."]
 
     print(f"--- Tool: search_messages(user_names='{user_names}', query='{question}') ---")
+    with retrieval_slot():
+        return _retrieve_documents(user_names, question, session)
 
+def _retrieve_documents(user_names, question: str, session=None) -> list[str]:
     # This is the 10x step: we filter the RAG search by the *user_names*
     # This is a "Metadata Filter"
     rag_result = []
-    for user_name in user_names:
-        filtered_retriever = retriever.vectorstore.as_retriever(
-            search_kwargs={
-                "k": 10,
-                "filter": {"user_name": user_name}
-            }
-        )
-        # Run the RAG search
-        results = filtered_retriever.invoke(question)
-        rag_result.extend([doc.page_content for doc in results])
-        
+    if wants_recent(question):
+        # Newest relevant messages first, so fewer candidates reach the prompt
+        for user_name in user_names:
+            rag_result.extend(search_user_messages(user_name, question, k=RECENCY_K, prefer_recent=True))
+    elif session is not None:
+        rag_result = rerank(question, session.retrieve(user_names, question, k=candidate_k(10)))
+    else:
+        for user_name in user_names:
+            # Run the RAG search (messages, or conversation chunks expanded to messages)
+            rag_result.extend(retrieve_user_messages(user_name, question, k=candidate_k(10)))
+        rag_result = rerank(question, rag_result)
+    return rag_result
+
+def get_rag_information(user_names, question: str, session=None) -> str:
+    """Retrieves the user's relevant messages and formats them as the prompt context."""
+    rag_result = retrieve_documents(user_names, question, session=session)
+
     # 2. Build the context string
-    context = "Here is the relevant information I found:\n"
-    for i, doc in enumerate(rag_result):
-        context += f"- {doc}\n" 
-    return context
+    return format_context(rag_result)
+
+def answer_structured(question: str, context: str, allow_inference: bool = True) -> str:
+    """
+    Asks the generator for JSON matching ANSWER_SCHEMA (constrained decoding
+    where the backend supports it) and renders it in the usual
+    Answer / Inferences / Evidences text format.
+    """
+    context_lines = number_context_lines(context)
+    prompt = build_structured_prompt(question, context_lines, allow_inference)
+
+    print("Final Prompt to Generator (json mode):\n", prompt)
+    response_text = generator.generate_structured(prompt, ANSWER_SCHEMA)
+    try:
+        # Backends without constrained decoding may wrap the object in prose or fences
+        payload = json.loads(response_text[response_text.find("{"): response_text.rfind("}") + 1])
+        answer = str(payload.get("answer", "")).strip()
+        evidence_ids = payload.get("evidence_ids") or []
+        inferences = [str(x).strip() for x in payload.get("inferences") or [] if str(x).strip()]
+    except (ValueError, AttributeError, TypeError):
+        return NO_INFO_ANSWER
+
+    # Ids only need a range check; no text matching against the context
+    if not answer or answer == NO_INFO_ANSWER or not evidence_ids:
+        return NO_INFO_ANSWER
+    if not all(isinstance(i, int) and 1 <= i <= len(context_lines) for i in evidence_ids):
+        return NO_INFO_ANSWER
+
+    parts = [answer]
+    if inferences and allow_inference:
+        parts.append("Inferences:")
+        parts.extend(inf if inf.upper().startswith("INFERRED:") else f"INFERRED: {inf}" for inf in inferences)
+    parts.append("Evidences:")
+    parts.extend(context_lines[i - 1] for i in dict.fromkeys(evidence_ids))
+    return "\n".join(parts)
 
 # --- Main QA Function ---
-def answer_question(question: str, using_rag=True, allow_inference: bool = True) -> str:
+def answer_question(question: str, using_rag=True, allow_inference: bool = True, structured: bool | None = None, session_id: str | None = None, user_names=None) -> str:
     context = ""
-    user_names = extract_user_name(question)
+    if user_names is None:
+        user_names = extract_user_name(question)
+    # In a conversation, follow-ups without a name refer to the users already resolved
+    session = sessions.get(session_id) if session_id else None
+    if session is not None:
+        user_names = session.resolve_users(user_names)
     if using_rag:
-        context = get_rag_information(user_names, question)
+        context = get_rag_information(user_names, question, session=session)
         if context is None:
             return "I could not find any relevant information for that query."
     else:
@@ -111,43 +140,19 @@ def answer_question(question: str, using_rag=True, allow_inference: bool = True)
         for name, profile in profiles.items():
             context += f"\n--- Profile of {name} ---\n{profile}\n"
 
+    if structured is None:
+        structured = QA_OUTPUT_MODE == "json"
+    if structured:
+        return answer_structured(question, context, allow_inference)
+
     # Build the final prompt. If `allow_inference` is True, we include extra
     # instructions allowing clearly-labeled speculative inferences.
-    base_prompt = (
-        """
-    You are a professional assistant. Your task is to answer the user's question using ONLY the provided CONTEXT. Treat the CONTEXT as authoritative and complete for the purposes of this answer.
-
-    OUTPUT FORMAT (must follow exactly):
-    <Answer text>
-    Evidences:
-    <evidence line 1>
-    <evidence line 2>
-    ...
-
-    IMPORTANT RULES (must follow exactly):
-    1) Do NOT use or invent any information that is NOT present in the CONTEXT.
-    2) The Evidences section must list one or more exact context lines (verbatim) that support the Answer. Each evidence must appear on its own line after the `Evidences:` header.
-    3) If the answer is not present in the CONTEXT, respond exactly with the sentence: "I do not have that information." and nothing else.
-    4) Be concise. Keep the final answer to 1 sentence plus the Evidences section when applicable.
-
-    """
-    )
-
-    inference_instructions = (
-        """
-    You MAY include an optional `Inferences:` section placed BEFORE `Evidences:`. Each inference line MUST be prefixed with `INFERRED:` to mark it as speculative (for example: `INFERRED: Likely owns a car because they mention taking it to car service.`). Inferences are allowed but must be concise and clearly labeled. Evidence lines are still required and must come after `Evidences:`.
-
-    """
-    )
-
-    prompt_body = base_prompt + (inference_instructions if allow_inference else "")
-
-    prompt_template = f"""{prompt_body}\n**CONTEXT:**\n{context}\n\n**QUESTION:**\n{question}\n\n**ANSWER (follow rules above):**\n"""
+    prompt_template = build_answer_prompt(question, context, allow_inference)
     
     print("Final Prompt to Generator:\n", prompt_template)
     # 5. Call the generator (This is the pluggable part!)
     response_text = generator.generate(prompt_template)
-    # --- Post-check: validate evidence lines exist verbatim in the context ---
+    # --- Post-check: validate evidence lines are backed by the context ---
     # Accepted formats:
     # 1) <Answer>\nEvidences:\n<e1>\n<e2>...
     # 2) <Answer>\nInferences:\nINFERRED: ...\n...\nEvidences:\n<e1>\n<e2>...
@@ -181,12 +186,71 @@ def answer_question(question: str, using_rag=True, allow_inference: bool = True)
         if not evidence_lines:
             return "I do not have that information."
 
-        # Validate each evidence appears verbatim in the retrieved context
-        for ev in evidence_lines:
-            if ev not in context:
-                return "I do not have that information."
+        # Validate each evidence against the retrieved context lines (exact,
+        # normalized or near-verbatim); the context is indexed only once.
+        is_supported, evidence_matches = EvidenceIndex(context).validate(evidence_lines)
+        print("Evidence match scores:", [(m["match"], m["score"]) for m in evidence_matches])
+        if not is_supported:
+            return "I do not have that information."
 
-        # All checks passed — return the original response trimmed
-        return response_text.strip()
+        # All checks passed. Evidence is returned as the context lines it
+        # matched, never as the model's (possibly reworded) copy of them
+        matched_lines = list(dict.fromkeys(m["line"] for m in evidence_matches))
+        return response_text[: evidence_match.end()].strip() + "\n" + "\n".join(matched_lines)
     except Exception:
-        return "I do not have that information."
\ No newline at end of file
+        return "I do not have that information."
+
+# --- Routed QA Function ---
+def get_system_stats() -> dict:
+    return {
+        "number_of_users": len(KNOWN_USER_NAMES),
+        "number_of_messages": message_count(),
+        "users": KNOWN_USER_NAMES,
+    }
+
+def answer_routed(question: str, session_id: str | None = None, user_names=None) -> str:
+    """
+    Classifies the question (rules only, no model call) and runs the cheapest
+    pipeline for it: stats -> analytics -> field extraction -> profile -> RAG -> agent.
+    Cheap tiers fall through to RAG when they cannot answer.
+    """
+    found = extract_user_name(question) if user_names is None else user_names
+    user_names = found if isinstance(found, list) else []
+    session = sessions.get(session_id) if session_id else None
+    if session is not None:
+        user_names = session.resolve_users(user_names)
+
+    route, reason = classify_question(question, user_names)
+    print(f"--- Router: {route} ({reason}) ---")
+
+    if route == "stats":
+        return format_stats_answer(get_system_stats())
+
+    if route == "analytics":
+        answer = answer_analytics(question, user_names)
+        if answer is not None:
+            return answer
+
+    if route == "extract":
+        field = requested_field(question)
+        extracted = extract_field(field, retrieve_documents(user_names, question, session=session))
+        if extracted is not None:
+            return format_extracted_answer(field, extracted)
+
+    if route == "profile":
+        try:
+            return answer_question(question, using_rag=False, user_names=user_names)
+        except FileNotFoundError:
+            pass
+
+    if route == "agent" and QA_ROUTE_AGENT:
+        from langchain_core.messages import HumanMessage
+        from agent import app as agent_app
+        thread_id = f"qa:{session_id or uuid.uuid4()}"
+        final_state = agent_app.invoke(
+            {"messages": [HumanMessage(content=question)]},
+            config={"configurable": {"thread_id": thread_id}},
+        )
+        return final_state["messages"][-1].content
+
+    return answer_question(question, session_id=session_id, user_names=found)
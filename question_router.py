@@ -0,0 +1,198 @@
+import re
+from core.analytics import CATEGORIES, get_analytics
+
+# --- Tiers, cheapest first ---
+# stats:   meta questions answered from the user list / collection count (no LLM)
+# analytics: counts / first / last mention over every message (Parquet side-store, no LLM)
+# extract: single structured field (phone, email) pulled from retrieved messages by regex (no LLM)
+# profile: broad "tell me about X" questions answered from the offline profile
+# rag:     single-shot retrieval + one LLM call (the default)
+# agent:   multi-part / multi-user questions that need the tool loop
+ROUTES = ("stats", "analytics", "extract", "profile", "rag", "agent")
+
+STATS_PATTERNS = [
+    re.compile(r"\bhow many (users|members|people|clients|messages)\b"),
+    re.compile(r"\bnumber of (users|members|people|clients|messages)\b"),
+    re.compile(r"\b(list|which|who are) (all )?(the )?(users|members|clients)\b"),
+    re.compile(r"\bsystem (stats|statistics)\b"),
+]
+# Only explicit requests for the value ("what is X's phone number?"); a
+# question merely mentioning a phone ("phone call or a text?") goes to rag
+_ASK = r"\b(?:what(?:'s| is| was| are)|give me|share|look up)\s+[^?]{0,40}?"
+FIELD_PATTERNS = {
+    "phone number": re.compile(_ASK + r"\b(?:phone|mobile|cell|telephone|contact)(?:\s+number\b|\s*\??$)"),
+    "email address": re.compile(_ASK + r"\be-?mail(?:\s+address\b|\s*\??$)"),
+}
+PROFILE_PATTERNS = [
+    re.compile(r"\btell me (everything |more )?about\b"),
+    re.compile(r"\bwhat do (you|we) know about\b"),
+    re.compile(r"\b(profile|overview|summary) of\b"),
+    re.compile(r"\bsummari[sz]e\b"),
+]
+_VERB = r"(?:mention(?:ed)?|ask(?:ed)? (?:about|for)|talk(?:ed)? about|book(?:ed)?|request(?:ed)?|order(?:ed)?|reserve[d]?)"
+_TERM = r"(?:a |an |the |any )?(?P<term>[\w' -]+?)\s*\??$"
+# "How many cars does X have?" asks about possessions, not mentions; counting
+# messages that contain "car" would answer a different question, so it goes to rag
+_NOT_POSSESSION = r"(?!.*\b(?:have|has|had|own|owns|owned|possess(?:es)?|got)\s*\??$)"
+# (kind, pattern); `term` is what to count, None counts every message
+ANALYTICS_PATTERNS = [
+    ("count", re.compile(r"\bhow many times\b.*?\b" + _VERB + r"\s+" + _TERM)),
+    ("count", re.compile(r"\bhow often\b.*?\b" + _VERB + r"s?\s+" + _TERM)),
+    ("count", re.compile(r"\bhow many (?P<term>[a-z]+(?: [a-z]+)?) (?:did|does|has|have|were|was)\b" + _NOT_POSSESSION)),
+    ("last", re.compile(r"\bwhen did\b.*?\blast\s+" + _VERB + r"\s+" + _TERM)),
+    ("first", re.compile(r"\bwhen did\b.*?\bfirst\s+" + _VERB + r"\s+" + _TERM)),
+    ("last", re.compile(r"\b(?:last|most recent) time\b.*?\b" + _VERB + r"\s+" + _TERM)),
+]
+AGENT_PATTERNS = [
+    re.compile(r"\b(compare|comparison|difference between|differ)\b"),
+    re.compile(r"\b(both|each of|all of them|everyone)\b"),
+]
+
+MESSAGE_RE = re.compile(r"^-?\s*On (\S+), user (.+?) sent a message: '(.*)'\s*$", re.DOTALL)
+PHONE_RE = re.compile(r"(?<![\w+])\+?\d[\d\s().-]{5,}\d(?!\w)")
+# Dates and times are blanked out before PHONE_RE runs ("2025-07-14" is not 20250714)
+DATE_TIME_RE = re.compile(
+    r"(?<![\d./-])(?:\d{4}[-/.]\d{1,2}[-/.]\d{1,2}|\d{1,2}[-/.]\d{1,2}[-/.](?:\d{4}|\d{2}))(?![./-]?\d)"
+    r"|\b\d{1,2}:\d{2}(?::\d{2})?\b"
+)
+# A phone number must have one of these within PHONE_CUE_WINDOW characters
+PHONE_CUE_RE = re.compile(r"\b(?:phone|number|call|text|mobile|cell|tel|contact|reach|whatsapp|sms)\b", re.IGNORECASE)
+PHONE_CUE_WINDOW = 40
+EMAIL_RE = re.compile(r"[\w.+-]+@[\w-]+(?:\.[\w-]+)+")
+
+
+def classify_question(question: str, user_names: list[str]) -> tuple[str, str]:
+    """Returns (route, reason) for a question given the users resolved in it."""
+    q = question.lower()
+    if not user_names:
+        if any(p.search(q) for p in STATS_PATTERNS):
+            return "stats", "meta question without a user"
+        if analytics_query(question) is not None:
+            return "analytics", "count or timeline question across all users"
+        return "rag", "no user resolved"
+
+    if q.count("?") > 1 or (len(user_names) > 1 and any(p.search(q) for p in AGENT_PATTERNS)):
+        return "agent", "multi-part or multi-user question"
+    if analytics_query(question) is not None:
+        return "analytics", "count or timeline question"
+    field = requested_field(question)
+    if field and len(user_names) == 1:
+        return "extract", f"asks for a {field}"
+    if any(p.search(q) for p in PROFILE_PATTERNS):
+        return "profile", "broad question about a user"
+    return "rag", "default"
+
+
+def _singular(word: str) -> str:
+    if word.endswith("ies") and len(word) > 4:
+        return word[:-3] + "y"
+    if word.endswith("s") and not word.endswith("ss") and len(word) > 3:
+        return word[:-1]
+    return word
+
+
+def analytics_query(question: str) -> dict | None:
+    """
+    {"kind": "count" | "first" | "last", "keyword", "category"} for aggregate
+    questions, else None. A term naming a category (e.g. "payments") filters
+    on the category instead of the word.
+    """
+    q = question.lower().strip()
+    for kind, pattern in ANALYTICS_PATTERNS:
+        match = pattern.search(q)
+        if not match:
+            continue
+        term = _singular(match.group("term").strip(" '"))
+        if term in ("message", "time"):
+            return {"kind": kind, "keyword": None, "category": None}
+        for category in CATEGORIES:
+            if term in (category, _singular(category)):
+                return {"kind": kind, "keyword": None, "category": category}
+        return {"kind": kind, "keyword": term, "category": None}
+    return None
+
+
+def answer_analytics(question: str, user_names: list[str]) -> str | None:
+    """Answers a count / first / last question from the analytics table; None if it cannot."""
+    query = analytics_query(question)
+    analytics = get_analytics()
+    if query is None or analytics is None:
+        return None
+    rows = analytics.select(user_names=user_names or None, keyword=query["keyword"], category=query["category"])
+    summary = analytics.summarize(rows, group_by="user" if len(user_names) != 1 else None)
+    if not summary["count"]:
+        return None
+
+    who = " and ".join(user_names) if user_names else "Members"
+    what = f"'{query['keyword']}'" if query["keyword"] else (f"{query['category']}" if query["category"] else "anything")
+    if query["kind"] == "count":
+        answer = f"{who} mentioned {what} in {summary['count']} message(s) between {summary['first'][:10]} and {summary['last'][:10]}."
+        if summary["groups"]:
+            answer += " Per user: " + ", ".join(f"{k}: {v}" for k, v in summary["groups"].items()) + "."
+        evidence = summary["examples"]
+    elif query["kind"] == "last":
+        answer = f"{who} last mentioned {what} on {summary['last'][:10]}."
+        evidence = summary["examples"][:1]
+    else:
+        answer = f"{who} first mentioned {what} on {summary['first'][:10]}."
+        evidence = rows.sort_values("timestamp")["document"].head(1).tolist()
+    return answer + "\nEvidences:\n" + "\n".join(f"- {doc}" for doc in evidence)
+
+
+def requested_field(question: str) -> str | None:
+    q = question.lower()
+    for field, pattern in FIELD_PATTERNS.items():
+        if pattern.search(q):
+            return field
+    return None
+
+
+def _find_values(field: str, text: str) -> list[str]:
+    if field == "email address":
+        return EMAIL_RE.findall(text)
+    values = []
+    text = DATE_TIME_RE.sub(lambda m: " " * len(m.group()), text)
+    for match in PHONE_RE.finditer(text):
+        digits = re.sub(r"\D", "", match.group())
+        # Phone numbers only; longer digit runs are card-like numbers we never expose
+        if not 7 <= len(digits) <= 15:
+            continue
+        window = text[max(0, match.start() - PHONE_CUE_WINDOW): match.end() + PHONE_CUE_WINDOW]
+        if PHONE_CUE_RE.search(window):
+            values.append(("+" if match.group().startswith("+") else "") + digits)
+    return values
+
+
+def extract_field(field: str, documents: list[str]) -> dict | None:
+    """
+    Finds `field` in the message text of retrieved documents and returns the
+    value from the most recent message as {"value", "user_name", "document"}.
+    """
+    best = None
+    for doc in documents:
+        match = MESSAGE_RE.match(doc.strip())
+        if not match:
+            continue
+        timestamp, user_name, message = match.groups()
+        values = _find_values(field, message)
+        # ISO-8601 timestamps from the same source compare correctly as strings
+        if values and (best is None or timestamp > best["timestamp"]):
+            best = {"value": values[-1], "user_name": user_name, "timestamp": timestamp, "document": doc.strip()}
+    return best
+
+
+def format_extracted_answer(field: str, extracted: dict) -> str:
+    """Same Answer / Evidences layout the generator is asked to produce."""
+    document = extracted["document"]
+    evidence = document if document.startswith("- ") else f"- {document}"
+    return (
+        f"{extracted['user_name']}'s most recently mentioned {field} is {extracted['value']}.\n"
+        f"Evidences:\n{evidence}"
+    )
+
+
+def format_stats_answer(stats: dict) -> str:
+    return (
+        f"There are {stats['number_of_users']} users and {stats['number_of_messages']} messages in the system. "
+        f"Users: {', '.join(stats['users'])}."
+    )
@@ -0,0 +1,76 @@
+"""Offline batch runner: answers a file of questions through qa_system.
+
+Usage (from the project root):
+  python -m scripts.batch_ask --input questions.txt --output results.jsonl --concurrency 8
+
+Input is either plain text (one question per line) or JSON lines with a
+"question" field; any other fields (e.g. "id") are copied to the output.
+Output is one JSON object per question, written as soon as it is answered
+(see batch_qa.answer_batch for the fields).
+"""
+import argparse
+import json
+import sys
+import time
+
+from batch_qa import answer_batch, BATCH_CONCURRENCY
+from generators.lifecycle import OLLAMA_LIFECYCLE, ollama_lifecycle
+
+
+def read_questions(path: str) -> tuple[list[str], list[dict]]:
+    """Questions plus the extra fields of each input record (empty for text input)."""
+    questions, extras = [], []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if path.endswith((".jsonl", ".ndjson")):
+                record = json.loads(line)
+                questions.append(str(record.pop("question")))
+                extras.append(record)
+            else:
+                questions.append(line)
+                extras.append({})
+    return questions, extras
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--input", required=True, help="Questions file (.txt or .jsonl).")
+    parser.add_argument("--output", default="-", help="Where to write JSON lines ('-' for stdout).")
+    parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY, help="Questions generated at the same time.")
+    parser.add_argument("--no-routing", action="store_true", help="Always use the RAG pipeline (skip the question router).")
+    args = parser.parse_args()
+
+    questions, extras = read_questions(args.input)
+    print(f"Loaded {len(questions)} questions from {args.input}.", file=sys.stderr)
+    # No API lifespan here to warm the model: pull (if needed) and load it before the first question
+    if OLLAMA_LIFECYCLE:
+        ollama_lifecycle.prepare_registered()
+
+    out = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    started = time.perf_counter()
+    errors = 0
+    try:
+        kwargs = {"routed": False} if args.no_routing else {}
+        for n, result in enumerate(answer_batch(questions, concurrency=args.concurrency, **kwargs), start=1):
+            errors += "error" in result
+            out.write(json.dumps({**extras[result["index"]], **result}, ensure_ascii=False) + "\n")
+            out.flush()
+            if n % 50 == 0:
+                print(f"{n}/{len(questions)} answered...", file=sys.stderr)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    elapsed = time.perf_counter() - started
+    print(
+        f"Answered {len(questions)} questions in {elapsed:.1f}s "
+        f"({len(questions) / max(elapsed, 1e-9):.2f} q/s, {errors} errors).",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
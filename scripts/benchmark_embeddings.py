@@ -0,0 +1,141 @@
+"""Accuracy/latency comparison of the embedding backends (torch, onnx, onnx-int8).
+
+Usage (from the project root):
+  python -m scripts.benchmark_embeddings --docs 1000 --out reports/embedding_backends.md
+
+Accuracy is measured against the torch vectors that `ingest_data.py` stores by
+default: per-document cosine similarity and top-10 neighbour overlap for a set
+of typical questions.
+"""
+import argparse
+import json
+import os
+import time
+import numpy as np
+
+from core.embeddings import EMBED_BACKENDS, get_embedding_function
+
+DATA_FILE = "data/response_1762800357568.json"
+SAMPLE_QUERIES = [
+    "What is Thiago Monteiro's phone number?",
+    "What seat does Vikram Desai prefer on flights?",
+    "Does Amina Van Den Berg have any allergies?",
+    "When is Layla Kawaguchi planning her trip to London?",
+    "How many cars does Vikram Desai have?",
+    "What are Fatima El-Tahir's favorite restaurants?",
+    "Which hotel amenities does Sophia Al-Farsi ask for?",
+    "Did Lorenzo Cavalli enjoy the concert package?",
+]
+TOP_K = 10
+
+
+def load_documents(limit: int) -> list[str]:
+    with open(DATA_FILE, "r", encoding="utf-8") as f:
+        items = json.load(f).get("items", [])
+    docs = [
+        f"On {item.get('timestamp', 'Unknown date')}, user {item.get('user_name', 'Unknown user')} sent a message: '{item.get('message', '')}'"
+        for item in items
+        if item.get("message") and item["message"].strip()
+    ]
+    return docs[:limit]
+
+
+def benchmark_backend(backend: str, docs: list[str], queries: list[str]) -> dict:
+    start = time.perf_counter()
+    embedder = get_embedding_function(backend)
+    load_s = time.perf_counter() - start
+
+    embedder.embed_query("warmup")
+    start = time.perf_counter()
+    doc_vectors = np.asarray(embedder.embed_documents(docs), dtype=np.float32)
+    ingest_s = time.perf_counter() - start
+
+    latencies = []
+    query_vectors = []
+    for _ in range(3):
+        for q in queries:
+            t0 = time.perf_counter()
+            vec = embedder.embed_query(q)
+            latencies.append((time.perf_counter() - t0) * 1000)
+            query_vectors.append(vec)
+    query_vectors = np.asarray(query_vectors[:len(queries)], dtype=np.float32)
+
+    return {
+        "backend": backend,
+        "load_s": load_s,
+        "docs_per_s": len(docs) / ingest_s,
+        "query_p50_ms": float(np.percentile(latencies, 50)),
+        "query_p95_ms": float(np.percentile(latencies, 95)),
+        "doc_vectors": doc_vectors,
+        "query_vectors": query_vectors,
+    }
+
+
+def _normalize(m: np.ndarray) -> np.ndarray:
+    return m / np.clip(np.linalg.norm(m, axis=1, keepdims=True), 1e-12, None)
+
+
+def accuracy_vs_reference(result: dict, reference: dict) -> dict:
+    docs, ref_docs = _normalize(result["doc_vectors"]), _normalize(reference["doc_vectors"])
+    cos = (docs * ref_docs).sum(axis=1)
+
+    overlaps = []
+    for q, ref_q in zip(_normalize(result["query_vectors"]), _normalize(reference["query_vectors"])):
+        top = set(np.argsort(-(docs @ q))[:TOP_K])
+        ref_top = set(np.argsort(-(ref_docs @ ref_q))[:TOP_K])
+        overlaps.append(len(top & ref_top) / TOP_K)
+    return {
+        "cosine_mean": float(cos.mean()),
+        "cosine_min": float(cos.min()),
+        "topk_overlap": float(np.mean(overlaps)),
+    }
+
+
+def render_report(results: list[dict], n_docs: int) -> str:
+    reference = results[0]
+    lines = [
+        "# Embedding backend comparison (all-MiniLM-L6-v2)",
+        "",
+        f"- Documents embedded: {n_docs}",
+        f"- Queries: {len(SAMPLE_QUERIES)} (x3 repetitions for latency)",
+        f"- Reference backend for accuracy: `{reference['backend']}`",
+        f"- CPU threads: {os.cpu_count()}",
+        "",
+        f"| Backend | Load (s) | Ingest (docs/s) | Query p50 (ms) | Query p95 (ms) | Cosine mean | Cosine min | Top-{TOP_K} overlap |",
+        "|---|---|---|---|---|---|---|---|",
+    ]
+    for r in results:
+        acc = accuracy_vs_reference(r, reference)
+        lines.append(
+            f"| {r['backend']} | {r['load_s']:.2f} | {r['docs_per_s']:.1f} | "
+            f"{r['query_p50_ms']:.2f} | {r['query_p95_ms']:.2f} | "
+            f"{acc['cosine_mean']:.5f} | {acc['cosine_min']:.5f} | {acc['topk_overlap']:.3f} |"
+        )
+    return "\n".join(lines) + "\n"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=1000, help="Number of messages to embed.")
+    parser.add_argument("--backends", default=",".join(EMBED_BACKENDS), help="Comma-separated backends; the first is the accuracy reference.")
+    parser.add_argument("--out", default="reports/embedding_backends.md", help="Where to write the markdown report.")
+    args = parser.parse_args()
+
+    docs = load_documents(args.docs)
+    print(f"Loaded {len(docs)} documents from {DATA_FILE}.")
+
+    results = []
+    for backend in [b.strip() for b in args.backends.split(",") if b.strip()]:
+        print(f"Benchmarking backend: {backend}...")
+        results.append(benchmark_backend(backend, docs, SAMPLE_QUERIES))
+
+    report = render_report(results, len(docs))
+    os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+    with open(args.out, "w", encoding="utf-8") as f:
+        f.write(report)
+    print(report)
+    print(f"Report written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
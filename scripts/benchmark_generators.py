@@ -0,0 +1,297 @@
+"""Generator backend benchmark: time to first token, decode speed, latency under concurrency, memory.
+
+Usage (from the project root):
+  python -m scripts.benchmark_generators --backends mock
+  python -m scripts.benchmark_generators --backends mock,litellm,huggingface,gemini --concurrency 1,4,16
+
+Every backend runs the same fixed prompts, built with answer_question's
+template (core/prompts.py) around each question's context: the user's
+best-matching messages from the data file, or built-in messages when the
+file is missing. Backends are measured in separate processes, so each
+process's peak RSS belongs to one backend, and configured as for
+GENERATOR_MODEL=<backend> (.env), with the scheduler and cache off.
+
+- TTFT and decode speed come from streaming answers one at a time. Decode
+  tokens/s covers the tokens after the first; tokens are estimated as
+  characters / 4, so backends are counted the same way.
+- Latency p50/p95 and throughput are measured at each concurrency level.
+- Peak RSS is the benchmark process's, which includes in-process models
+  (huggingface). For Ollama models the server's resident size (/api/ps) is
+  reported too.
+
+The `mock` backend (generators/mock.py, MOCK_* settings) needs no model.
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+DATA_FILE = "data/response_1762800357568.json"
+BENCH_QUESTIONS = [
+    ("What is Thiago Monteiro's phone number?", "Thiago Monteiro"),
+    ("What seat does Vikram Desai prefer on flights?", "Vikram Desai"),
+    ("Does Amina Van Den Berg have any allergies?", "Amina Van Den Berg"),
+    ("When is Layla Kawaguchi planning her trip to London?", "Layla Kawaguchi"),
+    ("How many cars does Vikram Desai have?", "Vikram Desai"),
+    ("What are Fatima El-Tahir's favorite restaurants?", "Fatima El-Tahir"),
+    ("Which hotel amenities does Sophia Al-Farsi ask for?", "Sophia Al-Farsi"),
+    ("Did Lorenzo Cavalli enjoy the concert package?", "Lorenzo Cavalli"),
+]
+# Messages per prompt, as answer_question gets them after reranking
+CONTEXT_MESSAGES = 10
+# Used when the data file is missing, so prompts keep a realistic size
+FALLBACK_MESSAGES = [
+    "Please book a table for four at an Italian restaurant this Friday at 8pm.",
+    "Can you update my phone number to 555-349-7841 on file?",
+    "I prefer an aisle seat on all long-haul flights, please.",
+    "Arrange a private car from the airport to my hotel on arrival.",
+    "I have a severe peanut allergy; please inform the restaurant.",
+    "Book two tickets for the opera next Saturday, orchestra seats.",
+    "I need a suite with a view of the river for three nights in London.",
+    "Thanks, the concert package was excellent, especially the backstage tour.",
+    "Please renew my gym membership and schedule a spa session.",
+    "Send the invoice for last month's yacht rental to my assistant.",
+    "I'll be travelling to Tokyo in March; please look into business class.",
+    "Can you reserve the same villa in Santorini as last summer?",
+]
+CONCURRENCY_LEVELS = "1,4,16"
+_WORDS = re.compile(r"[a-z']+")
+
+
+# --- Prompts ---
+def _document(item: dict) -> str:
+    # Same text as ingest_data.py stores in the vector index
+    return f"On {item.get('timestamp', 'Unknown date')}, user {item.get('user_name', 'Unknown user')} sent a message: '{item.get('message', '')}'"
+
+
+def build_prompts() -> list[str]:
+    """answer_question prompts for BENCH_QUESTIONS (the same on every run and backend)."""
+    from core.prompts import build_answer_prompt, format_context
+
+    items = []
+    if os.path.exists(DATA_FILE):
+        with open(DATA_FILE, "r", encoding="utf-8") as f:
+            items = [item for item in json.load(f).get("items", []) if item.get("message", "").strip()]
+    prompts = []
+    for question, user in BENCH_QUESTIONS:
+        messages = [item for item in items if item.get("user_name") == user]
+        if messages:
+            # Stand-in for retrieval: the messages sharing the most words with the question
+            words = set(_WORDS.findall(question.lower()))
+            messages.sort(key=lambda item: (-len(words & set(_WORDS.findall(item["message"].lower()))), item.get("timestamp", "")))
+            documents = [_document(item) for item in messages[:CONTEXT_MESSAGES]]
+        else:
+            documents = [
+                _document({"timestamp": f"2025-0{1 + n % 9}-1{n % 10}T10:00:00", "user_name": user, "message": message})
+                for n, message in enumerate(FALLBACK_MESSAGES[:CONTEXT_MESSAGES])
+            ]
+        prompts.append(build_answer_prompt(question, format_context(documents)))
+    return prompts
+
+
+# --- Measurement (runs in one process per backend) ---
+def estimate_tokens(text: str) -> float:
+    return len(text) / 4
+
+
+def run_one(generator, prompt: str) -> dict:
+    """Streams one answer; returns its TTFT, end-to-end latency and size."""
+    started = time.perf_counter()
+    first = None
+    first_tokens = 0.0
+    pieces = []
+    for piece in generator.stream(prompt):
+        if first is None and piece:
+            first = time.perf_counter()
+            first_tokens = estimate_tokens(piece)
+        pieces.append(piece)
+    ended = time.perf_counter()
+    text = "".join(pieces)
+    tokens = estimate_tokens(text)
+    first = first or ended
+    decode_s = ended - first
+    return {
+        "ttft_s": first - started,
+        "latency_s": ended - started,
+        "tokens": tokens,
+        "decode_tps": (tokens - first_tokens) / decode_s if decode_s > 0 and tokens > first_tokens else None,
+        "error": text.startswith("Error:"),
+    }
+
+
+def percentile(values: list[float], pct: float) -> float | None:
+    values = sorted(v for v in values if v is not None)
+    if not values:
+        return None
+    index = min(len(values) - 1, max(0, round(pct / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def peak_rss_mb() -> float | None:
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def ollama_resident_mb(model_name: str) -> float | None:
+    """Memory the Ollama server holds for `model_name`, if it is an Ollama model."""
+    from generators.lifecycle import OLLAMA_HOST, ollama_model, _base_url
+    import urllib.request
+
+    model = ollama_model(model_name)
+    if not model:
+        return None
+    try:
+        with urllib.request.urlopen(_base_url(OLLAMA_HOST) + "/api/ps", timeout=5) as response:
+            loaded = json.loads(response.read()).get("models", [])
+    except Exception:
+        return None
+    for entry in loaded:
+        if entry.get("name") in (model, f"{model}:latest") or entry.get("model") in (model, f"{model}:latest"):
+            return entry.get("size", 0) / (1024 * 1024)
+    return None
+
+
+def benchmark_backend(backend: str, levels: list[int], min_requests: int) -> dict:
+    # The backend is built exactly as the app builds it, minus the scheduler
+    # (its slots would cap the concurrency under test) and the cache
+    os.environ["GENERATOR_MODEL"] = backend
+    os.environ["SCHEDULER"] = "false"
+    os.environ["GENERATOR_CACHE"] = "false"
+    started = time.perf_counter()
+    from generators import generator
+    prompts = build_prompts()
+    # The first call also pays for loading the model (Ollama, lazy clients)
+    warmup = run_one(generator, prompts[0])
+    load_s = time.perf_counter() - started
+
+    sequential = [run_one(generator, prompt) for prompt in prompts]
+    result = {
+        "backend": backend,
+        "model": generator.model_name,
+        "prompts": len(prompts),
+        "prompt_tokens_mean": sum(estimate_tokens(p) for p in prompts) / len(prompts),
+        "load_s": load_s,
+        "warmup_error": warmup["error"],
+        "ttft_p50_s": percentile([r["ttft_s"] for r in sequential], 50),
+        "ttft_p95_s": percentile([r["ttft_s"] for r in sequential], 95),
+        "decode_tps": percentile([r["decode_tps"] for r in sequential], 50),
+        "output_tokens_mean": sum(r["tokens"] for r in sequential) / len(sequential),
+        "levels": [],
+    }
+    for concurrency in levels:
+        n = max(min_requests, 2 * concurrency)
+        batch = [prompts[i % len(prompts)] for i in range(n)]
+        level_started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            runs = list(pool.map(lambda prompt: run_one(generator, prompt), batch))
+        wall_s = time.perf_counter() - level_started
+        result["levels"].append({
+            "concurrency": concurrency,
+            "requests": n,
+            "errors": sum(r["error"] for r in runs),
+            "latency_p50_s": percentile([r["latency_s"] for r in runs], 50),
+            "latency_p95_s": percentile([r["latency_s"] for r in runs], 95),
+            "ttft_p50_s": percentile([r["ttft_s"] for r in runs], 50),
+            "requests_per_s": n / wall_s,
+            "output_tps": sum(r["tokens"] for r in runs) / wall_s,
+        })
+    result["peak_rss_mb"] = peak_rss_mb()
+    result["server_mem_mb"] = ollama_resident_mb(generator.model_name)
+    return result
+
+
+# --- Report ---
+def _fmt(value, spec: str = ".2f", scale: float = 1.0) -> str:
+    return "n/a" if value is None else format(value * scale, spec)
+
+
+def render_report(results: list[dict]) -> str:
+    lines = [
+        "# Generator backend comparison",
+        "",
+        f"- Prompts: {len(BENCH_QUESTIONS)} answer_question prompts ({CONTEXT_MESSAGES} context messages each)",
+        f"- Data: {DATA_FILE if os.path.exists(DATA_FILE) else 'built-in messages (data file not found)'}",
+        "- Tokens are estimated as characters / 4",
+        f"- CPU threads: {os.cpu_count()}",
+        "",
+        "| Backend | Model | Load + first answer (s) | TTFT p50 (ms) | TTFT p95 (ms) | Decode tok/s | Output tokens | Peak RSS (MB) | Server memory (MB) |",
+        "|---|---|---|---|---|---|---|---|---|",
+    ]
+    for r in results:
+        if "error" in r:
+            lines.append(f"| {r['backend']} | failed: {r['error']} | | | | | | | |")
+            continue
+        lines.append(
+            f"| {r['backend']} | {r['model']} | {_fmt(r['load_s'])} | {_fmt(r['ttft_p50_s'], '.0f', 1000)} | "
+            f"{_fmt(r['ttft_p95_s'], '.0f', 1000)} | {_fmt(r['decode_tps'], '.1f')} | {_fmt(r['output_tokens_mean'], '.0f')} | "
+            f"{_fmt(r['peak_rss_mb'], '.0f')} | {_fmt(r['server_mem_mb'], '.0f')} |"
+        )
+    lines += [
+        "",
+        "| Backend | Concurrency | Requests | Errors | Latency p50 (s) | Latency p95 (s) | TTFT p50 (ms) | Requests/s | Output tok/s |",
+        "|---|---|---|---|---|---|---|---|---|",
+    ]
+    for r in results:
+        for level in r.get("levels", []):
+            lines.append(
+                f"| {r['backend']} | {level['concurrency']} | {level['requests']} | {level['errors']} | "
+                f"{_fmt(level['latency_p50_s'])} | {_fmt(level['latency_p95_s'])} | {_fmt(level['ttft_p50_s'], '.0f', 1000)} | "
+                f"{_fmt(level['requests_per_s'])} | {_fmt(level['output_tps'], '.1f')} |"
+            )
+    return "\n".join(lines) + "\n"
+
+
+def run_in_subprocess(backend: str, args) -> dict:
+    """Benchmarks one backend in a fresh interpreter; its last stdout line is the JSON result."""
+    command = [
+        sys.executable, "-m", "scripts.benchmark_generators", "--worker", backend,
+        "--concurrency", args.concurrency, "--requests", str(args.requests),
+    ]
+    completed = subprocess.run(command, stdout=subprocess.PIPE, text=True)
+    lines = [ln for ln in completed.stdout.splitlines() if ln.startswith("{")]
+    if completed.returncode != 0 or not lines:
+        return {"backend": backend, "error": f"exit code {completed.returncode}"}
+    return json.loads(lines[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", default="mock", help="Comma-separated GENERATOR_MODEL values (mock, litellm, huggingface, gemini).")
+    parser.add_argument("--concurrency", default=CONCURRENCY_LEVELS, help="Comma-separated concurrency levels.")
+    parser.add_argument("--requests", type=int, default=16, help="Requests per concurrency level (at least 2x the level).")
+    parser.add_argument("--out", default="reports/generator_backends.md", help="Where to write the markdown report.")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    levels = [int(c) for c in args.concurrency.split(",") if c.strip()]
+
+    if args.worker:
+        # Backend logs go to stderr; stdout carries only the result
+        stdout, sys.stdout = sys.stdout, sys.stderr
+        result = benchmark_backend(args.worker, levels, args.requests)
+        stdout.write(json.dumps(result) + "\n")
+        return
+
+    results = []
+    for backend in [b.strip() for b in args.backends.split(",") if b.strip()]:
+        print(f"Benchmarking backend: {backend}...")
+        results.append(run_in_subprocess(backend, args))
+
+    report = render_report(results)
+    os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+    with open(args.out, "w", encoding="utf-8") as f:
+        f.write(report)
+    print(report)
+    print(f"Report written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
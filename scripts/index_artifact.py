@@ -0,0 +1,59 @@
+"""Build or load a prebuilt index artifact, so new nodes skip re-embedding.
+
+Usage (from the project root):
+  python -m scripts.index_artifact build [--output-dir artifacts] [--compress]
+  python -m scripts.index_artifact load artifacts/index-<version>.tar [--force] [--no-verify]
+  python -m scripts.index_artifact inspect https://example.com/index-<version>.tar
+
+`build` packages the active index version (Chroma collections with their
+stored vectors, analytics table, user directory, embedding model identity
+and a sha256 per file) into one archive. `load` streams an archive from a
+path or URL into an empty chroma_db, verifying checksums, and activates it.
+`docker_entrypoint.sh` runs `load` when INDEX_ARTIFACT is set and chroma_db
+is empty.
+"""
+import argparse
+import json
+import sys
+
+from core.artifact import ARTIFACT_DIR, ArtifactError, build_artifact, load_artifact, read_manifest
+from core.versions import DB_PATH
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    build = commands.add_parser("build", help="Package the active index version.")
+    build.add_argument("--output-dir", default=ARTIFACT_DIR)
+    build.add_argument("--db-path", default=DB_PATH)
+    build.add_argument("--compress", action="store_true", help="gzip the archive (smaller, slower to load).")
+
+    load = commands.add_parser("load", help="Unpack an artifact into the index directory and activate it.")
+    load.add_argument("source", help="Archive path or http(s) URL.")
+    load.add_argument("--db-path", default=DB_PATH)
+    load.add_argument("--force", action="store_true", help="Replace a non-empty index directory.")
+    load.add_argument("--no-verify", action="store_true", help="Skip the per-file sha256 checks.")
+
+    inspect = commands.add_parser("inspect", help="Print an artifact's manifest.")
+    inspect.add_argument("source", help="Archive path or http(s) URL.")
+    inspect.add_argument("--files", action="store_true", help="Include the per-file checksums.")
+    args = parser.parse_args()
+
+    try:
+        if args.command == "build":
+            print(build_artifact(args.output_dir, args.db_path, compress=args.compress))
+        elif args.command == "load":
+            load_artifact(args.source, args.db_path, verify=not args.no_verify, force=args.force)
+        else:
+            manifest = read_manifest(args.source)
+            if not args.files:
+                manifest["files"] = len(manifest["files"])
+            print(json.dumps(manifest, indent=2))
+    except ArtifactError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""Per-worker memory of `uvicorn --workers N` vs the pre-fork server (serve.py).
+
+Usage (from the project root, Linux only):
+  python -m scripts.report_worker_memory --workers 4 --out reports/worker_memory.md
+
+Starts each server, waits until it answers, optionally sends some /ask
+requests, then reads /proc/<pid>/smaps_rollup for the master and every
+worker. RSS counts shared pages in every process that maps them, so the sum
+of RSS overstates real usage; PSS splits each shared page between its
+sharers, so the sum of PSS is what the node actually pays.
+"""
+import argparse
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+import urllib.request
+
+MODES = {
+    "uvicorn": lambda workers, port: [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port), "--workers", str(workers)],
+    "prefork": lambda workers, port: [sys.executable, "serve.py", "--host", "127.0.0.1", "--port", str(port), "--workers", str(workers)],
+}
+FIELDS = ("Rss", "Pss", "Shared_Clean", "Shared_Dirty", "Private_Clean", "Private_Dirty")
+SAMPLE_QUESTION = "What is Thiago Monteiro's phone number?"
+
+
+def descendants(pid: int) -> list[int]:
+    children = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # The command name may contain spaces; ppid follows the closing paren
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+    result, stack = [], [pid]
+    while stack:
+        for child in children.get(stack.pop(), []):
+            result.append(child)
+            stack.append(child)
+    return result
+
+
+def memory_kb(pid: int) -> dict:
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            key, _, rest = line.partition(":")
+            if key in FIELDS:
+                values[key] = int(rest.split()[0])
+    return values
+
+
+def command(pid: int) -> str:
+    with open(f"/proc/{pid}/cmdline", "rb") as f:
+        return f.read().replace(b"\0", b" ").decode(errors="replace").strip()
+
+
+def wait_ready(port: int, timeout_s: float) -> float:
+    started = time.monotonic()
+    while time.monotonic() - started < timeout_s:
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/openapi.json", timeout=2):
+                return time.monotonic() - started
+        except OSError:
+            time.sleep(1)
+    raise TimeoutError(f"Server on port {port} not ready after {timeout_s:.0f}s")
+
+
+def send_requests(port: int, count: int):
+    body = json.dumps({"question": SAMPLE_QUESTION}).encode()
+    for _ in range(count):
+        request = urllib.request.Request(
+            f"http://127.0.0.1:{port}/ask", data=body, headers={"Content-Type": "application/json"}
+        )
+        try:
+            urllib.request.urlopen(request, timeout=300).read()
+        except OSError as e:
+            print(f"Request failed: {e}", file=sys.stderr)
+
+
+def measure(mode: str, workers: int, port: int, requests: int, timeout_s: float) -> dict:
+    print(f"Starting {mode} with {workers} worker(s)...")
+    proc = subprocess.Popen(MODES[mode](workers, port), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        ready_s = wait_ready(port, timeout_s)
+        # Give every worker time to finish starting, not just the first to answer
+        time.sleep(3)
+        send_requests(port, requests)
+        processes = []
+        for pid in [proc.pid] + descendants(proc.pid):
+            try:
+                processes.append({"pid": pid, "cmd": command(pid), **memory_kb(pid)})
+            except OSError:
+                continue
+        return {"mode": mode, "workers": workers, "ready_s": round(ready_s, 1), "processes": processes}
+    finally:
+        proc.send_signal(signal.SIGTERM)
+        try:
+            proc.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+def render(results: list[dict], requests: int) -> str:
+    lines = [
+        "# Worker memory: uvicorn --workers vs pre-fork",
+        "",
+        f"Measured after startup and {requests} /ask request(s). Values in MiB.",
+        "",
+        "| Mode | Workers | Ready (s) | Processes | Sum RSS | Sum PSS | Shared | Private |",
+        "|---|---|---|---|---|---|---|---|",
+    ]
+    for r in results:
+        total = {k: sum(p.get(k, 0) for p in r["processes"]) / 1024 for k in FIELDS}
+        shared = total["Shared_Clean"] + total["Shared_Dirty"]
+        private = total["Private_Clean"] + total["Private_Dirty"]
+        lines.append(
+            f"| {r['mode']} | {r['workers']} | {r['ready_s']} | {len(r['processes'])} | "
+            f"{total['Rss']:.0f} | {total['Pss']:.0f} | {shared:.0f} | {private:.0f} |"
+        )
+    for r in results:
+        lines += ["", f"## {r['mode']}", "", "| PID | RSS | PSS | Private | Command |", "|---|---|---|---|---|"]
+        for p in r["processes"]:
+            private = (p.get("Private_Clean", 0) + p.get("Private_Dirty", 0)) / 1024
+            lines.append(f"| {p['pid']} | {p.get('Rss', 0) / 1024:.0f} | {p.get('Pss', 0) / 1024:.0f} | {private:.0f} | `{p['cmd'][:80]}` |")
+    return "\n".join(lines) + "\n"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--modes", default="uvicorn,prefork", help="Comma-separated: uvicorn, prefork.")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--requests", type=int, default=0, help="/ask requests sent before measuring.")
+    parser.add_argument("--timeout", type=float, default=600, help="Seconds to wait for a server to start.")
+    parser.add_argument("--out", default="reports/worker_memory.md")
+    args = parser.parse_args()
+
+    results = [
+        measure(mode.strip(), args.workers, args.port, args.requests, args.timeout)
+        for mode in args.modes.split(",") if mode.strip()
+    ]
+    report = render(results, args.requests)
+    os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+    with open(args.out, "w", encoding="utf-8") as f:
+        f.write(report)
+    print(report)
+    print(f"Report written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
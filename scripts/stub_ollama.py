@@ -0,0 +1,195 @@
+"""Stub Ollama server for testing the model lifecycle without a GPU or real models.
+
+Usage (from the project root):
+  python -m scripts.stub_ollama --port 11434 --models mistral --load-s 5 --default-keep-alive 30s
+
+Implements the parts of the Ollama REST API the app uses (/api/version,
+/api/tags, /api/show, /api/pull, /api/generate, /api/chat, /api/ps) with
+Ollama's residency rules: a model that is not loaded costs `--load-s` on its
+next request, stays loaded for the request's `keep_alive` (or
+`--default-keep-alive`), and is unloaded when that expires. Answers are
+canned; generation takes `--token-ms` per token. Point the app at it with
+OLLAMA_HOST=http://127.0.0.1:<port>.
+"""
+import argparse
+import json
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CANNED_ANSWER = "Answer: I do not have that information.\nEvidences:\n"
+_DURATION = re.compile(r"^(-?\d+(?:\.\d+)?)(ms|s|m|h)?$")
+_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600, None: 1}
+
+
+def parse_keep_alive(value, default_s: float) -> float:
+    """Seconds a model stays loaded: "30m", "10s", 300, "-1" (forever) or "0" (unload now)."""
+    if value is None or value == "":
+        return default_s
+    match = _DURATION.match(str(value).strip())
+    if not match:
+        return default_s
+    seconds = float(match.group(1)) * _UNITS[match.group(2)]
+    return float("inf") if seconds < 0 else seconds
+
+
+class StubOllama:
+    def __init__(self, models: list[str], load_s: float, pull_s: float, token_ms: float, default_keep_alive_s: float):
+        self.pulled = set(models)
+        self.loaded = {}  # model -> expiry (monotonic)
+        self.load_s = load_s
+        self.pull_s = pull_s
+        self.token_ms = token_ms
+        self.default_keep_alive_s = default_keep_alive_s
+        self.lock = threading.Lock()
+        self.loads = 0
+
+    @staticmethod
+    def canonical(name: str) -> str:
+        return name if ":" in name else f"{name}:latest"
+
+    def _expire(self):
+        now = time.monotonic()
+        for model, expiry in list(self.loaded.items()):
+            if expiry <= now:
+                del self.loaded[model]
+                print(f"[stub-ollama] unloaded {model} (keep_alive expired)")
+
+    def known(self, name: str) -> bool:
+        return self.canonical(name) in {self.canonical(m) for m in self.pulled}
+
+    def pull(self, name: str):
+        time.sleep(self.pull_s)
+        with self.lock:
+            self.pulled.add(self.canonical(name))
+
+    def run(self, name: str, keep_alive, tokens: int) -> tuple[int, int]:
+        """Loads the model if needed and 'generates'; returns (load ns, total ns)."""
+        model = self.canonical(name)
+        started = time.perf_counter()
+        with self.lock:
+            self._expire()
+            resident = model in self.loaded
+        load_ns = 0
+        if not resident:
+            time.sleep(self.load_s)
+            load_ns = int(self.load_s * 1e9)
+            self.loads += 1
+            print(f"[stub-ollama] loaded {model} ({self.load_s}s)")
+        time.sleep(tokens * self.token_ms / 1000)
+        with self.lock:
+            self.loaded[model] = time.monotonic() + parse_keep_alive(keep_alive, self.default_keep_alive_s)
+            self._expire()
+        return load_ns, int((time.perf_counter() - started) * 1e9)
+
+    def ps(self) -> list[dict]:
+        with self.lock:
+            self._expire()
+            now_mono, now = time.monotonic(), time.time()
+            return [
+                {
+                    "name": model,
+                    "model": model,
+                    "expires_at": datetime.fromtimestamp(
+                        now + min(expiry - now_mono, 10 * 365 * 86400), timezone.utc
+                    ).isoformat(),
+                }
+                for model, expiry in self.loaded.items()
+            ]
+
+
+def make_handler(stub: StubOllama):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def _send(self, status: int, body: dict):
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _body(self) -> dict:
+            length = int(self.headers.get("Content-Length") or 0)
+            return json.loads(self.rfile.read(length) or b"{}") if length else {}
+
+        def do_GET(self):
+            if self.path == "/api/version":
+                return self._send(200, {"version": "0.0.0-stub"})
+            if self.path == "/api/tags":
+                return self._send(200, {"models": [{"name": m, "model": m} for m in sorted(stub.pulled)]})
+            if self.path == "/api/ps":
+                return self._send(200, {"models": stub.ps()})
+            if self.path == "/":
+                return self._send(200, {"status": "Ollama is running"})
+            self._send(404, {"error": "not found"})
+
+        def do_POST(self):
+            body = self._body()
+            name = body.get("model") or body.get("name") or ""
+            if self.path == "/api/pull":
+                stub.pull(name)
+                return self._send(200, {"status": "success"})
+            if not stub.known(name):
+                return self._send(404, {"error": f"model '{name}' not found"})
+            if self.path == "/api/show":
+                return self._send(200, {"modelfile": "", "details": {"family": "stub"}})
+            if self.path in ("/api/generate", "/api/chat"):
+                empty = self.path == "/api/generate" and not body.get("prompt")
+                tokens = 0 if empty else min(int((body.get("options") or {}).get("num_predict") or 16), 16)
+                load_ns, total_ns = stub.run(name, body.get("keep_alive"), tokens)
+                result = {
+                    "model": stub.canonical(name),
+                    "created_at": datetime.now(timezone.utc).isoformat(),
+                    "done": True,
+                    "done_reason": "load" if empty else "stop",
+                    "load_duration": load_ns,
+                    "total_duration": total_ns,
+                    "prompt_eval_count": 1,
+                    "eval_count": tokens,
+                }
+                text = "" if empty else CANNED_ANSWER
+                if self.path == "/api/chat":
+                    result["message"] = {"role": "assistant", "content": text}
+                else:
+                    result["response"] = text
+                return self._send(200, result)
+            self._send(404, {"error": "not found"})
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--models", default="mistral,llama3.1:8b", help="Comma-separated models that are already pulled.")
+    parser.add_argument("--load-s", type=float, default=5.0, help="Seconds to load a model that is not resident.")
+    parser.add_argument("--pull-s", type=float, default=2.0, help="Seconds to pull a missing model.")
+    parser.add_argument("--token-ms", type=float, default=20.0, help="Milliseconds per generated token.")
+    parser.add_argument("--default-keep-alive", default="5m", help="Residency when a request sends no keep_alive.")
+    args = parser.parse_args()
+
+    stub = StubOllama(
+        [StubOllama.canonical(m.strip()) for m in args.models.split(",") if m.strip()],
+        load_s=args.load_s,
+        pull_s=args.pull_s,
+        token_ms=args.token_ms,
+        default_keep_alive_s=parse_keep_alive(args.default_keep_alive, 300.0),
+    )
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(stub))
+    print(f"[stub-ollama] listening on http://{args.host}:{args.port} with {sorted(stub.pulled)}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
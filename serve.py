@@ -0,0 +1,136 @@
+"""Pre-fork server: load the models once, then fork the uvicorn workers.
+
+Usage (from the project root):
+  python serve.py --workers 4 --port 8000
+
+`uvicorn --workers N` starts every worker as a fresh interpreter, so each one
+loads its own copy of the spaCy pipelines, the embedding model and any local
+generator. Here the master imports `main` (which loads all of them), freezes
+the GC so those objects' pages are never written to again, and then forks.
+The workers share the model memory copy-on-write. Each worker reconnects to
+Chroma (and the SQLite caches) after the fork and serves one shared listening
+socket. The master restarts workers that die and forwards SIGINT/SIGTERM.
+"""
+import argparse
+import gc
+import os
+import signal
+import socket
+import sys
+import time
+
+# --- Constants ---
+SERVE_HOST = os.getenv("SERVE_HOST", "0.0.0.0")
+SERVE_PORT = int(os.getenv("SERVE_PORT", "8000"))
+SERVE_WORKERS = int(os.getenv("SERVE_WORKERS", str(os.cpu_count() or 1)))
+# Torch / ONNX threads per worker; 0 = cores divided evenly between workers
+SERVE_THREADS_PER_WORKER = int(os.getenv("SERVE_THREADS_PER_WORKER", "0"))
+# Workers that die faster than this after starting are restarted with a delay
+RESTART_BACKOFF_S = 1.0
+
+
+def preload():
+    """Imports the app in the master; every model it needs is loaded here, once."""
+    # Tokenizer thread pools cannot be carried across fork()
+    os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+    import main
+    # Move everything allocated so far out of the GC's reach: a collection in a
+    # worker would otherwise touch (and so copy) every shared object's page
+    gc.collect()
+    gc.freeze()
+    print(f"Master {os.getpid()}: preloaded app, {gc.get_freeze_count()} objects frozen.")
+    return main.app
+
+
+def bind_socket(host: str, port: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(app, sock: socket.socket, threads: int, log_level: str):
+    """Body of a forked worker: fresh connections, own signal handling, then uvicorn."""
+    import uvicorn
+    from core import db
+
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    if "torch" in sys.modules:
+        sys.modules["torch"].set_num_threads(threads)
+    db.connect()
+
+    config = uvicorn.Config(app, log_level=log_level, lifespan="on")
+    server = uvicorn.Server(config)
+    print(f"Worker {os.getpid()}: serving on {sock.getsockname()[:2]} with {threads} thread(s).")
+    server.run(sockets=[sock])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default=SERVE_HOST)
+    parser.add_argument("--port", type=int, default=SERVE_PORT)
+    parser.add_argument("--workers", type=int, default=SERVE_WORKERS)
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args()
+
+    workers = max(1, args.workers)
+    threads = SERVE_THREADS_PER_WORKER or max(1, (os.cpu_count() or 1) // workers)
+    # Read by the ONNX embedding session, which is re-opened in each worker
+    os.environ.setdefault("ONNX_NUM_THREADS", str(threads))
+
+    app = preload()
+    sock = bind_socket(args.host, args.port)
+    children = {}
+    stopping = False
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                run_worker(app, sock, threads, args.log_level)
+            except BaseException as e:
+                print(f"Worker {os.getpid()} crashed: {e}", file=sys.stderr)
+                code = 1
+            finally:
+                sys.stdout.flush()
+                os._exit(code)
+        children[pid] = time.monotonic()
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    for _ in range(workers):
+        spawn()
+    print(f"Master {os.getpid()}: started {workers} worker(s) on {args.host}:{args.port}.")
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        started = children.pop(pid, None)
+        if started is None or stopping:
+            continue
+        print(f"Worker {pid} exited with status {os.waitstatus_to_exitcode(status)}; restarting.")
+        if time.monotonic() - started < RESTART_BACKOFF_S:
+            time.sleep(RESTART_BACKOFF_S)
+        spawn()
+    sock.close()
+    print(f"Master {os.getpid()}: all workers stopped.")
+
+
+if __name__ == "__main__":
+    main()
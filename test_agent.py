@@ -17,6 +17,7 @@ import uuid
 try:
     # Import the compiled StateGraph 'app' from agent
     from agent import app
+    from generators.lifecycle import OLLAMA_LIFECYCLE, ollama_lifecycle
 except ImportError as e:
     print("Failed to import 'app.agent.app':", e)
     print("Please make sure you are running this from the root 'aurora_qa' directory.")
@@ -75,4 +76,7 @@ if __name__ == "__main__":
         # q = "What does system_messages tool do?"
         # q = "What is Vikram Desai's seat preference for concerts?"
 
+    # Pull (if needed) and load the agent's models before the first question
+    if OLLAMA_LIFECYCLE:
+        ollama_lifecycle.prepare_registered()
     run_question(q)
\ No newline at end of file
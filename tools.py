@@ -1,33 +1,22 @@
 import os
 import json
-import spacy
-from fuzzywuzzy import process, fuzz
 from langchain_core.tools import tool
+from langchain_core.runnables import RunnableConfig
 from pydantic.v1 import BaseModel, Field # Use Pydantic v1 for LangChain tool compatibility
 from typing import List
 
-# Import the retriever we built in db.py
-from core.db import retriever
+# Retrieval goes through core.db functions, which always use the live index version
+from core.db import is_ready, message_count, retrieve_user_messages, search_user_messages, RECENCY_K
+from core.timeutils import wants_recent
+from core.rerank import candidate_k, rerank
+from core.session import sessions
+from core.analytics import CATEGORIES, get_analytics
+from core.scheduler import retrieval_slot
+# One shared, slimmed spaCy pipeline (core/nlp.py) instead of a second full copy
+from core.nlp import nlp, KNOWN_USER_NAMES, extract_user_name, find_names
 
 # --- Tool 1: The "Smart Name" Finder (spaCy + Fuzz) ---
 
-# --- Load Models at Startup ---
-try:
-    nlp = spacy.load("en_core_web_sm")
-    print("spaCy NER model loaded successfully.")
-except IOError:
-    print("FATAL: spaCy model 'en_core_web_sm' not found.")
-    print("Please run: python -m spacy download en_core_web_sm")
-    nlp = None
-
-# This is the "ground truth" list of correct names
-KNOWN_USER_NAMES = [
-    'Thiago Monteiro', 'Armand Dupont', "Lily O'Sullivan",
-    'Fatima El-Tahir', 'Sophia Al-Farsi', 'Layla Kawaguchi',
-    'Amina Van Den Berg', 'Lorenzo Cavalli', 'Vikram Desai',
-    'Hans Müller'
-]
-
 class FindUserNamesInput(BaseModel):
     question: str = Field(description="The user's question mentioning a person")
 
@@ -38,34 +27,7 @@ def find_user_names(question: str) -> List[str]:
     Use this first to identify *who* the user is asking about.
     Handles typos like 'Amona' or 'Vikrem'.
     """
-    if nlp is None:
-        return "Error: spaCy NER model not loaded."
-
-    doc = nlp(question)
-    
-    # Stage 1: Get all potential names (PERSON, ORG, PROPN)
-    entity_names = [ent.text for ent in doc.ents if ent.label_ in ("PERSON", "ORG")]
-    proper_nouns = [token.text for token in doc if token.pos_ == "PROPN"]
-    potential_names = []
-    if not entity_names and not proper_nouns:
-        potential_names = question.lower().replace("?", "").split()
-    names_list = set(entity_names + proper_nouns + potential_names)
-    
-    # Stage 2: Find the best fuzzy match
-    users_in_question = []
-    for name in names_list:
-        possible_names_with_confidence = process.extractBests(
-            name,
-            KNOWN_USER_NAMES,
-            score_cutoff=70,
-            limit=5
-        )
-        users_in_question.extend(
-            [name for name, _ in possible_names_with_confidence]
-        )
-    if users_in_question:
-        return list(set(users_in_question))
-    return "Error: No user name found in question."
+    return extract_user_name(question)
 
 
 # --- Tool 2: The "RAG" Message Search ---
@@ -73,31 +35,42 @@ def find_user_names(question: str) -> List[str]:
 class RAGSearch(BaseModel):
     user_names: List[str] = Field(description="The full, correct user_name (e.g., 'Vikram Desai').")
     query: str = Field(description="The semantic search query (e.g., 'concert package' or 'seat preference').")
+    start_date: str = Field(default="", description="Optional earliest date (YYYY, YYYY-MM or YYYY-MM-DD).")
+    end_date: str = Field(default="", description="Optional latest date (YYYY, YYYY-MM or YYYY-MM-DD).")
+    prefer_recent: bool = Field(default=False, description="Rank newer messages first, for 'latest' / 'current' questions.")
 
 @tool(args_schema=RAGSearch)
-def search_messages(user_names: List[str], query: str) -> List[str]:
+def search_messages(user_names: List[str], query: str, start_date: str = "", end_date: str = "", prefer_recent: bool = False) -> List[str]:
     """
     Searches the message database for messages from a specific user
-    that are semantically related to a query.
+    that are semantically related to a query, optionally within a date
+    range and with newer messages ranked first.
     """
-    if retriever is None:
+    if not is_ready():
         return ["Error: Retriever not initialized."]
 
-    print(f"--- Tool: search_messages(user_names='{user_names}', query='{query}') ---")
+    print(f"--- Tool: search_messages(user_names='{user_names}', query='{query}', start='{start_date}', end='{end_date}', recent={prefer_recent}) ---")
 
     # This is the 10x step: we filter the RAG search by the *user_names*
-    # This is a "Metadata Filter"
+    # This is a "Metadata Filter" (plus an optional timestamp range)
     rag_result = []
-    for user_name in user_names:
-        filtered_retriever = retriever.vectorstore.as_retriever(
-            search_kwargs={
-                "k": 10,
-                "filter": {"user_name": user_name}
-            }
-        )
-        # Run the RAG search
-        results = filtered_retriever.invoke(query)
-        rag_result.extend([doc.page_content for doc in results])
+    # Queued with the rest of the retrieval traffic (core/scheduler.py)
+    with retrieval_slot():
+        try:
+            for user_name in user_names:
+                rag_result.extend(search_user_messages(
+                    user_name,
+                    query,
+                    k=RECENCY_K if prefer_recent else candidate_k(10),
+                    start_date=start_date or None,
+                    end_date=end_date or None,
+                    prefer_recent=prefer_recent,
+                ))
+        except ValueError as e:
+            return [f"Error: {e}"]
+        if not prefer_recent:
+            # Optional cross-encoder stage: keep only the best few per user
+            rag_result = rerank(query, rag_result)
 
     # Return a clean list of message strings
     return rag_result
@@ -130,11 +103,11 @@ def get_system_stats() -> dict:
     Returns system statistics like number of users and messages.
     Use this for "meta" questions like "How many users are there?".
     """
-    if retriever is None:
+    if not is_ready():
         return {"error": "Retriever not initialized."}
 
     num_users = len(KNOWN_USER_NAMES)
-    num_messages = retriever.vectorstore._collection.count()  # Accessing private member for demo purposes
+    num_messages = message_count()
 
     stats = {
         "number_of_users": num_users,
@@ -147,7 +120,7 @@ class GetUserRAG(BaseModel):
     question: str = Field(description="The original user question needing message search.")
 
 @tool(args_schema=GetUserRAG)
-def get_user_messages(question: str) -> List[str]:
+def get_user_messages(question: str, config: RunnableConfig = None) -> List[str]:
     """
     Search messages related to the `question` for matching user(s) and return
     a list of message strings (RAG results). This tool performs name
@@ -160,46 +133,75 @@ def get_user_messages(question: str) -> List[str]:
     if nlp is None:
         return ["Error: spaCy NER model not loaded."]
 
-    doc = nlp(question)
-    
-    # Stage 1: Get all potential names (PERSON, ORG, PROPN)
-    entity_names = [ent.text for ent in doc.ents if ent.label_ in ("PERSON", "ORG")]
-    proper_nouns = [token.text for token in doc if token.pos_ == "PROPN"]
-    potential_names = []
-    if not entity_names and not proper_nouns:
-        potential_names = question.lower().replace("?", "").split()
-    names_list = set(entity_names + proper_nouns + potential_names)
-    
-    # Stage 2: Find the best fuzzy match
-    users_in_question = []
-    for name in names_list:
-        possible_names_with_confidence = process.extractBests(
-            name,
-            KNOWN_USER_NAMES,
-            score_cutoff=70,
-            limit=5
-        )
-        users_in_question.extend(
-            [name for name, _ in possible_names_with_confidence]
-        )
+    # Cached: the agent's router node already extracted names from this question
+    users_in_question = find_names(question)
+    # Within an agent thread, follow-ups reuse the users and candidates found earlier
+    thread_id = ((config or {}).get("configurable") or {}).get("thread_id")
+    session = sessions.get(f"agent:{thread_id}") if thread_id else None
+    if session is not None:
+        users_in_question = session.resolve_users(list(set(users_in_question)))
     if not users_in_question:
         return "Error: No user name found in question."
     user_names = list(set(users_in_question))
+    with retrieval_slot():
+        return _user_messages(user_names, question, session)
+
+def _user_messages(user_names: List[str], question: str, session=None) -> List[str]:
+    # "Latest ..." questions: newest relevant messages first, fewer of them
+    # (the session cache ranks by similarity only, so it is bypassed)
+    if wants_recent(question):
+        rag_result = []
+        for user_name in user_names:
+            rag_result.extend(search_user_messages(user_name, question, k=RECENCY_K, prefer_recent=True))
+        return rag_result
+    if session is not None:
+        return rerank(question, session.retrieve(user_names, question, k=candidate_k(10)))
 
     rag_result = []
     for user_name in user_names:
-        filtered_retriever = retriever.vectorstore.as_retriever(
-            search_kwargs={
-                "k": 10,
-                "filter": {"user_name": user_name}
-            }
-        )
-        # Run the RAG search
-        results = filtered_retriever.invoke(question)
-        rag_result.extend([doc.page_content for doc in results])
+        # Run the RAG search (messages, or conversation chunks expanded to messages)
+        rag_result.extend(retrieve_user_messages(user_name, question, k=candidate_k(10)))
+    rag_result = rerank(question, rag_result)
 
     # Return a clean list of message strings
     return rag_result
 
+# --- Tool 3: Counts and timelines over every message ---
+
+class MessageStatsInput(BaseModel):
+    user_names: List[str] = Field(default_factory=list, description="Full user names to restrict to (empty for all users).")
+    keyword: str = Field(default="", description="Word the messages must mention (e.g. 'trip', 'opera'). Plurals match too.")
+    category: str = Field(default="", description=f"Optional message category: one of {', '.join(CATEGORIES)}.")
+    start_date: str = Field(default="", description="Optional earliest date (YYYY, YYYY-MM or YYYY-MM-DD, e.g. '2025-03-01').")
+    end_date: str = Field(default="", description="Optional latest date, inclusive (YYYY, YYYY-MM or YYYY-MM-DD, e.g. '2025-03-31').")
+    group_by: str = Field(default="", description="Optional breakdown: 'user', 'month' or 'category'.")
+
+@tool(args_schema=MessageStatsInput)
+def query_message_stats(user_names: List[str] = None, keyword: str = "", category: str = "", start_date: str = "", end_date: str = "", group_by: str = "") -> dict:
+    """
+    Counts ALL matching messages (not just the top search results) and returns
+    the count, first/last timestamps, an optional breakdown and the newest
+    matching messages as evidence. Use this for "how many", "how often",
+    "when did ... first/last ..." questions.
+    """
+    analytics = get_analytics()
+    if analytics is None:
+        return {"error": "Analytics table not built. Run ingest_data.py."}
+    if category and category not in CATEGORIES:
+        return {"error": f"Unknown category '{category}'. Use one of {', '.join(CATEGORIES)}."}
+    print(f"--- Tool: query_message_stats(user_names={user_names}, keyword='{keyword}', category='{category}') ---")
+    try:
+        with retrieval_slot():
+            return analytics.query(
+                user_names=user_names or None,
+                keyword=keyword or None,
+                category=category or None,
+                start=start_date or None,
+                end=end_date or None,
+                group_by=group_by or None,
+            )
+    except ValueError as e:
+        return {"error": f"Invalid filter: {e}"}
+
 # --- This list is exported to the agent ---
-all_tools = [get_user_messages, get_system_stats]
\ No newline at end of file
+all_tools = [get_user_messages, search_messages, get_system_stats, query_message_stats]
\ No newline at end of file